@@ -47,12 +47,23 @@ def main():
         if st.button("Ir a Datos Filtrados", key="filtrados", use_container_width=True):
             st.switch_page("pages/2_Datos_filtrados.py")
 
-    st.markdown("""
-    **Predicciones de Temperatura Media**  
-    Accede a predicciones de temperatura media basadas en modelos o datos históricos.  
-    """)
-    if st.button("Ir a Predicciones", key="predicciones", use_container_width=True):
-        st.switch_page("pages/3_Predicciones.py")
+    col3, col4 = st.columns(2)
+
+    with col3:
+        st.markdown("""
+        **Comparador de Periodos**  
+        Compara dos periodos cualesquiera día a día, alineados por día del año, por provincia y métrica.  
+        """)
+        if st.button("Ir al Comparador", key="comparador", use_container_width=True):
+            st.switch_page("pages/3_Comparador.py")
+
+    with col4:
+        st.markdown("""
+        **Predicciones de Temperatura Media**  
+        Accede a predicciones de temperatura media basadas en modelos o datos históricos.  
+        """)
+        if st.button("Ir a Predicciones", key="predicciones", use_container_width=True):
+            st.switch_page("pages/4_Modelos.py")
 
     st.divider()
     
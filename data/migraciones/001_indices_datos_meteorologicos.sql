@@ -0,0 +1,19 @@
+-- 001: índices para los accesos del dashboard sobre datos_meteorologicos.
+-- InnoDB no tiene INCLUDE: el índice es "cubriente" porque lleva las métricas
+-- como columnas finales y la consulta no necesita volver a la fila.
+
+-- Agregados filtrados por provincia y rango de fechas (ConsultaMeteorologica con
+-- fuente 'detalle' y filtro de provincias)
+CREATE INDEX idx_dm_prov_fecha
+    ON datos_meteorologicos (codigo_prov, fecha, altitud, tmed, tmin, tmax, prec, racha, hrMedia);
+
+-- Agregados por rango de fechas de todas las provincias: la clave primaria
+-- (fecha, indicativo) ya ordena por fecha, pero obliga a leer la fila entera
+CREATE INDEX idx_dm_fecha_prov
+    ON datos_meteorologicos (fecha, codigo_prov, altitud, tmed, tmin, tmax, prec, racha, hrMedia);
+
+-- Fechas tocadas por una descarga (src/resumenes.py)
+CREATE INDEX idx_dm_descarga ON datos_meteorologicos (id_descarga, fecha);
+
+-- Última descarga cargada (versión de la caché de consultas)
+CREATE INDEX idx_dm_timestamp ON datos_meteorologicos (timestamp_extraccion, id_descarga);
@@ -0,0 +1,15 @@
+-- 002 (opcional): particionado por año de fecha.
+-- MySQL no admite claves foráneas en tablas particionadas, así que se elimina la
+-- de codigo_prov. La clave primaria (fecha, indicativo) ya incluye la columna de
+-- particionado. Solo se aplica con: python -m src.migrar --particiones
+
+ALTER TABLE datos_meteorologicos DROP FOREIGN KEY datos_meteorologicos_ibfk_1;
+
+ALTER TABLE datos_meteorologicos
+PARTITION BY RANGE (YEAR(fecha)) (
+    PARTITION p2023 VALUES LESS THAN (2024),
+    PARTITION p2024 VALUES LESS THAN (2025),
+    PARTITION p2025 VALUES LESS THAN (2026),
+    PARTITION p2026 VALUES LESS THAN (2027),
+    PARTITION pfuturo VALUES LESS THAN MAXVALUE
+);
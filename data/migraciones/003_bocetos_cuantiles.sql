@@ -0,0 +1,14 @@
+-- 003: bocetos KLL de cuantiles por provincia y mes (ver src/cuantiles.py).
+-- Se pueden fusionar: los cuartiles de cualquier rango de meses y provincias salen
+-- de unir sus filas, sin leer datos_meteorologicos. Los mantiene src/popular.py.
+
+CREATE TABLE IF NOT EXISTS bocetos_cuantiles (
+    columna VARCHAR(16) NOT NULL, -- Columna de datos_meteorologicos (tmed, ...)
+    mes DATE NOT NULL, -- Primer día del mes
+    codigo_prov TINYINT UNSIGNED NOT NULL, -- FK a provincias
+    k SMALLINT UNSIGNED NOT NULL, -- Tamaño del boceto (fija el error)
+    n INT UNSIGNED NOT NULL, -- Valores resumidos
+    boceto BLOB NOT NULL,
+    PRIMARY KEY (columna, mes, codigo_prov),
+    FOREIGN KEY (codigo_prov) REFERENCES provincias(codigo_prov)
+);
@@ -0,0 +1,19 @@
+-- 004: olas de calor y de frío por estación (ver src/eventos.py).
+-- Una fila por racha de días seguidos con tmax por encima de su percentil 95 (calor) o
+-- tmin por debajo de su percentil 5 (frío). La mantiene src/popular.py.
+
+CREATE TABLE IF NOT EXISTS eventos_extremos (
+    tipo VARCHAR(8) NOT NULL, -- 'calor' o 'frio'
+    indicativo VARCHAR(10) NOT NULL, -- Estación
+    inicio DATE NOT NULL,
+    fin DATE NOT NULL, -- Último día de la racha (incluido)
+    codigo_prov TINYINT UNSIGNED NOT NULL, -- FK a provincias
+    dias SMALLINT UNSIGNED NOT NULL,
+    pico DECIMAL(4,1) NOT NULL, -- tmax más alta (calor) o tmin más baja (frío)
+    fecha_pico DATE NOT NULL,
+    exceso_medio FLOAT NOT NULL, -- Media de |valor − umbral| en la racha (ºC)
+    PRIMARY KEY (tipo, indicativo, inicio),
+    INDEX idx_eventos_tipo_inicio (tipo, inicio, codigo_prov), -- Eventos de un rango de fechas, por provincia
+    INDEX idx_eventos_tipo_fin (tipo, fin), -- Eventos que siguen abiertos al añadir días
+    FOREIGN KEY (codigo_prov) REFERENCES provincias(codigo_prov)
+);
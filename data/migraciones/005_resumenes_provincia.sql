@@ -0,0 +1,31 @@
+-- 005: resúmenes por provincia y día / provincia y mes (ver src/resumenes.py).
+-- Guardan sumas y conteos (no medias) para que la media de cualquier rango sea exacta:
+-- AVG = SUM(suma_x) / SUM(n_x). Los mantiene src/resumenes.py en cada carga.
+
+CREATE TABLE IF NOT EXISTS resumen_diario_provincia (
+    fecha DATE NOT NULL,
+    codigo_prov TINYINT UNSIGNED NOT NULL, -- FK a provincias
+    suma_altitud DOUBLE, n_altitud INT UNSIGNED NOT NULL DEFAULT 0,
+    suma_tmed DOUBLE, n_tmed INT UNSIGNED NOT NULL DEFAULT 0,
+    suma_tmin DOUBLE, n_tmin INT UNSIGNED NOT NULL DEFAULT 0,
+    suma_tmax DOUBLE, n_tmax INT UNSIGNED NOT NULL DEFAULT 0,
+    suma_prec DOUBLE, n_prec INT UNSIGNED NOT NULL DEFAULT 0,
+    suma_racha DOUBLE, n_racha INT UNSIGNED NOT NULL DEFAULT 0,
+    suma_hrMedia DOUBLE, n_hrMedia INT UNSIGNED NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, codigo_prov),
+    FOREIGN KEY (codigo_prov) REFERENCES provincias(codigo_prov)
+);
+
+CREATE TABLE IF NOT EXISTS resumen_mensual_provincia (
+    mes DATE NOT NULL, -- Primer día del mes
+    codigo_prov TINYINT UNSIGNED NOT NULL, -- FK a provincias
+    suma_altitud DOUBLE, n_altitud INT UNSIGNED NOT NULL DEFAULT 0,
+    suma_tmed DOUBLE, n_tmed INT UNSIGNED NOT NULL DEFAULT 0,
+    suma_tmin DOUBLE, n_tmin INT UNSIGNED NOT NULL DEFAULT 0,
+    suma_tmax DOUBLE, n_tmax INT UNSIGNED NOT NULL DEFAULT 0,
+    suma_prec DOUBLE, n_prec INT UNSIGNED NOT NULL DEFAULT 0,
+    suma_racha DOUBLE, n_racha INT UNSIGNED NOT NULL DEFAULT 0,
+    suma_hrMedia DOUBLE, n_hrMedia INT UNSIGNED NOT NULL DEFAULT 0,
+    PRIMARY KEY (mes, codigo_prov),
+    FOREIGN KEY (codigo_prov) REFERENCES provincias(codigo_prov)
+);
@@ -3,7 +3,10 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.gridspec import GridSpec
-from src.extraer_datos import ejecutar_consulta_a_dataframe
+from datetime import date
+from src import comparador, cubo, cuantiles, estadisticas, eventos
+from src.coroplet import dibujar_coropletico_png
+from src.extraer_datos import ejecutar_consulta_a_dataframe, leer_tabla
 from src.personalizacion import load_css
 
 st.set_page_config(
@@ -23,53 +26,39 @@ def mapear_meses(meses_con_datos):
     return meses_con_datos
 
 
-def analyze_temperature_data(df):
+def analyze_temperature_data(resumen_tmed):
     """
     Realizar análisis de temperatura con detección de outliers y crear visualizaciones.
-    """
 
-    #Parse feche a datetime
-    if 'fecha' not in df.columns or 'tmed' not in df.columns:
-        st.error("Los datos deben contener las columnas 'fecha' y 'tmed'")
-        return None, None
-    
-    if not pd.api.types.is_datetime64_any_dtype(df['fecha']):
-        df['fecha'] = pd.to_datetime(df['fecha'])
-    
-    if 'provincia' in df.columns:
-        df['provincia'] = df['provincia'].str.strip().str.title()
-    
-    datos = df['tmed'].dropna()
-    
-    if len(datos) == 0:
+    Recibe el ResumenEstadistico de tmed (ver src.estadisticas), no las filas diarias:
+    cuantiles, cajas, límites de Tukey e histograma ya vienen calculados.
+    """
+    if resumen_tmed is None or resumen_tmed.diario.empty:
         st.error("No hay datos válidos de temperatura media")
-        return None, None
-    
+        return None
+
     # Detección outliers utilizando Tukey
-    q1 = datos.quantile(0.25)
-    q3 = datos.quantile(0.75)
-    iqr = q3 - q1
-    limite_bajo = q1 - 1.5 * iqr
-    limite_alto = q3 + 1.5 * iqr
-    
-    normales = datos[(datos >= limite_bajo) & (datos <= limite_alto)]
-    atipicos = datos[(datos < limite_bajo) | (datos > limite_alto)]
-    
-    puntos = np.linspace(datos.min(), datos.max(), 30)
-    
-# COMPARADOR DE TEMPERATURAS PARA ESPAÑA (2023 vs 2024)
+    limite_bajo = resumen_tmed.total['limite_bajo']
+    limite_alto = resumen_tmed.total['limite_alto']
+
+    frecuencia = resumen_tmed.histograma
+    valores = frecuencia.index.to_numpy()
+    normales = (valores >= limite_bajo) & (valores <= limite_alto)
+
+    puntos = np.linspace(valores.min(), valores.max(), 30)
+
+# COMPARADOR DE TEMPERATURAS PARA ESPAÑA (los dos últimos años con datos)
     # Calculamos para cada fecha: media, mediana, mínimo y máximo de tmed
     estad = (
-        df
-        .groupby('fecha')['tmed']
-        .agg(['mean', 'median', 'min', 'max'])
+        resumen_tmed.diario[['mean', '50%', 'min', 'max']]
+        .rename(columns={'50%': 'median'})
         .reset_index()
     )
-    
-    # Separamos en 2023 y en 2024
-    estad_2023 = estad[estad['fecha'].dt.year == 2023]
-    estad_2024 = estad[estad['fecha'].dt.year == 2024]
-    
+
+    # Separamos los dos últimos años con datos
+    años = list(resumen_tmed.anual.index)[-2:]
+    estad_años = [estad[estad['fecha'].dt.year == año] for año in años]
+
     # Crear figura con 4 subplots (2 filas, 2 columnas) + comparación temporal
     fig = plt.figure(figsize=(16, 14))
     gs = GridSpec(3, 2, height_ratios=[1, 1.2, 1.5])
@@ -78,21 +67,22 @@ def analyze_temperature_data(df):
     ax_histo = fig.add_subplot(gs[0, 0])
     ax_caja = fig.add_subplot(gs[0, 1])
     
-    # Histograma
-    ax_histo.hist(normales, bins=puntos, alpha=0.7, label='Días normales (Tukey)', color='skyblue')
-    ax_histo.hist(atipicos, bins=puntos, alpha=0.7, label='Días atípicos (Tukey)', color='orange')
+    # Histograma (cada valor distinto pesa tantas filas como tiene)
+    ax_histo.hist(valores[normales], bins=puntos, weights=frecuencia.to_numpy()[normales],
+                  alpha=0.7, label='Días normales (Tukey)', color='skyblue')
+    ax_histo.hist(valores[~normales], bins=puntos, weights=frecuencia.to_numpy()[~normales],
+                  alpha=0.7, label='Días atípicos (Tukey)', color='orange')
     ax_histo.set_title('Histograma de Temperatura Media')
     ax_histo.set_xlabel('Temperatura media (°C)')
     ax_histo.set_ylabel('Cantidad de días')
     ax_histo.legend()
     
     # Boxplot general
-    ax_caja.boxplot(
-        datos,
-        vert=True,
+    ax_caja.bxp(
+        [resumen_tmed.caja_total],
         showfliers=True,
         patch_artist=True,
-        boxprops=dict(facecolor='skyblue', color='black'),
+        boxprops=dict(facecolor='skyblue', edgecolor='black'),
         flierprops=dict(marker='o', markerfacecolor='orange', markersize=5, alpha=0.7)
     )
     ax_caja.set_title('Boxplot General de Temperatura Media')
@@ -101,19 +91,15 @@ def analyze_temperature_data(df):
     # Boxplot mensual
     ax_mensual = fig.add_subplot(gs[1, :])
     
-    # Agregar columna de mes
-    df['mes'] = df['fecha'].dt.month
-    valores_por_mes = [df[df['mes'] == m]['tmed'].dropna() for m in range(1, 13)]
-    medias_por_mes = [mes.mean() if not mes.empty else np.nan for mes in valores_por_mes]
+    # Cajas por mes, sumando todos los años
+    meses_con_datos = mapear_meses([caja['label'] for caja in resumen_tmed.cajas_mes])
+    cajas_mensuales = [
+        {**caja, 'label': nombre_mes} for caja, nombre_mes in zip(resumen_tmed.cajas_mes, meses_con_datos)
+    ]
+    medias_filtradas = [caja['mean'] for caja in cajas_mensuales]
     
-    meses_con_datos = [i for i, valores in enumerate(valores_por_mes, 1) if not valores.empty]
-    valores_filtrados = [valores for valores in valores_por_mes if not valores.empty]
-    medias_filtradas = [media for media in medias_por_mes if not np.isnan(media)]
-    
-    meses_con_datos = mapear_meses(meses_con_datos)
-    
-    if valores_filtrados:
-        ax_mensual.boxplot(valores_filtrados, tick_labels=meses_con_datos, showfliers=True)
+    if cajas_mensuales:
+        ax_mensual.bxp(cajas_mensuales, showfliers=True)
         ax_mensual.plot(
             range(1, len(medias_filtradas) + 1), medias_filtradas,
             marker='o', linestyle='-', color='red', label='Media mensual'
@@ -123,70 +109,47 @@ def analyze_temperature_data(df):
         ax_mensual.set_ylabel('Temperatura media (°C)')
         ax_mensual.legend()
     
-    # Comparación temporal 2023 vs 2024
-    if len(estad_2023) > 0 and len(estad_2024) > 0:
-        # Subplot para 2023
-        ax_2023 = fig.add_subplot(gs[2, 0])
-        ax_2023.plot(estad_2023['fecha'], estad_2023['mean'], color='orange', label='Media 2023', linewidth=2)
-        ax_2023.plot(estad_2023['fecha'], estad_2023['median'], color='orange', linestyle='--', label='Mediana 2023')
-        ax_2023.fill_between(
-            estad_2023['fecha'],
-            estad_2023['min'],
-            estad_2023['max'],
-            color='orange', alpha=0.1,
-            label='Rango 2023 (min-max)'
-        )
-        ax_2023.set_title('España: Temperaturas Diarias 2023', fontsize=12)
-        ax_2023.set_ylabel('Temperatura (°C)')
-        ax_2023.legend(fontsize=9)
-        ax_2023.tick_params(axis='x', rotation=45)
-        
-        # Subplot para 2024
-        ax_2024 = fig.add_subplot(gs[2, 1])
-        ax_2024.plot(estad_2024['fecha'], estad_2024['mean'], color='blue', label='Media 2024', linewidth=2)
-        ax_2024.plot(estad_2024['fecha'], estad_2024['median'], color='blue', linestyle='--', label='Mediana 2024')
-        ax_2024.fill_between(
-            estad_2024['fecha'],
-            estad_2024['min'],
-            estad_2024['max'],
-            color='blue', alpha=0.1,
-            label='Rango 2024 (min-max)'
-        )
-        ax_2024.set_title('España: Temperaturas Diarias 2024', fontsize=12)
-        ax_2024.set_ylabel('Temperatura (°C)')
-        ax_2024.set_xlabel('Fecha')
-        ax_2024.legend(fontsize=9)
-        ax_2024.tick_params(axis='x', rotation=45)
-        
+    # Comparación temporal de los dos últimos años
+    if len(años) == 2 and all(len(estad_año) > 0 for estad_año in estad_años):
+        ejes = []
+        for i, (año, estad_año, color) in enumerate(zip(años, estad_años, ['orange', 'blue'])):
+            ax = fig.add_subplot(gs[2, i])
+            ax.plot(estad_año['fecha'], estad_año['mean'], color=color, label=f'Media {año}', linewidth=2)
+            ax.plot(estad_año['fecha'], estad_año['median'], color=color, linestyle='--', label=f'Mediana {año}')
+            ax.fill_between(
+                estad_año['fecha'],
+                estad_año['min'],
+                estad_año['max'],
+                color=color, alpha=0.1,
+                label=f'Rango {año} (min-max)'
+            )
+            ax.set_title(f'España: Temperaturas Diarias {año}', fontsize=12)
+            ax.set_ylabel('Temperatura (°C)')
+            ax.legend(fontsize=9)
+            ax.tick_params(axis='x', rotation=45)
+            ejes.append(ax)
+        ejes[-1].set_xlabel('Fecha')
+
         # Sincronizar escalas Y para mejor comparación
-        y_min = min(estad_2023['min'].min(), estad_2024['min'].min()) - 2
-        y_max = max(estad_2023['max'].max(), estad_2024['max'].max()) + 2
-        ax_2023.set_ylim(y_min, y_max)
-        ax_2024.set_ylim(y_min, y_max)
+        y_min = min(estad_año['min'].min() for estad_año in estad_años) - 2
+        y_max = max(estad_año['max'].max() for estad_año in estad_años) + 2
+        for ax in ejes:
+            ax.set_ylim(y_min, y_max)
 
     plt.tight_layout()
     
-    return fig, df
+    return fig
 
-def calculate_statistics(df):
+def calculate_statistics(resumen_tmed):
     """
-    Calcular estadísticas descriptivas para año y mes
+    Calcular estadísticas descriptivas para año y mes a partir del ResumenEstadistico
     """
-    # Agregar columna años
-    df['año'] = df['fecha'].dt.year
-    
-    años = sorted(df['año'].unique())
-    
-    stats_dict = {}
-    for año in años:
-        year_data = df[df['año'] == año]['tmed'].describe()
-        stats_dict[str(año)] = year_data
+    años = list(resumen_tmed.anual.index)
     
     # Estadísticas anuales
-    stats_dict['Total'] = df['tmed'].describe()
-    
-    # Crear df de resumen
-    resumen = pd.DataFrame(stats_dict)
+    resumen = resumen_tmed.anual[estadisticas.ESTADISTICOS].T
+    resumen.columns = [str(año) for año in años]
+    resumen['Total'] = resumen_tmed.total[estadisticas.ESTADISTICOS]
     
     # Agregar columna de variación
     if len(años) > 1:
@@ -197,14 +160,16 @@ def calculate_statistics(df):
     # Estadísticas mensuales
     resumen_mensual = None
     if len(años) > 1:
+        mensuales = resumen_tmed.mensual[estadisticas.ESTADISTICOS]
         monthly_stats = {}
         for año in años:
-            year_monthly = df[df['año'] == año].groupby('mes')['tmed'].describe()
+            year_monthly = mensuales.loc[año]
             for col in year_monthly.columns:
                 monthly_stats[f'{col}_{año}'] = year_monthly[col]
         
         if monthly_stats:
             resumen_mensual = pd.DataFrame(monthly_stats)
+            resumen_mensual.index.name = 'mes'
             
             # Agregar variaciones anuales
             if len(años) == 2:
@@ -213,81 +178,158 @@ def calculate_statistics(df):
                 )
     return resumen, resumen_mensual
 
-def display_conclusions():
+def display_conclusions(resumen_tmed):
     """
     Desplegar conclusiones sobre el análisis de temperatura media
+
+    Se calculan con el comparador (ver src/comparador.py) sobre los dos últimos años
+    con datos, y con las medias por provincia del cubo; no hay cifras escritas a mano.
     """
     st.subheader("🔍 Conclusiones del Análisis")
-    
+
+    años = list(resumen_tmed.anual.index)[-2:]
+    motor = comparador.comparador_vigente("tmed")
+    if len(años) < 2 or motor is None:
+        st.info("Hacen falta al menos dos años con datos para comparar.")
+        return
+    año_a, año_b = años
+    periodos = {año: (date(año, 1, 1), date(año, 12, 31)) for año in años}
+
     # Conclusiones
-    st.markdown("### Comparación Interanual (2023 vs 2024)")
-    
-    with st.container():
-        st.markdown("""
-        **Tendencia General:**
-        - En general, **2024 fue más frío que 2023**: la media bajó casi **3 °C**, como se ve en la fila "mean" de la tabla anual.
-        
-        **Análisis Mensual:**
-        - **Mayor caída de temperatura**: ocurrió en **octubre y junio**, con casi **-2 °C** de diferencia respecto a 2023.
-        - **Excepción**: **Noviembre** fue más cálido en 2024 que en 2023, lo que puede sugerir un **retraso en el enfriamiento otoñal**.
-        """)
-    
+    st.markdown(f"### Comparación Interanual ({año_a} vs {año_b})")
+    comparacion = motor.comparar(periodos[año_a], periodos[año_b])
+    st.caption(f"Periodo A: {año_a}; periodo B: {año_b}. Días alineados por fecha del calendario.")
+    st.markdown("\n".join(f"- {frase}" for frase in comparador.conclusiones(comparacion, "°C")))
+
     st.divider()
-    
+
     # Registro de temperaturas por provincia
     st.markdown("### Registros de Temperatura por Provincia")
-    
-    # Tabs
-    tab1, tab2, tab3 = st.tabs(["Año 2024", "Agosto 2024", "15 Enero 2024"])
-    
-    with tab1:
-        st.markdown("**Temperatura Media 2024 por Provincia (España)**")
-        col1, col2 = st.columns(2)
-        with col1:
-            st.success("**Mínima**: Castellón **4.5 °C**")
-            st.caption("La media anual más baja")
-        with col2:
-            st.error("**Máxima**: Las Palmas **21.0 °C**")
-            st.caption("La más cálida del año")
-    
-    with tab2:
-        st.markdown("**Temperatura Media Agosto 2024 por Provincia (España)**")
-        col1, col2 = st.columns(2)
-        with col1:
-            st.success("**Mínima**: Cantabria **18.0 °C**")
-            st.caption("La más fresca del mes")
-        with col2:
-            st.error("**Máxima**: Jaén **29.6 °C**")
-            st.caption("La más calurosa")
-    
-    with tab3:
-        st.markdown("**Temperatura Media el 15 de Enero de 2024**")
-        col1, col2 = st.columns(2)
-        with col1:
-            st.success("**Mínima**: Huesca **6.9 °C**")
-            st.caption("La provincia más fría ese día")
-        with col2:
-            st.error("**Máxima**: Las Palmas **21.5 °C**")
-            st.caption("La más templada")
-    
-    # Observaciones adicionales
-    st.divider()
-    st.markdown("### Observaciones Adicionales")
-    
-    with st.expander("Patrones Geográficos"):
-        st.markdown("""
-        - **Las Palmas** (Canarias) consistentemente registra las temperaturas más altas, tanto en promedios anuales como en días específicos.
-        - **Castellón** presenta la media anual más baja, reflejando su clima mediterráneo continental.
-        - **Cantabria** muestra temperaturas moderadas en verano debido a su ubicación atlántica.
-        - **Huesca** y **Jaén** representan los extremos de las temperaturas invernales y estivales respectivamente.
-        """)
-    
-    with st.expander("📈 Implicaciones Climáticas"):
-        st.markdown("""
-        - El descenso de **3°C** en la media anual entre 2023 y 2024 sugiere una **variabilidad climática significativa**.
-        - El retraso del enfriamiento otoñal (noviembre más cálido) podría indicar **cambios en los patrones estacionales**.
-        - La diferencia de **-2°C** en octubre y junio muestra que los **meses de transición** fueron particularmente afectados.
-        """)
+    nombres = leer_tabla("provincias").set_index("codigo_prov")["nombre"]
+    actual = cubo.cubo_vigente()
+
+    for tab, año in zip(st.tabs([f"Año {año}" for año in reversed(años)]), reversed(años)):
+        with tab:
+            medias = actual.media_provincias("tmed", *periodos[año]).dropna()
+            medias = medias[medias.index.isin(nombres.index)]
+            if medias.empty:
+                st.info(f"No hay medias por provincia en {año}.")
+                continue
+            st.markdown(f"**Temperatura Media {año} por Provincia (España)**")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.success(f"**Mínima**: {nombres[medias.idxmin()]} **{medias.min():.1f} °C**")
+                st.caption("La media anual más baja")
+            with col2:
+                st.error(f"**Máxima**: {nombres[medias.idxmax()]} **{medias.max():.1f} °C**")
+                st.caption("La más cálida del año")
+
+    st.caption("Para otros periodos, métricas o provincias, usa el Comparador.")
+    if st.button("Abrir el Comparador", key="abrir_comparador"):
+        st.switch_page("pages/3_Comparador.py")
+
+def mostrar_cuartiles(resumen_tmed):
+    """
+    Cuartiles, bigotes y % de atípicos de tmed para un rango de meses y provincias.
+
+    Salen de fusionar los bocetos KLL por provincia y mes (ver src/cuantiles.py), sin
+    leer los valores diarios: son aproximados, con el error de rango configurado.
+    """
+    st.subheader("Cuartiles por Rango y Provincia")
+    meses = resumen_tmed.mensual.index
+    primero = date(*meses[0], 1)
+    ultimo = (pd.Timestamp(date(*meses[-1], 1)) + pd.offsets.MonthEnd(0)).date()
+    df_provincias = leer_tabla("provincias")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        rango = st.date_input("Meses a incluir:", value=(primero, ultimo), min_value=primero, max_value=ultimo,
+                              format="DD/MM/YYYY", key="rango_cuartiles")
+    with col2:
+        opcion_provincia = st.multiselect("Elige las provincias:", df_provincias["nombre"], default=None,
+                                          placeholder="Toda España", key="provincias_cuartiles")
+    if len(rango) != 2:
+        st.info("Selecciona el mes de inicio y el de fin.")
+        return
+
+    codigos_prov = tuple(df_provincias.loc[df_provincias["nombre"].isin(opcion_provincia), "codigo_prov"])
+    boceto = cuantiles.consultar("tmed", rango[0], rango[1], codigos_prov)
+    if boceto.n == 0:
+        st.info("No hay datos de temperatura media en ese rango.")
+        return
+    caja = boceto.caja(etiqueta=", ".join(opcion_provincia) if opcion_provincia else "Toda España")
+
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        fig, ax = plt.subplots(figsize=(5, 5))
+        ax.bxp([caja], showfliers=False, patch_artist=True, boxprops=dict(facecolor='skyblue', edgecolor='black'))
+        ax.set_ylabel('Temperatura media (°C)')
+        st.pyplot(fig)
+        plt.close(fig)
+    with col2:
+        fila1, fila2 = st.columns(3), st.columns(3)
+        for columna, (etiqueta, valor) in zip(fila1 + fila2, [
+            ("Q1", f"{caja['q1']:.1f} °C"),
+            ("Mediana", f"{caja['med']:.1f} °C"),
+            ("Q3", f"{caja['q3']:.1f} °C"),
+            ("Bigote inferior", f"{caja['whislo']:.1f} °C"),
+            ("Bigote superior", f"{caja['whishi']:.1f} °C"),
+            ("% Días atípicos", f"{caja['porcentaje_atipicos']:.1f}%"),
+        ]):
+            columna.metric(etiqueta, valor)
+        st.caption(
+            f"Aproximados a partir de {caja['n']} lecturas: cada cuartil está a menos de "
+            f"{cuantiles.CONFIG_CUANTILES['error']:.1%} de rango del exacto. Se incluyen los meses "
+            f"completos de las fechas elegidas."
+        )
+
+
+def mostrar_eventos(años):
+    """
+    Olas de calor y de frío por provincia en un año.
+
+    Sale de la tabla eventos_extremos (ver src/eventos.py): una búsqueda por tipo y
+    fecha de inicio, sin recorrer las lecturas diarias.
+    """
+    st.subheader("Olas de Calor y de Frío por Provincia")
+    tipos = {"calor": "Olas de calor", "frio": "Olas de frío"}
+
+    col1, col2 = st.columns(2)
+    with col1:
+        tipo = st.radio("Tipo de evento:", list(tipos), format_func=tipos.get, horizontal=True, key="tipo_evento")
+    with col2:
+        año = st.selectbox("Año:", años, index=len(años) - 1, key="año_evento")
+
+    columna, percentil, _ = eventos.TIPOS[tipo]
+    df = eventos.por_provincia(tipo, date(año, 1, 1), date(año, 12, 31))
+    if df.empty:
+        st.info(f"No hay {tipos[tipo].lower()} registradas en {año}.")
+        return
+
+    # Las provincias sin eventos cuentan como cero, no como sin datos
+    df = leer_tabla("provincias")[["codigo_prov", "nombre"]].merge(df, on="codigo_prov", how="left")
+    df[["eventos", "dias"]] = df[["eventos", "dias"]].fillna(0).astype(int)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        imagen = dibujar_coropletico_png(df, "dias", f"{tipos[tipo]} en {año}: días en evento por provincia", "Días")
+        st.image(imagen, use_container_width=True)
+    with col2:
+        st.dataframe(df.sort_values("dias", ascending=False), hide_index=True, use_container_width=True, column_config={
+            "codigo_prov": None,
+            "nombre": st.column_config.TextColumn("Nombre de la provincia"),
+            "eventos": st.column_config.NumberColumn(label="Eventos", format="%d"),
+            "dias": st.column_config.NumberColumn(label="Días", format="%d", help="Días en evento sumando todas las estaciones"),
+            "racha_max": st.column_config.NumberColumn(label="Racha máx. (días)", format="%d"),
+            "pico": st.column_config.NumberColumn(label="Pico (°C)", format="%.1f"),
+            "estaciones": st.column_config.NumberColumn(label="Estaciones", format="%d"),
+        })
+    st.caption(
+        f"Evento: {eventos.CONFIG_EVENTOS['dias_minimos']} o más días seguidos con {columna} "
+        f"{'por encima' if tipo == 'calor' else 'por debajo'} del percentil {percentil} de la estación "
+        f"para ese día del año (climatología de src/climatologia.py)."
+    )
+
 
 def main():
     load_css('src/estilos.css')
@@ -317,8 +359,8 @@ def main():
     st.subheader("Análisis Detallado de Temperatura")
     
     with st.spinner("Analizando datos de temperatura..."):
-            df_a_analizar = ejecutar_consulta_a_dataframe("SELECT * FROM datos_meteorologicos")
-            fig, analyzed_df = analyze_temperature_data(df_a_analizar.copy())
+            resumen_tmed = estadisticas.resumen('tmed')
+            fig = analyze_temperature_data(resumen_tmed)
                 
             if fig is not None:
             # Visualizaciones
@@ -329,7 +371,7 @@ def main():
                 st.subheader("Estadísticas Descriptivas")
                     
                 with st.spinner("Calculando estadísticas..."):
-                    resumen, resumen_mensual = calculate_statistics(analyzed_df.copy())
+                    resumen, resumen_mensual = calculate_statistics(resumen_tmed)
                         
                     st.write("**Estadísticas por Año:**")
                     # Configuration for yearly statistics dataframe
@@ -341,7 +383,7 @@ def main():
                                 format="%.2f", 
                                 help="Diferencia de temperatura entre años (°C)"
                             )
-                        elif col in ['2023', '2024', '2025', 'Total']:
+                        elif col.isdigit() or col == 'Total':
                             yearly_column_config[col] = st.column_config.NumberColumn(
                                 label=f"Año {col}" if col != 'Total' else col, 
                                 format="%.2f", 
@@ -385,31 +427,31 @@ def main():
                         st.dataframe(resumen_mensual, use_container_width=True, column_config=monthly_column_config)
                         
                         st.subheader("Resumen de Outliers")
-                        datos = analyzed_df['tmed'].dropna()
-                        q1 = datos.quantile(0.25)
-                        q3 = datos.quantile(0.75)
-                        iqr = q3 - q1
-                        limite_bajo = q1 - 1.5 * iqr
-                        limite_alto = q3 + 1.5 * iqr
-                        
-                        normales = datos[(datos >= limite_bajo) & (datos <= limite_alto)]
-                        atipicos = datos[(datos < limite_bajo) | (datos > limite_alto)]
+                        total = int(resumen_tmed.total['count'])
+                        atipicos = int(resumen_tmed.total['n_atipicos'])
                         
                         col1, col2, col3 = st.columns(3)
                         with col1:
-                            st.metric("Días normales", len(normales))
+                            st.metric("Días normales", total - atipicos)
                         with col2:
-                            st.metric("Días atípicos", len(atipicos))
+                            st.metric("Días atípicos", atipicos)
                         with col3:
-                            st.metric("% Días atípicos", f"{len(atipicos)/len(datos)*100:.1f}%")
+                            st.metric("% Días atípicos", f"{atipicos/total*100:.1f}%")
                         
                         #Conclusiones
                         st.divider()
-                        display_conclusions()
+                        display_conclusions(resumen_tmed)
     
                     else:
                         st.info("Sube un archivo CSV con datos detallados de temperatura para ver análisis adicionales")
 
+    # Cuartiles de cualquier rango y olas de calor y de frío
+    if resumen_tmed is not None and not resumen_tmed.vacio:
+        st.divider()
+        mostrar_cuartiles(resumen_tmed)
+        st.divider()
+        mostrar_eventos(list(resumen_tmed.anual.index))
+
     # Agregar Botón de inicio
     st.divider()
     if st.button("Volver a Inicio", key="volver_inicio"):
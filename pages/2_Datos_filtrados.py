@@ -2,9 +2,9 @@ import pandas as pd
 import streamlit as st
 from datetime import date
 
-from src.extraer_datos import ejecutar_consulta_a_dataframe
-from src.coroplet import dibujar_coropletico, dibujar_coropletico_plotly
-from src import conectar
+from src import climatologia, cubo, etapas
+from src.extraer_datos import ejecutar_consulta_a_dataframe, leer_tabla, version_vigente
+from src.coroplet import dibujar_coropletico_png, dibujar_coropletico_plotly
 from src.personalizacion import load_css
 
 st.set_page_config(
@@ -14,15 +14,80 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
     )
 
+# Etapas de la página. Cada una se memoriza en la sesión con sus entradas (ver
+# src/etapas.py), de modo que un rerun solo recalcula lo que depende del widget cambiado:
+#   referencia -> agregado (fechas) -> filtro (comunidad/provincias) -> proyección (métrica) -> mapa
+
+@etapas.etapa("datos_filtrados.referencia")
+def tablas_referencia(version):
+    """Tablas de provincias y comunidades desde MySQL o desde el almacén Parquet local."""
+    return leer_tabla("provincias"), leer_tabla("comunidades")
+
+
+@etapas.etapa("datos_filtrados.agregado")
+def agregado_por_fechas(version, **fechas):
+    """
+    Medias de todas las provincias en el rango de fechas (como mucho 52 filas).
+
+    Los filtros de comunidad y provincia no viajan a la consulta: se aplican en
+    memoria sobre este resultado, que se reutiliza mientras no cambien las fechas.
+    """
+    return ejecutar_consulta_a_dataframe(params=fechas)
+
+
+@etapas.etapa("datos_filtrados.anomalia")
+def anomalia_por_fechas(version, columna, codigos_prov, **fechas):
+    """
+    Anomalía media de cada provincia respecto a su climatología en el rango de fechas.
+
+    Sale de restar las normales guardadas (src/climatologia.py) a la rebanada del cubo,
+    sin recorrer el histórico en cada petición.
+    """
+    datos, normales = cubo.cubo_vigente(), climatologia.climatologia_vigente()
+    if datos is None or normales is None:
+        return pd.DataFrame(columns=["codigo_prov", columna])
+    desde = fechas.get("fecha_inicio", fechas.get("fecha"))
+    hasta = fechas.get("fecha_fin", fechas.get("fecha"))
+    df = climatologia.anomalia_provincias(datos, normales, columna, desde, hasta).reset_index()
+    if codigos_prov:
+        df = df[df["codigo_prov"].isin(codigos_prov)].reset_index(drop=True)
+    return df
+
+
+@etapas.etapa("datos_filtrados.filtro")
+def filtrar_provincias(df, codigos_prov):
+    """Filas de las provincias indicadas; todas si no se indica ninguna."""
+    if df.empty or not codigos_prov:
+        return df
+    return df[df["codigo_prov"].isin(codigos_prov)].reset_index(drop=True)
+
+
+@etapas.etapa("datos_filtrados.proyeccion")
+def proyectar_metrica(df, renombrar_columnas, columna):
+    """Renombra las métricas y deja solo lo que necesita el mapa."""
+    df = df.rename(columns=renombrar_columnas)
+    return df[[c for c in ("codigo_prov", "nombre", columna) if c in df.columns]]
+
+
+@etapas.etapa("datos_filtrados.mapa")
+def dibujar_mapa(df, columna, titulo, leyenda, interactivo):
+    """Figura de Plotly o PNG del mapa coroplético."""
+    if interactivo:
+        # La geometría se descarga una vez como archivo estático; cada cambio solo envía los valores
+        return dibujar_coropletico_plotly(df, columna, titulo, leyenda)
+    # PNG cacheado: si la selección no ha cambiado no se vuelve a dibujar la figura
+    return dibujar_coropletico_png(df, columna, titulo, leyenda)
+
+
 def main():
-    conexion = conectar.conexion()
+    etapas.iniciar_ejecucion()
     load_css('src/estilos.css')
 
     st.title("Datos meteorológicos filtrados")
     st.divider()
 
-    df_provincias = pd.read_sql_table("provincias", conexion)
-    df_comunidades = pd.read_sql_table("comunidades", conexion)
+    version = version_vigente()
+    df_provincias, df_comunidades = tablas_referencia(version)
 
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -68,10 +133,6 @@ def main():
     #     st.sidebar.write(opcion_provincia)
     #     st.dataframe(df_provincias[df_provincias["nombre"].isin(opcion_provincia)], hide_index=True)
 
-    with st.spinner("Cargando datos históricos... Por favor, espera."):
-        
-        df = ejecutar_consulta_a_dataframe()
-    
     with col4:
         metricas_disponibles = {
             "Altitud media (m)": {"original_col": "AVG(d.altitud)", "new_col": "altitud", "unidad": "m"},
@@ -88,31 +149,36 @@ def main():
             index=0 # Por defecto selecciona la primera métrica
         )
 
+    # Provincias a mostrar: las elegidas o, si no hay, las de la comunidad
+    codigos_prov = ()
+    if opcion_provincia:
+        codigos_prov = tuple(df_provincias.loc[
+            df_provincias["nombre"].isin(opcion_provincia), "codigo_prov"
+        ])
+    elif opcion_comunidad:
+        codigos_prov = tuple(provincias_filtradas["codigo_prov"])
+
+    parametros = {}
+
     if fecha and len(fecha) == 2:
-        parametros = {
-            "fecha_inicio": fecha[0],
-            "fecha_fin": fecha[1]
-            }
-        df = ejecutar_consulta_a_dataframe(params=parametros)
+        parametros["fecha_inicio"] = fecha[0]
+        parametros["fecha_fin"] = fecha[1]
         fecha_inicio_str = fecha[0].strftime("%d/%m/%Y")
         fecha_fin_str = fecha[1].strftime("%d/%m/%Y")
         titulo_mapa = f"Promedio de {metrica_seleccionada} por provincia seleccionada desde {fecha_inicio_str} hasta {fecha_fin_str}"
 
     elif fecha and len(fecha) == 1:
-        parametros = {
-            "fecha": fecha[0],
-            }
-        df = ejecutar_consulta_a_dataframe(params=parametros)
+        parametros["fecha"] = fecha[0]
         fecha_str = fecha[0].strftime("%d/%m/%Y")
         titulo_mapa = f"Promedio de {metrica_seleccionada} por provincia seleccionada en {fecha_str}"
     else:
         st.write("No se ha seleccionado ninguna fecha.")
         titulo_mapa = f"Promedio de {metrica_seleccionada} por provincia seleccionada"
 
-    if opcion_provincia:
-        df = df[df["nombre"].isin(opcion_provincia)]
+    with st.spinner("Cargando datos históricos... Por favor, espera."):
+        df_agregado = agregado_por_fechas(version, **parametros)
+    df = filtrar_provincias(df_agregado, codigos_prov)
 
-    
     st.divider()
 
     st.dataframe(df, hide_index=True, use_container_width=True, column_config={
@@ -136,30 +202,38 @@ def main():
         v["original_col"]: v["new_col"]
         for v in metricas_disponibles.values()
         }
-        # Renombrar todas las columnas en el DataFrame
-        
-        df = df.rename(columns=renombrar_columnas)
-
         columna_seleccionada = metricas_disponibles[metrica_seleccionada]["new_col"]
+        df_metrica = proyectar_metrica(df, renombrar_columnas, columna_seleccionada)
         
-        fig = dibujar_coropletico(
-            df,
+        mapa_interactivo = st.toggle("Mapa interactivo", value=False, key="mapa_interactivo")
+
+        # Anomalía frente a la normal del mismo día del año, para las métricas con climatología
+        mapa_anomalia = False
+        if columna_seleccionada in climatologia.CONFIG_CLIMATOLOGIA["columnas"]:
+            mapa_anomalia = st.toggle("Anomalía respecto a la climatología", value=False, key="mapa_anomalia")
+        if mapa_anomalia:
+            df_metrica = anomalia_por_fechas(version, columna_seleccionada, codigos_prov, **parametros).merge(
+                df_provincias[["codigo_prov", "nombre"]], on="codigo_prov"
+            )
+            titulo_mapa = titulo_mapa.replace("Promedio de", "Anomalía de", 1) + " respecto a la normal"
+
+        mapa = dibujar_mapa(
+            df_metrica,
             columna_seleccionada,
             titulo_mapa,
-            f"{metrica_seleccionada}" # Etiqueta de la leyenda
+            f"Anomalía {metrica_seleccionada}" if mapa_anomalia else f"{metrica_seleccionada}", # Etiqueta de la leyenda
+            mapa_interactivo
         )
-        st.pyplot(fig, use_container_width=True) # Muestra la figura de Matplotlib en Streamlit
-        
-        # fig_px = dibujar_coropletico_plotly(
-        #     df,
-        #     columna_seleccionada,
-        #     titulo_mapa,
-        #     f"{metrica_seleccionada}"
-        # )
-        # st.plotly_chart(fig_px, use_container_width=True) # Muestra la figura de Plotly en Streamlit
+        if mapa_interactivo:
+            st.plotly_chart(mapa, use_container_width=True) # Muestra la figura de Plotly en Streamlit
+        else:
+            st.image(mapa, use_container_width=True) # Muestra el mapa ya renderizado
     else:
         st.info("Selecciona una métrica para mostrar el mapa.")
     
+    # Qué etapas se han recalculado en este rerun
+    etapas.mostrar_registro()
+
     # Agregar Botón de inicio
     st.divider()
     if st.button("Volver a Inicio", key="volver_inicio"):
@@ -1,4 +1,10 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
 import streamlit as st
+
+from src import comparador, cubo
+from src.extraer_datos import leer_tabla
 from src.personalizacion import load_css
 
 st.set_page_config(
@@ -8,17 +14,161 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
     )
 
+# Métricas que se pueden comparar; el factor pasa la unidad guardada a la que se muestra
+METRICAS = {
+    "Temp. media (ºC)": {"col": "tmed", "unidad": "ºC", "factor": 1.0},
+    "Temp. mínima (ºC)": {"col": "tmin", "unidad": "ºC", "factor": 1.0},
+    "Temp. máxima (ºC)": {"col": "tmax", "unidad": "ºC", "factor": 1.0},
+    "Precip. media (mm)": {"col": "prec", "unidad": "mm", "factor": 1.0},
+    "Racha media (km/h)": {"col": "racha", "unidad": "km/h", "factor": 3.6},
+    "Humedad media (%)": {"col": "hrMedia", "unidad": "%", "factor": 1.0},
+}
+
+
+def escalar(comparacion, factor):
+    """Aplica el cambio de unidad a las series, las medias mensuales y los totales."""
+    if factor == 1.0:
+        return comparacion
+    columnas = ["a", "b", "diferencia"]
+    diaria, mensual, total = comparacion.diaria.copy(), comparacion.mensual.copy(), comparacion.total.copy()
+    diaria[columnas] *= factor
+    mensual[columnas] *= factor
+    total[columnas] *= factor
+    return comparador.Comparacion(comparacion.metrica, comparacion.provincias, diaria, mensual, total)
+
+
+def dibujar_comparacion(comparacion, metrica, etiqueta_a, etiqueta_b):
+    """
+    Series diarias de los dos periodos sobre las fechas del periodo A, la diferencia
+    diaria y la diferencia de las medias mensuales.
+    """
+    diaria, mensual = comparacion.diaria, comparacion.mensual
+    fig, (ax_series, ax_dif, ax_mes) = plt.subplots(3, 1, figsize=(14, 12), height_ratios=[1.4, 1, 1])
+
+    ax_series.plot(diaria["fecha_a"], diaria["a"], color='orange', linewidth=1.5, label=etiqueta_a)
+    ax_series.plot(diaria["fecha_a"], diaria["b"], color='blue', linewidth=1.5, label=f"{etiqueta_b} (alineado por día del año)")
+    ax_series.set_title(f'{metrica}: media diaria de cada periodo')
+    ax_series.set_ylabel(metrica)
+    ax_series.legend(fontsize=9)
+
+    diferencia = diaria["diferencia"].to_numpy()
+    ax_dif.fill_between(diaria["fecha_a"], 0, diferencia, where=diferencia >= 0, color='red', alpha=0.5, interpolate=True)
+    ax_dif.fill_between(diaria["fecha_a"], 0, diferencia, where=diferencia < 0, color='blue', alpha=0.5, interpolate=True)
+    ax_dif.axhline(0, color='black', linewidth=0.8)
+    ax_dif.set_title('Diferencia diaria (B − A)')
+    ax_dif.set_ylabel(metrica)
+
+    colores = np.where(mensual["diferencia"] >= 0, 'red', 'blue')
+    etiquetas = mensual["mes"].dt.strftime('%m/%Y')
+    ax_mes.bar(etiquetas, mensual["diferencia"], color=colores, alpha=0.7)
+    ax_mes.axhline(0, color='black', linewidth=0.8)
+    ax_mes.set_title('Diferencia de la media mensual (B − A), meses del periodo A')
+    ax_mes.set_ylabel(metrica)
+    ax_mes.tick_params(axis='x', rotation=45)
+
+    plt.tight_layout()
+    return fig
+
+
 def main():
     load_css('src/estilos.css')
-    st.title("Predicciones de temperatura")
+    st.title("Comparador de periodos")
+    st.divider()
+
+    with st.spinner("Cargando datos históricos... Por favor, espera."):
+        datos = cubo.cubo_vigente()
+    if datos is None:
+        st.info("Aún no hay datos para comparar.")
+        return
+
+    df_provincias = leer_tabla("provincias")
+
+    # Por defecto: el último año con datos frente al año anterior
+    fin_b = datos.fin
+    inicio_b = max((pd.Timestamp(fin_b) - pd.DateOffset(years=1) + pd.Timedelta(days=1)).date(), datos.inicio)
+    inicio_a = max((pd.Timestamp(inicio_b) - pd.DateOffset(years=1)).date(), datos.inicio)
+    fin_a = max((pd.Timestamp(fin_b) - pd.DateOffset(years=1)).date(), inicio_a)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        metrica = st.selectbox("Métrica:", METRICAS, index=0)
+    with col2:
+        opcion_provincia = st.multiselect(
+            "Elige las provincias:",
+            df_provincias["nombre"],
+            default=None,
+            placeholder="Toda España"
+        )
+
+    col3, col4 = st.columns(2)
+    with col3:
+        periodo_a = st.date_input(
+            "Periodo A (referencia):",
+            value=(inicio_a, fin_a),
+            min_value=datos.inicio,
+            max_value=datos.fin,
+            format="DD/MM/YYYY"
+        )
+    with col4:
+        periodo_b = st.date_input(
+            "Periodo B (a comparar):",
+            value=(inicio_b, fin_b),
+            min_value=datos.inicio,
+            max_value=datos.fin,
+            format="DD/MM/YYYY"
+        )
+
+    if len(periodo_a) != 2 or len(periodo_b) != 2:
+        st.info("Selecciona la fecha de inicio y la de fin de los dos periodos.")
+        return
+
+    codigos_prov = tuple(df_provincias.loc[df_provincias["nombre"].isin(opcion_provincia), "codigo_prov"])
+    datos_metrica = METRICAS[metrica]
+    motor = comparador.comparador_vigente(datos_metrica["col"])
+    comparacion = escalar(motor.comparar(periodo_a, periodo_b, codigos_prov), datos_metrica["factor"])
+
+    if comparacion.vacia:
+        st.warning("No hay datos de la métrica en alguno de los dos periodos.")
+        return
+
+    unidad = datos_metrica["unidad"]
+    etiqueta_a = f"A: {periodo_a[0].strftime('%d/%m/%Y')} – {periodo_a[1].strftime('%d/%m/%Y')}"
+    etiqueta_b = f"B: {periodo_b[0].strftime('%d/%m/%Y')} – {periodo_b[1].strftime('%d/%m/%Y')}"
+    ambito = ", ".join(opcion_provincia) if opcion_provincia else "toda España"
+
     st.divider()
-    # st.write(st.context.cookies)
-    # st.write(st.context.headers)
-    st.write("Por hacer")
+    st.subheader(f"{metrica} en {ambito}")
+    total = comparacion.total
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(f"Media periodo {etiqueta_a}", f"{total['a']:.2f} {unidad}")
+    with col2:
+        st.metric(f"Media periodo {etiqueta_b}", f"{total['b']:.2f} {unidad}",
+                  delta=f"{total['diferencia']:+.2f} {unidad}")
+    with col3:
+        st.metric("Días comparados", int(comparacion.diaria[["a", "b"]].notna().all(axis=1).sum()))
+
+    fig = dibujar_comparacion(comparacion, metrica, etiqueta_a, etiqueta_b)
+    st.pyplot(fig)
+    plt.close(fig)
+
+    st.subheader("Diferencias mensuales")
+    st.dataframe(comparacion.mensual, hide_index=True, use_container_width=True, column_config={
+        "mes": st.column_config.DateColumn("Mes (periodo A)", format="MM/YYYY"),
+        "a": st.column_config.NumberColumn(label=f"Media A ({unidad})", format="%.2f"),
+        "b": st.column_config.NumberColumn(label=f"Media B ({unidad})", format="%.2f"),
+        "diferencia": st.column_config.NumberColumn(label=f"B − A ({unidad})", format="%+.2f"),
+        "n_a": st.column_config.NumberColumn(label="Lecturas A", format="%d"),
+        "n_b": st.column_config.NumberColumn(label="Lecturas B", format="%d"),
+    })
+
+    st.subheader("🔍 Conclusiones")
+    st.markdown("\n".join(f"- {frase}" for frase in comparador.conclusiones(comparacion, unidad)))
 
     # Agregar Botón de inicio
     st.divider()
     if st.button("Volver a Inicio", key="volver_inicio"):
         st.switch_page("Inicio.py")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
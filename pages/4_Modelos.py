@@ -0,0 +1,139 @@
+import matplotlib.pyplot as plt
+import pandas as pd
+import streamlit as st
+from datetime import timedelta
+
+from src import predicciones
+from src.coroplet import dibujar_coropletico_png
+from src.extraer_datos import leer_tabla
+from src.personalizacion import load_css
+
+st.set_page_config(
+    page_title="Proyecto Grupo D",
+    page_icon="🌡️",
+    layout="wide",
+    initial_sidebar_state="collapsed"
+    )
+
+# Días de histórico que se dibujan junto a la predicción
+DIAS_HISTORIA = 365
+
+
+def dibujar_predicciones(historia, prediccion, sigma, nombres):
+    """
+    Histórico reciente y predicción de cada provincia, con una banda de ±1.96σ.
+
+    - historia: DataFrame con ['fecha', 'codigo_prov', 'tmed'].
+    - prediccion: DataFrame con índice fecha y una columna por codigo_prov.
+    - sigma: Serie con la desviación residual por codigo_prov.
+    - nombres: Serie codigo_prov -> nombre de las provincias a dibujar.
+    """
+    fig, ax = plt.subplots(figsize=(14, 6))
+    for codigo, nombre in nombres.items():
+        serie = historia[historia['codigo_prov'] == codigo]
+        linea, = ax.plot(serie['fecha'], serie['tmed'], linewidth=1, alpha=0.6, label=f"{nombre} (observada)")
+        color = linea.get_color()
+        ax.plot(prediccion.index, prediccion[codigo], color=color, linewidth=2, linestyle='--',
+                label=f"{nombre} (predicción)")
+        ax.fill_between(
+            prediccion.index,
+            prediccion[codigo] - 1.96 * sigma[codigo],
+            prediccion[codigo] + 1.96 * sigma[codigo],
+            color=color, alpha=0.15
+        )
+    ax.axvline(prediccion.index[0], color='grey', linestyle=':', linewidth=1)
+    ax.set_title('Temperatura media diaria: observada y prevista')
+    ax.set_ylabel('Temperatura media (°C)')
+    ax.legend(fontsize=9, ncol=2)
+    ax.tick_params(axis='x', rotation=45)
+    plt.tight_layout()
+    return fig
+
+
+def main():
+    load_css('src/estilos.css')
+    st.title("Predicciones de temperatura")
+    st.divider()
+
+    # Solo se evalúan los coeficientes guardados; el ajuste lo mantiene popular.py
+    with st.spinner("Cargando el modelo de predicción..."):
+        modelo = predicciones.cargar_modelo()
+    if modelo.hasta is None:
+        st.info("Aún no hay datos suficientes para ajustar el modelo.")
+        return
+
+    df_provincias = leer_tabla("provincias")
+    nombres = df_provincias.set_index("codigo_prov")["nombre"]
+
+    col1, col2 = st.columns(2)
+    with col1:
+        opcion_provincia = st.multiselect(
+            "Elige las provincias:",
+            df_provincias["nombre"],
+            default=[n for n in ["Madrid"] if n in set(df_provincias["nombre"])],
+            placeholder="Elige las provincias que quieras ver"
+        )
+    with col2:
+        horizonte = st.slider("Días a predecir:", min_value=7, max_value=365, value=90, step=1)
+
+    fechas = pd.date_range(modelo.hasta + timedelta(days=1), periods=horizonte, freq="D")
+    prediccion = modelo.predecir(fechas)
+    sigma = pd.Series(modelo.sigma, index=modelo.codigos)
+
+    if opcion_provincia:
+        elegidas = nombres[nombres.isin(opcion_provincia)]
+        with st.spinner("Cargando histórico reciente..."):
+            historia = predicciones.serie_diaria(modelo.hasta - timedelta(days=DIAS_HISTORIA))
+        fig = dibujar_predicciones(historia, prediccion, sigma, elegidas)
+        st.pyplot(fig)
+        plt.close(fig)
+    else:
+        st.info("Elige al menos una provincia para ver su predicción.")
+
+    st.divider()
+
+    # Mapa de la predicción de un día
+    st.subheader("Predicción por provincia")
+    dia = st.slider(
+        "Día a mostrar en el mapa:",
+        min_value=fechas[0].date(),
+        max_value=fechas[-1].date(),
+        value=fechas[0].date(),
+        format="DD/MM/YYYY"
+    )
+    datos_mapa = pd.DataFrame({
+        "codigo_prov": modelo.codigos,
+        "tmed": prediccion.loc[pd.Timestamp(dia)].to_numpy(),
+    }).merge(df_provincias[["codigo_prov", "nombre"]], on="codigo_prov")
+    imagen = dibujar_coropletico_png(
+        datos_mapa,
+        "tmed",
+        f"Temperatura media prevista el {dia.strftime('%d/%m/%Y')}",
+        "Temp. media prevista (ºC)"
+    )
+    st.image(imagen, use_container_width=True)
+
+    # Coeficientes del modelo
+    st.subheader("Modelo por provincia")
+    resumen = modelo.resumen().merge(df_provincias[["codigo_prov", "nombre"]], on="codigo_prov")
+    st.dataframe(resumen[["nombre", "media", "tendencia", "amplitud_anual", "sigma", "dias"]],
+                 hide_index=True, use_container_width=True, column_config={
+        "nombre": st.column_config.TextColumn("Nombre de la provincia"),
+        "media": st.column_config.NumberColumn(label="Nivel (ºC)", format="%.2f", help=f"Valor del modelo el {predicciones.ORIGEN.strftime('%d/%m/%Y')} sin ciclo anual"),
+        "tendencia": st.column_config.NumberColumn(label="Tendencia (ºC/año)", format="%.2f"),
+        "amplitud_anual": st.column_config.NumberColumn(label="Amplitud anual (ºC)", format="%.2f", help="Semiamplitud del ciclo anual"),
+        "sigma": st.column_config.NumberColumn(label="Error típico (ºC)", format="%.2f", help="Desviación típica de los residuos"),
+        "dias": st.column_config.NumberColumn(label="Días ajustados", format="%d"),
+    })
+    st.caption(
+        f"Regresión armónica ({modelo.armonicos} armónicos) con tendencia lineal, ajustada con los datos "
+        f"hasta el {modelo.hasta.strftime('%d/%m/%Y')}. La banda sombreada es ±1.96 veces el error típico."
+    )
+
+    # Agregar Botón de inicio
+    st.divider()
+    if st.button("Volver a Inicio", key="volver_inicio"):
+        st.switch_page("Inicio.py")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import os
+import shutil
+import time
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.consultas import METRICAS, ConsultaMeteorologica
+
+
+# Directorio local con los datos en Parquet:
+#   datos_meteorologicos/anio=2024/mes=5/codigo_prov=28/*.parquet
+#   provincias.parquet, comunidades.parquet, version.txt
+RUTA_ALMACEN = os.path.join("data", "almacen")
+
+DATASET = "datos_meteorologicos"
+TABLAS_REFERENCIA = ["provincias", "comunidades"]
+
+# Columnas de los archivos (codigo_prov va en la ruta de la partición)
+ESQUEMA = pa.schema([
+    ("id_descarga", pa.string()),
+    ("fecha", pa.date32()),
+    ("indicativo", pa.string()),
+    ("nombre", pa.string()),
+    ("altitud", pa.float64()),
+    ("tmed", pa.float64()),
+    ("tmin", pa.float64()),
+    ("tmax", pa.float64()),
+    ("prec", pa.float64()),
+    ("velmedia", pa.float64()),
+    ("racha", pa.float64()),
+    ("hrMedia", pa.float64()),
+    ("timestamp_extraccion", pa.timestamp("us")),
+])
+
+# Particiones por año, mes y provincia: un filtro por fechas o provincias solo abre sus carpetas
+PARTICIONES = pa.schema([
+    ("anio", pa.int16()),
+    ("mes", pa.int8()),
+    ("codigo_prov", pa.int8()),
+])
+PARTICIONADO = ds.partitioning(PARTICIONES, flavor="hive")
+MAX_PARTICIONES = 100 * 12 * 52  # cien años de meses por provincia
+
+COLUMNAS_NUMERICAS = [campo.name for campo in ESQUEMA if pa.types.is_floating(campo.type)]
+
+
+def _ruta_dataset(ruta: str) -> str:
+    return os.path.join(ruta, DATASET)
+
+
+def _dataset(ruta: str = RUTA_ALMACEN) -> ds.Dataset:
+    return ds.dataset(_ruta_dataset(ruta), format="parquet", partitioning=PARTICIONADO)
+
+
+def _a_tabla(df: pd.DataFrame) -> pa.Table:
+    """Convierte un trozo de datos_meteorologicos al esquema del almacén más las particiones."""
+    df = df[df["codigo_prov"].notna() & df["fecha"].notna()]
+    fechas = pd.to_datetime(df["fecha"])
+    datos = pd.DataFrame({
+        "id_descarga": df["id_descarga"].astype("string"),
+        "fecha": fechas.dt.date,
+        "indicativo": df["indicativo"].astype("string"),
+        "nombre": df["nombre"].astype("string"),
+        **{c: pd.to_numeric(df[c], errors="coerce").astype("float64") for c in COLUMNAS_NUMERICAS},
+        "timestamp_extraccion": pd.to_datetime(df["timestamp_extraccion"]),
+        "anio": fechas.dt.year.astype("int16"),
+        "mes": fechas.dt.month.astype("int8"),
+        "codigo_prov": df["codigo_prov"].astype("int8"),
+    })
+    return pa.Table.from_pandas(datos, schema=pa.unify_schemas([ESQUEMA, PARTICIONES]), preserve_index=False)
+
+
+def escribir_trozo(df: pd.DataFrame, ruta: str = RUTA_ALMACEN, parte: str = None) -> int:
+    """
+    Añade un trozo de filas de datos_meteorologicos al dataset particionado.
+
+    Args:
+        df (pd.DataFrame): Filas con las columnas de datos_meteorologicos (incluido codigo_prov).
+        ruta (str): Directorio del almacén.
+        parte (str): Prefijo de los archivos escritos; por defecto, uno nuevo en cada llamada.
+
+    Returns:
+        int: Filas escritas.
+    """
+    tabla = _a_tabla(df)
+    parte = parte or f"parte-{time.time_ns()}"
+    pq.write_to_dataset(
+        tabla,
+        _ruta_dataset(ruta),
+        partitioning=PARTICIONADO,
+        basename_template=parte + "-{i}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        # Un trozo de varios años toca más carpetas que el límite por defecto (1024)
+        max_partitions=MAX_PARTICIONES,
+    )
+    marcar_version(ruta)
+    return tabla.num_rows
+
+
+def marcar_version(ruta: str = RUTA_ALMACEN) -> None:
+    """Anota el momento de la última escritura (invalida la caché de consultas)."""
+    with open(os.path.join(ruta, "version.txt"), "w", encoding="utf-8") as f:
+        f.write(datetime.now().isoformat())
+
+
+def version(ruta: str = RUTA_ALMACEN) -> tuple:
+    """Equivalente a extraer_datos.version_datos para el almacén local."""
+    try:
+        with open(os.path.join(ruta, "version.txt"), encoding="utf-8") as f:
+            return (f.read().strip(),)
+    except FileNotFoundError:
+        return None
+
+
+def exportar_desde_mysql(ruta: str = RUTA_ALMACEN, tamaño: int = 100000) -> None:
+    """
+    Vuelca datos_meteorologicos y las tablas de referencia de MySQL al almacén,
+    sustituyendo su contenido. Las filas se leen en streaming y se escriben por trozos.
+    """
+    from sqlalchemy import text
+
+    from src import conectar
+
+    os.makedirs(ruta, exist_ok=True)
+    shutil.rmtree(_ruta_dataset(ruta), ignore_errors=True)
+    inicio = time.perf_counter()
+    filas = 0
+    with conectar.abrir_conexion() as conexion:
+        for tabla in TABLAS_REFERENCIA:
+            pd.read_sql_table(tabla, conexion).to_parquet(os.path.join(ruta, f"{tabla}.parquet"), index=False)
+
+        # stream_results: PyMySQL usa un cursor en el servidor y no trae toda la tabla a memoria
+        streaming = conexion.execution_options(stream_results=True)
+        consulta = text(f"SELECT codigo_prov, {', '.join(ESQUEMA.names)} FROM datos_meteorologicos")
+        for i, trozo in enumerate(pd.read_sql(consulta, streaming, chunksize=tamaño)):
+            filas += escribir_trozo(trozo, ruta, parte=f"exportacion-{i:05d}")
+    segundos = time.perf_counter() - inicio
+    print(f"{filas} filas exportadas a {ruta} en {segundos:.1f} s.")
+
+
+def leer_tabla(nombre: str, ruta: str = RUTA_ALMACEN) -> pd.DataFrame:
+    """Lee una tabla de referencia (provincias o comunidades)."""
+    return pd.read_parquet(os.path.join(ruta, f"{nombre}.parquet"))
+
+
+def _filtro(fecha=None, fecha_inicio=None, fecha_fin=None, provincias=None) -> ds.Expression:
+    """
+    Filtro de pyarrow. Las condiciones sobre anio, mes y codigo_prov descartan
+    carpetas enteras; la de fecha usa las estadísticas de cada archivo.
+    """
+    anio, mes, fecha_col = ds.field("anio"), ds.field("mes"), ds.field("fecha")
+    condiciones = []
+    if fecha is not None:
+        condiciones += [anio == fecha.year, mes == fecha.month, fecha_col == pa.scalar(fecha, pa.date32())]
+    elif fecha_inicio is not None:
+        condiciones += [
+            (anio > fecha_inicio.year) | ((anio == fecha_inicio.year) & (mes >= fecha_inicio.month)),
+            (anio < fecha_fin.year) | ((anio == fecha_fin.year) & (mes <= fecha_fin.month)),
+            fecha_col >= pa.scalar(fecha_inicio, pa.date32()),
+            fecha_col <= pa.scalar(fecha_fin, pa.date32()),
+        ]
+    if provincias:
+        condiciones.append(ds.field("codigo_prov").isin([int(c) for c in provincias]))
+    if not condiciones:
+        return None
+    filtro = condiciones[0]
+    for condicion in condiciones[1:]:
+        filtro = filtro & condicion
+    return filtro
+
+
+def leer_datos(columnas: list = None, fecha=None, fecha_inicio=None, fecha_fin=None, provincias=None,
+               ruta: str = RUTA_ALMACEN) -> pd.DataFrame:
+    """
+    Lee filas de datos_meteorologicos leyendo solo las columnas y particiones necesarias.
+
+    Args:
+        columnas (list): Columnas a devolver; todas si es None.
+        fecha (date): Un día concreto.
+        fecha_inicio (date), fecha_fin (date): Rango de fechas (ambas incluidas).
+        provincias (list): codigo_prov a incluir.
+        ruta (str): Directorio del almacén.
+
+    Returns:
+        pd.DataFrame: Filas con codigo_prov como columna.
+    """
+    if columnas is None:
+        columnas = ESQUEMA.names[:4] + ["codigo_prov"] + ESQUEMA.names[4:]
+    tabla = _dataset(ruta).to_table(
+        columns=columnas, filter=_filtro(fecha, fecha_inicio, fecha_fin, provincias)
+    )
+    return tabla.to_pandas()
+
+
+def consultar(consulta: ConsultaMeteorologica, ruta: str = RUTA_ALMACEN) -> pd.DataFrame:
+    """
+    Resuelve una ConsultaMeteorologica sobre el almacén local.
+
+    Devuelve las mismas columnas y el mismo orden que la sentencia SQL de
+    consulta.construir(), de modo que las páginas no distinguen el origen.
+    """
+    provincias = leer_tabla("provincias", ruta)
+    codigos = list(consulta.provincias)
+    if consulta.comunidades:
+        de_comunidades = provincias.loc[provincias["codigo_ca"].isin(consulta.comunidades), "codigo_prov"]
+        codigos = [c for c in de_comunidades if not codigos or c in codigos]
+        if not codigos:
+            codigos = [-1]  # ninguna provincia cumple ambos filtros
+
+    tabla = _dataset(ruta).to_table(
+        columns=["codigo_prov", *consulta.metricas],
+        filter=_filtro(consulta.fecha, consulta.fecha_inicio, consulta.fecha_fin, codigos),
+    )
+
+    # Como el JOIN de la consulta SQL: solo provincias presentes en la tabla de referencia
+    df = tabla.to_pandas().merge(provincias[["codigo_prov", "nombre", "codigo_ca"]], on="codigo_prov")
+    if consulta.nivel == "comunidad":
+        clave = "codigo_ca"
+        nombres = leer_tabla("comunidades", ruta).set_index("codigo_ca")["nombre"]
+    else:
+        clave = "codigo_prov"
+        nombres = provincias.set_index("codigo_prov")["nombre"]
+
+    medias = df.groupby(clave, sort=True)[list(consulta.metricas)].mean()
+    if "racha" in medias:
+        medias["racha"] = medias["racha"] * 3.6
+    medias = medias.rename(columns=METRICAS)
+    medias.insert(0, "nombre", nombres.reindex(medias.index).to_numpy())
+    return medias.reset_index()[["nombre", clave, *medias.columns[1:]]]
+
+
+if __name__ == "__main__":
+    # python -m src.almacen  -> copia MySQL al almacén local para usar AEMET_ALMACEN=parquet
+    exportar_desde_mysql()
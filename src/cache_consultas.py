@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def _normalizar_valor(valor):
+    """Convierte listas y conjuntos en tuplas para poder usarlos en la clave."""
+    if isinstance(valor, (list, tuple, set, frozenset)):
+        valores = sorted(valor) if isinstance(valor, (set, frozenset)) else valor
+        return tuple(_normalizar_valor(v) for v in valores)
+    return valor
+
+
+def clave_consulta(consulta: str, params: dict = None) -> tuple:
+    """
+    Construye la clave de caché de una consulta.
+
+    Los espacios y saltos de línea se normalizan y el ';' final se ignora, de modo
+    que dos textos equivalentes comparten la misma entrada.
+
+    Args:
+        consulta (str): Texto SQL.
+        params (dict): Parámetros ligados a la consulta.
+
+    Returns:
+        tuple: (sql_normalizado, parámetros_ordenados)
+    """
+    sql = " ".join(consulta.split()).rstrip(";").strip()
+    parametros = tuple(sorted((k, _normalizar_valor(v)) for k, v in (params or {}).items()))
+    return sql, parametros
+
+
+class CacheConsultas:
+    """
+    Caché en memoria de resultados de consultas con expulsión LRU, caducidad (TTL)
+    e invalidación por versión de los datos.
+
+    La versión es cualquier valor comparable (p.ej. el último id_descarga y su
+    timestamp_extraccion). Cuando cambia, todas las entradas se descartan.
+    """
+
+    def __init__(self, memoria_max_mb: float = 64, ttl: float = 3600, intervalo_version: float = 30):
+        """
+        Args:
+            memoria_max_mb (float): Memoria máxima ocupada por los DataFrames guardados.
+            ttl (float): Segundos de vida de cada entrada.
+            intervalo_version (float): Segundos mínimos entre dos comprobaciones de versión.
+        """
+        self.memoria_max = int(memoria_max_mb * 1024 * 1024)
+        self.ttl = ttl
+        self.intervalo_version = intervalo_version
+
+        self._entradas = OrderedDict()  # clave -> (DataFrame, bytes, instante de guardado)
+        self._bytes = 0
+        self._version = None
+        self._ultima_comprobacion = None
+        self._cerrojo = threading.Lock()
+
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.invalidaciones = 0
+
+    def obtener(self, clave):
+        """Devuelve una copia del resultado guardado, o None si no existe o ha caducado."""
+        with self._cerrojo:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            df, tamaño, instante = entrada
+            if time.monotonic() - instante > self.ttl:
+                del self._entradas[clave]
+                self._bytes -= tamaño
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+        return df.copy()
+
+    def guardar(self, clave, df: pd.DataFrame):
+        """Guarda un resultado, expulsando los menos usados si se supera la memoria máxima."""
+        tamaño = int(df.memory_usage(deep=True).sum())
+        if tamaño > self.memoria_max:
+            # No cabe ni vaciando la caché: no se guarda
+            return
+        with self._cerrojo:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            while self._entradas and self._bytes + tamaño > self.memoria_max:
+                _, (_, tamaño_expulsado, _) = self._entradas.popitem(last=False)
+                self._bytes -= tamaño_expulsado
+                self.expulsiones += 1
+            self._entradas[clave] = (df.copy(), tamaño, time.monotonic())
+            self._bytes += tamaño
+
+    def invalidar(self):
+        """Descarta todas las entradas."""
+        with self._cerrojo:
+            self._entradas.clear()
+            self._bytes = 0
+            self.invalidaciones += 1
+
+    def comprobar_version(self, obtener_version):
+        """
+        Consulta la versión de los datos (como mucho una vez cada `intervalo_version`
+        segundos) e invalida la caché si ha cambiado desde la última comprobación.
+
+        Args:
+            obtener_version (callable): Función sin argumentos que devuelve la versión actual.
+        """
+        ahora = time.monotonic()
+        with self._cerrojo:
+            if self._ultima_comprobacion is not None and ahora - self._ultima_comprobacion < self.intervalo_version:
+                return
+            self._ultima_comprobacion = ahora
+        version = obtener_version()
+        with self._cerrojo:
+            cambiada = self._version is not None and version != self._version
+            self._version = version
+        if cambiada:
+            self.invalidar()
+
+    def estadisticas(self) -> dict:
+        """Retorna contadores de aciertos y fallos y la ocupación actual."""
+        with self._cerrojo:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._entradas),
+                "memoria_mb": self._bytes / (1024 * 1024),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+                "expulsiones": self.expulsiones,
+                "invalidaciones": self.invalidaciones,
+                "version": self._version,
+            }
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+# Cambiar al modificar el dibujo del mapa: las imágenes guardadas en disco dejan de servir.
+# Al rehacer la geometría no hace falta: su huella (geometria.huella()) ya entra en la del mapa.
+VERSION_DIBUJO = 2
+
+RUTA_CACHE_MAPAS = os.path.join("data", "cache_mapas")
+
+
+def huella_mapa(datos: pd.DataFrame, nombre_columna: str, *textos, formato: str = "png") -> str:
+    """
+    Huella (SHA-256) de todo lo que determina la imagen de un mapa.
+
+    Args:
+        datos (pd.DataFrame): Filas con codigo_prov, nombre y la columna a mapear.
+        nombre_columna (str): Columna que se pinta.
+        *textos: Título, etiqueta de la leyenda y cualquier otro texto del dibujo.
+        formato (str): Formato de la imagen.
+
+    Returns:
+        str: Huella en hexadecimal, apta como nombre de archivo.
+    """
+    valores = datos[["codigo_prov", "nombre", nombre_columna]].sort_values("codigo_prov")
+    h = hashlib.sha256()
+    h.update(pd.util.hash_pandas_object(valores, index=False).to_numpy().tobytes())
+    for texto in (VERSION_DIBUJO, nombre_columna, formato, *textos):
+        h.update(str(texto).encode("utf-8") + b"\0")
+    return h.hexdigest()
+
+
+class CacheMapas:
+    """
+    Caché de imágenes ya renderizadas en dos niveles: un LRU en memoria y un
+    directorio en disco, ambos con tamaño máximo. Lo que está en disco sobrevive
+    a los reinicios y se comparte entre procesos.
+    """
+
+    def __init__(self, memoria_max_mb: float = 32, disco_max_mb: float = 256,
+                 ruta: str = RUTA_CACHE_MAPAS, formato: str = "png"):
+        """
+        Args:
+            memoria_max_mb (float): Bytes de imagen máximos en memoria.
+            disco_max_mb (float): Tamaño máximo del directorio; se borran las menos usadas.
+            ruta (str): Directorio de la caché en disco.
+            formato (str): Extensión de los archivos ('png' o 'svg').
+        """
+        self.memoria_max = int(memoria_max_mb * 1024 * 1024)
+        self.disco_max = int(disco_max_mb * 1024 * 1024)
+        self.ruta = ruta
+        self.formato = formato
+        os.makedirs(ruta, exist_ok=True)
+
+        self._entradas = OrderedDict()  # huella -> bytes
+        self._bytes = 0
+        self._cerrojo = threading.Lock()
+
+        self.aciertos_memoria = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+        self.expulsiones_disco = 0
+
+    def _archivo(self, huella: str) -> str:
+        return os.path.join(self.ruta, f"{huella}.{self.formato}")
+
+    def _en_memoria(self, huella: str, imagen: bytes):
+        """Guarda en el LRU de memoria. Se llama con el cerrojo tomado."""
+        if len(imagen) > self.memoria_max:
+            return
+        anterior = self._entradas.pop(huella, None)
+        if anterior is not None:
+            self._bytes -= len(anterior)
+        while self._entradas and self._bytes + len(imagen) > self.memoria_max:
+            _, expulsada = self._entradas.popitem(last=False)
+            self._bytes -= len(expulsada)
+        self._entradas[huella] = imagen
+        self._bytes += len(imagen)
+
+    def obtener(self, huella: str) -> bytes:
+        """Devuelve la imagen guardada (memoria y, si no, disco), o None."""
+        with self._cerrojo:
+            imagen = self._entradas.get(huella)
+            if imagen is not None:
+                self._entradas.move_to_end(huella)
+                self.aciertos_memoria += 1
+                return imagen
+        archivo = self._archivo(huella)
+        try:
+            with open(archivo, "rb") as f:
+                imagen = f.read()
+            # La fecha de modificación hace de "último uso" para el recorte del disco
+            os.utime(archivo)
+        except OSError:
+            with self._cerrojo:
+                self.fallos += 1
+            return None
+        with self._cerrojo:
+            self.aciertos_disco += 1
+            self._en_memoria(huella, imagen)
+        return imagen
+
+    def guardar(self, huella: str, imagen: bytes):
+        """Guarda la imagen en memoria y en disco, y recorta el disco si se pasa del máximo."""
+        with self._cerrojo:
+            self._en_memoria(huella, imagen)
+        archivo = self._archivo(huella)
+        temporal = f"{archivo}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporal, "wb") as f:
+                f.write(imagen)
+            # Renombrar es atómico: otro proceso nunca lee una imagen a medio escribir
+            os.replace(temporal, archivo)
+            self._recortar_disco()
+        except OSError as e:
+            print(f"No se pudo guardar el mapa en la caché de disco: {e}")
+
+    def _recortar_disco(self):
+        """Borra las imágenes usadas hace más tiempo hasta quedar bajo disco_max."""
+        archivos = []
+        for entrada in os.scandir(self.ruta):
+            if entrada.is_file() and entrada.name.endswith(f".{self.formato}"):
+                estado = entrada.stat()
+                archivos.append((estado.st_mtime, estado.st_size, entrada.path))
+        total = sum(tamaño for _, tamaño, _ in archivos)
+        for _, tamaño, ruta in sorted(archivos):
+            if total <= self.disco_max:
+                break
+            try:
+                os.remove(ruta)
+                total -= tamaño
+                self.expulsiones_disco += 1
+            except OSError:
+                pass
+
+    def invalidar(self):
+        """Vacía la memoria y el directorio."""
+        with self._cerrojo:
+            self._entradas.clear()
+            self._bytes = 0
+        for entrada in os.scandir(self.ruta):
+            if entrada.name.endswith(f".{self.formato}"):
+                os.remove(entrada.path)
+
+    def estadisticas(self) -> dict:
+        """Retorna aciertos por nivel, fallos y ocupación en memoria."""
+        with self._cerrojo:
+            peticiones = self.aciertos_memoria + self.aciertos_disco + self.fallos
+            return {
+                "entradas_memoria": len(self._entradas),
+                "memoria_mb": self._bytes / (1024 * 1024),
+                "aciertos_memoria": self.aciertos_memoria,
+                "aciertos_disco": self.aciertos_disco,
+                "fallos": self.fallos,
+                "tasa_aciertos": (self.aciertos_memoria + self.aciertos_disco) / peticiones if peticiones else 0.0,
+                "expulsiones_disco": self.expulsiones_disco,
+            }
@@ -0,0 +1,120 @@
+import csv
+import os
+import tempfile
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+
+# Columnas de datos_meteorologicos en el orden en que se insertan
+COLUMNAS_DATOS = [
+    "id_descarga",
+    "fecha",
+    "indicativo",
+    "nombre",
+    "codigo_prov",
+    "altitud",
+    "tmed",
+    "tmin",
+    "tmax",
+    "prec",
+    "velmedia",
+    "racha",
+    "hrMedia",
+    "timestamp_extraccion",
+]
+
+# Clave primaria: una fila por estación y día
+CLAVE = ["fecha", "indicativo"]
+
+# Si la fila ya existe (p.ej. una ventana descargada dos veces), se sobrescribe
+_UPSERT = text(
+    f"INSERT INTO datos_meteorologicos ({', '.join(COLUMNAS_DATOS)})\n"
+    f"VALUES ({', '.join(':' + c for c in COLUMNAS_DATOS)})\n"
+    "ON DUPLICATE KEY UPDATE "
+    + ", ".join(f"{c} = VALUES({c})" for c in COLUMNAS_DATOS if c not in CLAVE)
+)
+
+# REPLACE borra e inserta la fila existente: equivale al upsert porque se cargan todas las columnas
+_LOAD_DATA = text(
+    "LOAD DATA LOCAL INFILE :ruta REPLACE INTO TABLE datos_meteorologicos\n"
+    "CHARACTER SET utf8mb4\n"
+    "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY ''\n"
+    "LINES TERMINATED BY '\\n'\n"
+    f"({', '.join(COLUMNAS_DATOS)})"
+)
+
+
+def _filas(df: pd.DataFrame) -> list:
+    """Convierte el DataFrame en diccionarios con None en lugar de NaN."""
+    df = df[COLUMNAS_DATOS].astype(object)
+    return df.where(df.notna(), None).to_dict("records")
+
+
+def cargar_executemany(conexion, df: pd.DataFrame, tamaño_lote: int = 5000) -> int:
+    """
+    Inserta o actualiza las filas en lotes con executemany, una transacción por lote.
+
+    PyMySQL reescribe cada lote como un único INSERT de varias filas, sin construir
+    en Python todas las sentencias a la vez como to_sql(method="multi").
+
+    Returns:
+        int: Filas enviadas.
+    """
+    filas = _filas(df)
+    for inicio in range(0, len(filas), tamaño_lote):
+        conexion.execute(_UPSERT, filas[inicio:inicio + tamaño_lote])
+        conexion.commit()
+    return len(filas)
+
+
+def cargar_load_data(conexion, df: pd.DataFrame, tamaño_lote: int = 100000) -> int:
+    """
+    Carga las filas con LOAD DATA LOCAL INFILE desde archivos temporales, una
+    transacción por lote. Requiere local_infile activado en el servidor y en la
+    conexión (local_infile = true en la sección [snowflake] de secrets.toml).
+
+    Returns:
+        int: Filas enviadas.
+    """
+    for inicio in range(0, len(df), tamaño_lote):
+        lote = df[COLUMNAS_DATOS].iloc[inicio:inicio + tamaño_lote].astype({"codigo_prov": "Int64"})
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="", encoding="utf-8") as f:
+            # Sin carácter de escape, LOAD DATA lee la palabra NULL sin comillas como NULL
+            lote.to_csv(f, index=False, header=False, na_rep="NULL",
+                        quoting=csv.QUOTE_MINIMAL, lineterminator="\n")
+            ruta = f.name
+        try:
+            conexion.execute(_LOAD_DATA, {"ruta": ruta})
+            conexion.commit()
+        finally:
+            os.remove(ruta)
+    return len(df)
+
+
+METODOS = {
+    "executemany": cargar_executemany,
+    "load_data": cargar_load_data,
+}
+
+
+def cargar(conexion, df: pd.DataFrame, metodo: str = "executemany", **opciones) -> float:
+    """
+    Carga un DataFrame en datos_meteorologicos con semántica de upsert.
+
+    Args:
+        conexion: Conexión SQLAlchemy abierta.
+        df (pd.DataFrame): Filas con las columnas de COLUMNAS_DATOS.
+        metodo (str): 'executemany' o 'load_data'.
+        **opciones: Se pasan al método (p.ej. tamaño_lote).
+
+    Returns:
+        float: Filas por segundo, para comparar métodos.
+    """
+    inicio = time.perf_counter()
+    filas = METODOS[metodo](conexion, df, **opciones)
+    segundos = time.perf_counter() - inicio
+    velocidad = filas / segundos if segundos else float("inf")
+    print(f"{filas} filas cargadas con {metodo} en {segundos:.1f} s ({velocidad:.0f} filas/s).")
+    return velocidad
@@ -0,0 +1,403 @@
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from src import conectar
+from src.comparador import DIAS_CALENDARIO, hueco
+
+
+# columnas: métricas con climatología. ventana: semiancho (días) de la ventana circular
+# con que se suavizan las normales. clases: histograma por estación y día del año del que
+# salen los percentiles (de minimo a maximo en pasos de ancho_clase, en la unidad de la métrica).
+CONFIG_CLIMATOLOGIA = conectar.leer_configuracion("climatologia", {
+    "columnas": ["tmed", "tmin", "tmax"],
+    "ventana": 15,
+    "minimo_lecturas": 10,
+    "minimo": -30.0,
+    "maximo": 50.0,
+    "ancho_clase": 0.5,
+})
+
+# Artefacto que mantiene popular.py y leen las páginas
+RUTA_CLIMATOLOGIA = os.path.join("data", "modelos", "climatologia.npz")
+
+# p5 de tmin y p95 de tmax son los umbrales de olas de frío y de calor (ver src/eventos.py)
+PERCENTILES = (5, 10, 50, 90, 95)
+
+_climatologia = (None, None)  # (fecha de modificación del artefacto, Climatologia)
+_cerrojo = threading.Lock()
+
+
+def _suavizar(x: np.ndarray, mitad: int) -> np.ndarray:
+    """Suma en una ventana circular de 2·mitad+1 días sobre el eje 1 (día del año)."""
+    extendido = np.concatenate([x[:, -mitad:], x, x[:, :mitad]], axis=1) if mitad else x
+    acumulado = np.cumsum(extendido, axis=1)
+    acumulado = np.concatenate([np.zeros_like(acumulado[:, :1]), acumulado], axis=1)
+    return acumulado[:, 2 * mitad + 1:2 * mitad + 1 + x.shape[1]] - acumulado[:, :x.shape[1]]
+
+
+def _percentiles_histograma(histograma: np.ndarray, minimo: float, ancho: float) -> np.ndarray:
+    """
+    Percentiles a partir de histogramas en el último eje, interpolando dentro de la clase.
+
+    Returns:
+        np.ndarray: Misma forma sin el último eje y con uno nuevo de len(PERCENTILES); NaN sin datos.
+    """
+    acumulado = np.cumsum(histograma, axis=-1, dtype=np.int64)
+    total = acumulado[..., -1]
+    resultado = np.full(total.shape + (len(PERCENTILES),), np.nan, dtype=np.float32)
+    for i, q in enumerate(PERCENTILES):
+        objetivo = q / 100 * total
+        clase = np.minimum((acumulado < objetivo[..., None]).sum(axis=-1), histograma.shape[-1] - 1)
+        anterior = np.where(clase > 0, np.take_along_axis(acumulado, np.maximum(clase - 1, 0)[..., None], -1)[..., 0], 0)
+        en_clase = np.take_along_axis(histograma, clase[..., None], -1)[..., 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fraccion = np.clip((objetivo - anterior) / en_clase, 0, 1)
+        resultado[..., i] = np.where(total > 0, minimo + (clase + fraccion) * ancho, np.nan)
+    return resultado
+
+
+@dataclass
+class Climatologia:
+    """
+    Normales y percentiles suavizados por estación (y provincia) y día del año.
+
+    Se guardan estadísticos aditivos por estación, día del año (366 huecos, ver
+    src/comparador.py) y métrica: suma, número de lecturas e histograma. Las normales y
+    los percentiles salen de sumarlos en una ventana circular de ±ventana días, así
+    que añadir días nuevos es sumar su aportación y volver a derivar, sin releer el
+    histórico. Las estaciones van agrupadas por provincia, y las normales de una
+    provincia son las de todas sus lecturas juntas.
+    """
+    columnas: list
+    estaciones: np.ndarray  # indicativo de cada fila
+    codigos_prov: np.ndarray  # codigo_prov de cada estación
+    hasta: date  # último día incluido
+    suma: np.ndarray = None  # float64 (estaciones × 366 × columnas)
+    n: np.ndarray = None  # int32, misma forma
+    histograma: np.ndarray = None  # uint16 (estaciones × 366 × columnas × clases)
+    derivados: dict = field(default_factory=dict)
+
+    @classmethod
+    def vacia(cls, estaciones, codigos_prov, columnas: list = None) -> "Climatologia":
+        columnas = list(columnas or CONFIG_CLIMATOLOGIA["columnas"])
+        orden = np.lexsort((np.asarray(estaciones, dtype=str), np.asarray(codigos_prov)))
+        forma = (len(orden), DIAS_CALENDARIO, len(columnas))
+        return cls(columnas, np.asarray(estaciones, dtype=str)[orden], np.asarray(codigos_prov)[orden], None,
+                   np.zeros(forma), np.zeros(forma, dtype=np.int32),
+                   np.zeros(forma + (_clases(),), dtype=np.uint16))
+
+    @classmethod
+    def desde_detalle(cls, detalle: pd.DataFrame, columnas: list = None) -> "Climatologia":
+        """Climatología completa a partir de filas (fecha, indicativo, codigo_prov, columnas)."""
+        detalle = detalle.dropna(subset=["fecha", "indicativo", "codigo_prov"])
+        estaciones = detalle.drop_duplicates("indicativo", keep="last")
+        return cls.vacia(estaciones["indicativo"], estaciones["codigo_prov"].astype(np.int64), columnas).añadir(detalle)
+
+    def añadir(self, detalle: pd.DataFrame) -> "Climatologia":
+        """
+        Suma la aportación de filas nuevas (fecha, indicativo, columnas) y vuelve a derivar.
+
+        Las filas deben ser de días posteriores a `hasta` y de estaciones conocidas; si no,
+        hay que construir de nuevo (ver actualizar_climatologia).
+        """
+        detalle = detalle.dropna(subset=["fecha", "indicativo"])
+        if detalle.empty:
+            return self
+        fila = pd.Index(self.estaciones).get_indexer(detalle["indicativo"].astype(str))
+        if (fila < 0).any():
+            raise ValueError("El lote trae estaciones que no están en la climatología")
+        fechas = pd.to_datetime(detalle["fecha"])
+        celda = fila * DIAS_CALENDARIO + hueco(fechas)
+
+        e, d, c = self.suma.shape
+        clases = self.histograma.shape[-1]
+        minimo, ancho = CONFIG_CLIMATOLOGIA["minimo"], CONFIG_CLIMATOLOGIA["ancho_clase"]
+        for j, columna in enumerate(self.columnas):
+            valores = detalle[columna].to_numpy(dtype=np.float64, na_value=np.nan)
+            presentes = ~np.isnan(valores)
+            indice = celda[presentes] * c + j
+            self.suma += np.bincount(indice, valores[presentes], minlength=e * d * c).reshape(e, d, c)
+            self.n += np.bincount(indice, minlength=e * d * c).reshape(e, d, c).astype(np.int32)
+            # Un bincount sobre (celda, métrica, clase) en plano; los extremos van a la primera y última clase
+            clase = np.clip(np.floor((valores[presentes] - minimo) / ancho + 1e-6), 0, clases - 1).astype(np.int64)
+            self.histograma += np.bincount(indice * clases + clase, minlength=e * d * c * clases).reshape(
+                e, d, c, clases).astype(np.uint16)
+
+        ultimo = fechas.max().date()
+        self.hasta = ultimo if self.hasta is None else max(self.hasta, ultimo)
+        self._derivar()
+        return self
+
+    def _derivar(self) -> None:
+        """Normales y percentiles suavizados, por estación y por provincia."""
+        mitad = CONFIG_CLIMATOLOGIA["ventana"]
+        minimo_lecturas = CONFIG_CLIMATOLOGIA["minimo_lecturas"]
+        minimo, ancho = CONFIG_CLIMATOLOGIA["minimo"], CONFIG_CLIMATOLOGIA["ancho_clase"]
+
+        suma, n = _suavizar(self.suma, mitad), _suavizar(self.n.astype(np.int64), mitad)
+        histograma = _suavizar(self.histograma.astype(np.int32), mitad)
+        provincias, limites = np.unique(self.codigos_prov, return_index=True)
+        niveles = {
+            "estacion": (suma, n, histograma),
+            "provincia": tuple(np.add.reduceat(x, limites, axis=0) for x in (suma, n, histograma)),
+        }
+        derivados = {"provincias": provincias}
+        for nivel, (s, m, h) in niveles.items():
+            suficientes = m >= minimo_lecturas
+            with np.errstate(invalid="ignore", divide="ignore"):
+                derivados[f"normal_{nivel}"] = np.where(suficientes, s / m, np.nan).astype(np.float32)
+            percentiles = _percentiles_histograma(h, minimo, ancho)
+            percentiles[~suficientes] = np.nan
+            derivados[f"percentiles_{nivel}"] = percentiles
+        self.derivados = derivados
+
+    def columna(self, nombre: str) -> int:
+        return self.columnas.index(nombre)
+
+    @property
+    def normal(self) -> np.ndarray:
+        """Normal suavizada (estaciones × 366 × columnas)."""
+        return self.derivados["normal_estacion"]
+
+    @property
+    def percentiles(self) -> np.ndarray:
+        """Percentiles PERCENTILES suavizados (estaciones × 366 × columnas × percentiles)."""
+        return self.derivados["percentiles_estacion"]
+
+    def umbral(self, columna: str, percentil: int) -> np.ndarray:
+        """Percentil suavizado de una columna por estación y día del año (estaciones × 366)."""
+        i = PERCENTILES.index(percentil)
+        return self.percentiles[:, :, self.columna(columna), i]
+
+    def normales_provincia(self, columna: str) -> pd.DataFrame:
+        """Normal y percentiles de cada provincia por día del año (índice hueco 0..365)."""
+        j = self.columna(columna)
+        provincias = self.derivados["provincias"]
+        partes = {"normal": self.derivados["normal_provincia"][:, :, j]}
+        for i, q in enumerate(PERCENTILES):
+            partes[f"p{q}"] = self.derivados["percentiles_provincia"][:, :, j, i]
+        indice = pd.MultiIndex.from_product([provincias, range(DIAS_CALENDARIO)], names=["codigo_prov", "hueco"])
+        return pd.DataFrame({k: v.ravel() for k, v in partes.items()}, index=indice)
+
+    @property
+    def nbytes_derivados(self) -> int:
+        return sum(a.nbytes for a in self.derivados.values())
+
+    def guardar(self, ruta: str = RUTA_CLIMATOLOGIA) -> None:
+        """Escribe el artefacto .npz comprimido (se reemplaza de forma atómica)."""
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            temporal, columnas=np.asarray(self.columnas), estaciones=self.estaciones, codigos_prov=self.codigos_prov,
+            hasta=np.datetime64(self.hasta, "D") if self.hasta else np.datetime64("NaT"),
+            suma=self.suma, n=self.n, histograma=self.histograma, **self.derivados,
+        )
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta: str = RUTA_CLIMATOLOGIA, estadisticos: bool = True) -> "Climatologia":
+        """
+        Lee el artefacto. Con estadisticos=False solo se cargan las normales y los
+        percentiles, que es lo que necesitan las páginas.
+        """
+        with np.load(ruta) as datos:
+            hasta = datos["hasta"]
+            derivados = {k: datos[k] for k in ("provincias", "normal_estacion", "percentiles_estacion",
+                                               "normal_provincia", "percentiles_provincia")}
+            return cls(
+                list(datos["columnas"].astype(str)), datos["estaciones"].astype(str), datos["codigos_prov"],
+                None if np.isnat(hasta) else hasta.item(),
+                datos["suma"] if estadisticos else None,
+                datos["n"] if estadisticos else None,
+                datos["histograma"] if estadisticos else None,
+                derivados,
+            )
+
+
+def _clases() -> int:
+    return int(round((CONFIG_CLIMATOLOGIA["maximo"] - CONFIG_CLIMATOLOGIA["minimo"]) / CONFIG_CLIMATOLOGIA["ancho_clase"]))
+
+
+def _leer_detalle(conexion=None, desde: date = None, columnas: list = None) -> pd.DataFrame:
+    """Filas (fecha, indicativo, codigo_prov, columnas) de MySQL o del almacén configurado."""
+    from src import extraer_datos
+
+    columnas = ["fecha", "indicativo", "codigo_prov"] + list(columnas or CONFIG_CLIMATOLOGIA["columnas"])
+    if conexion is None:
+        detalle = extraer_datos.leer_detalle(columnas)
+        if desde is not None and not detalle.empty:
+            detalle = detalle[pd.to_datetime(detalle["fecha"]) >= pd.Timestamp(desde)]
+        return detalle
+    sentencia = f"SELECT {', '.join(columnas)} FROM datos_meteorologicos" + (" WHERE fecha >= :desde" if desde else "")
+    return pd.read_sql(text(sentencia), conexion, params={"desde": desde} if desde else None)
+
+
+def construir(conexion=None) -> Climatologia:
+    """Climatología con todo el histórico; None si no hay datos."""
+    detalle = _leer_detalle(conexion)
+    if detalle.empty:
+        return None
+    return Climatologia.desde_detalle(detalle)
+
+
+_FECHAS_TOCADAS = text(
+    "SELECT MIN(fecha) AS desde FROM datos_meteorologicos WHERE id_descarga IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+
+
+def actualizar_climatologia(conexion, ids_descarga, ruta: str = RUTA_CLIMATOLOGIA) -> None:
+    """
+    Actualiza el artefacto tras una carga de popular.py.
+
+    Como en predicciones.actualizar_modelo: si la carga solo trae días posteriores al
+    último incluido y ninguna estación nueva, se suman sus estadísticos; si repite días
+    (la carga es un upsert) o cambian las estaciones, se construye de nuevo.
+    """
+    ids = [str(i) for i in ids_descarga]
+    if not ids:
+        return
+    inicio = time.perf_counter()
+    desde = conexion.execute(_FECHAS_TOCADAS, {"ids": ids}).scalar()
+    if desde is None:
+        return
+
+    climatologia = Climatologia.cargar(ruta) if os.path.exists(ruta) else None
+    modo = "completa"
+    if (climatologia is not None and climatologia.hasta is not None and desde > climatologia.hasta
+            and climatologia.columnas == list(CONFIG_CLIMATOLOGIA["columnas"])):
+        nuevos = _leer_detalle(conexion, desde)
+        if set(nuevos["indicativo"].dropna().astype(str)) <= set(climatologia.estaciones):
+            climatologia.añadir(nuevos)
+            modo = "incremental"
+    if modo == "completa":
+        climatologia = construir(conexion)
+    if climatologia is None:
+        return
+    climatologia.guardar(ruta)
+    print(f"Climatología actualizada ({modo}) hasta {climatologia.hasta} en {time.perf_counter() - inicio:.2f} s.")
+
+
+def climatologia_vigente(ruta: str = RUTA_CLIMATOLOGIA) -> Climatologia:
+    """
+    Retorna las normales y percentiles guardados, leídos de nuevo solo si el artefacto
+    ha cambiado. Si no existe, se construye con los datos disponibles y se guarda.
+    """
+    global _climatologia
+    with _cerrojo:
+        if not os.path.exists(ruta):
+            climatologia = construir()
+            if climatologia is None:
+                return None
+            climatologia.guardar(ruta)
+        modificado = os.path.getmtime(ruta)
+        if _climatologia[0] != modificado:
+            _climatologia = (modificado, Climatologia.cargar(ruta, estadisticos=False))
+        return _climatologia[1]
+
+
+def anomalias(cubo, climatologia: Climatologia, columna: str, fecha_inicio=None, fecha_fin=None) -> np.ndarray:
+    """
+    Anomalía de cada lectura del cubo respecto a la normal de su estación y día del año.
+
+    Es una resta vectorizada: la rebanada del cubo menos la normal indexada por el
+    hueco de cada día. Las estaciones sin climatología quedan en NaN.
+
+    Returns:
+        np.ndarray: float32 (estaciones del cubo × días del rango).
+    """
+    rango = cubo.rango(fecha_inicio, fecha_fin)
+    huecos = hueco(cubo.fechas[rango])
+    fila = pd.Index(climatologia.estaciones).get_indexer(cubo.estaciones)
+    normal = climatologia.normal[:, :, climatologia.columna(columna)]
+    normal = np.where(fila[:, None] >= 0, normal[np.maximum(fila, 0)][:, huecos], np.nan)
+    return cubo.valores[:, rango, cubo.metrica(columna)] - normal
+
+
+def anomalia_provincias(cubo, climatologia: Climatologia, columna: str, fecha_inicio=None, fecha_fin=None) -> pd.Series:
+    """
+    Anomalía media por provincia en un rango: media de las anomalías de todas sus lecturas.
+
+    Returns:
+        pd.Series: Índice codigo_prov; NaN en las provincias sin datos en el rango.
+    """
+    diferencia = anomalias(cubo, climatologia, columna, fecha_inicio, fecha_fin)
+    presentes = ~np.isnan(diferencia)
+    limites = cubo._limites_provincias()
+    suma = np.add.reduceat(np.where(presentes, diferencia, 0).astype(np.float64).sum(axis=1), limites)
+    n = np.add.reduceat(presentes.sum(axis=1), limites)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.Series(suma / n, index=pd.Index(cubo.codigos_prov, name="codigo_prov"), name=columna)
+
+
+if __name__ == "__main__":
+    # python -m src.climatologia [años]
+    # Construcción, actualización incremental y anomalías por rango frente a recalcular con pandas.
+    from src.cubo import CuboMeteorologico, _detalle_sintetico
+
+    años = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    detalle, provincias = _detalle_sintetico(55, años * 365 + años // 4)
+    fechas = pd.to_datetime(detalle["fecha"])
+    print(f"{años} años: {len(detalle)} filas.")
+
+    inicio = time.perf_counter()
+    corte = fechas.max() - pd.Timedelta(days=30)
+    climatologia = Climatologia.desde_detalle(detalle[fechas <= corte])
+    print(f"Construcción: {time.perf_counter() - inicio:.2f} s; normales y percentiles "
+          f"{climatologia.nbytes_derivados / 2**20:.1f} MB")
+
+    inicio = time.perf_counter()
+    climatologia.añadir(detalle[fechas > corte])
+    print(f"Actualización incremental (30 días): {time.perf_counter() - inicio:.2f} s")
+    completa = Climatologia.desde_detalle(detalle)
+    assert np.allclose(completa.normal, climatologia.normal, equal_nan=True)
+
+    ruta = os.path.join("data", "modelos", "climatologia_prueba.npz")
+    climatologia.guardar(ruta)
+    print(f"Artefacto: {os.path.getsize(ruta) / 2**20:.1f} MB")
+    os.remove(ruta)
+
+    # Normal sin suavizar de una estación y hueco, comprobada con pandas
+    j = climatologia.columna("tmed")
+    dia = fechas.dt.month.eq(7) & fechas.dt.day.eq(15) & detalle["indicativo"].eq(climatologia.estaciones[0])
+    assert np.isclose(detalle.loc[dia, "tmed"].sum(), climatologia.suma[0, hueco(["2024-07-15"])[0], j])
+
+    cubo = CuboMeteorologico.desde_detalle(detalle, provincias)
+    desde, hasta = fechas.max() - pd.Timedelta(days=364), fechas.max()
+
+    def con_pandas():
+        """Normal por estación y día del año desde todo el histórico y anomalía del rango."""
+        dia_año = hueco(fechas)
+        ventana = CONFIG_CLIMATOLOGIA["ventana"]
+        medias = detalle.assign(h=dia_año).groupby(["indicativo", "h"])["tmed"].agg(["sum", "count"])
+        medias = medias.unstack("h").reindex(columns=pd.MultiIndex.from_product([["sum", "count"], range(DIAS_CALENDARIO)]), fill_value=0)
+        # fill_value solo rellena las columnas añadidas: los huecos sin lecturas de las
+        # columnas que ya existían quedan en NaN y _suavizar los propagaría
+        medias = medias.fillna(0)
+        s = _suavizar(medias["sum"].to_numpy()[:, :, None], ventana)[:, :, 0]
+        n = _suavizar(medias["count"].to_numpy()[:, :, None], ventana)[:, :, 0]
+        normal = pd.DataFrame(s / n, index=medias.index)
+        rango = detalle[(fechas >= desde) & (fechas <= hasta)]
+        h = hueco(rango["fecha"])
+        anomalia = rango["tmed"].to_numpy() - normal.to_numpy()[normal.index.get_indexer(rango["indicativo"]), h]
+        return pd.Series(anomalia).groupby(rango["codigo_prov"].to_numpy()).mean()
+
+    referencia = con_pandas()
+    resultado = anomalia_provincias(cubo, climatologia, "tmed", desde, hasta)
+    assert np.allclose(referencia.to_numpy(), resultado.loc[referencia.index].to_numpy(), atol=1e-3)
+
+    inicio = time.perf_counter()
+    for _ in range(3):
+        con_pandas()
+    print(f"Recalculando normales y anomalía con pandas: {(time.perf_counter() - inicio) / 3 * 1000:.0f} ms")
+    inicio = time.perf_counter()
+    for _ in range(50):
+        anomalia_provincias(cubo, climatologia, "tmed", desde, hasta)
+    print(f"Anomalía por provincia de un año con las normales guardadas: {(time.perf_counter() - inicio) / 50 * 1000:.2f} ms")
@@ -0,0 +1,285 @@
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from src.cubo import CuboMeteorologico
+
+
+# Huecos por año en la rejilla de calendario: el año bisiesto entero, con el 29 de
+# febrero vacío en los demás años, para que cada mes-día caiga siempre en el mismo hueco
+DIAS_CALENDARIO = 366
+_INICIO_MES = np.cumsum([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[:-1]
+
+_comparadores = (None, {})  # (cubo del que salen, {métrica: Comparador})
+_cerrojo = threading.Lock()
+
+
+def hueco(fechas) -> np.ndarray:
+    """Posición 0..365 de cada fecha en el calendario bisiesto (el 1 de marzo es siempre 60)."""
+    fechas = pd.DatetimeIndex(pd.to_datetime(fechas))
+    return _INICIO_MES[fechas.month.to_numpy() - 1] + fechas.day.to_numpy() - 1
+
+
+@dataclass
+class Comparacion:
+    """
+    Resultado de comparar dos periodos alineados por día del año.
+
+    - diaria: una fila por día del periodo A con fecha_a, fecha_b, a, b, diferencia (b − a) y
+      los datos (lecturas) de cada lado.
+    - mensual: una fila por mes del periodo A con las medias de cada periodo y su diferencia.
+    - total: medias de cada periodo y diferencia.
+    """
+    metrica: str
+    provincias: tuple
+    diaria: pd.DataFrame
+    mensual: pd.DataFrame
+    total: pd.Series
+
+    @property
+    def vacia(self) -> bool:
+        return self.diaria[["a", "b"]].isna().all().any()
+
+
+class Comparador:
+    """
+    Sumas y número de lecturas por provincia y día de una métrica, en una rejilla de
+    calendario (provincias × años·366) precalculada a partir del cubo.
+
+    Un periodo es un tramo contiguo de la rejilla y el mismo mes-día de otro año está
+    siempre a un múltiplo de 366 huecos, así que alinear dos periodos por día del año
+    es tomar dos rebanadas de la misma longitud y restarlas.
+    """
+
+    def __init__(self, cubo: CuboMeteorologico, metrica: str):
+        self.metrica = metrica
+        self.codigos_prov = cubo.codigos_prov
+        self._fila_prov = {int(codigo): i for i, codigo in enumerate(cubo.codigos_prov)}
+        self.año0 = cubo.inicio.year
+        años = cubo.fin.year - self.año0 + 1
+
+        fechas = cubo.fechas
+        posiciones = self._posicion(fechas)
+        suma, n = cubo.diario_provincias(metrica)
+        self.suma = np.zeros((len(self.codigos_prov), años * DIAS_CALENDARIO))
+        self.n = np.zeros(self.suma.shape, dtype=np.int32)
+        self.suma[:, posiciones] = suma
+        self.n[:, posiciones] = n
+        # Fila de toda España ya sumada, para no sumar 52 filas en cada comparación
+        self.suma_total = self.suma.sum(axis=0)
+        self.n_total = self.n.sum(axis=0)
+
+        # Fecha de cada hueco (NaT en el 29 de febrero de los años no bisiestos)
+        self.fechas = np.full(self.suma.shape[1], np.datetime64("NaT"), dtype="datetime64[D]")
+        todas = pd.date_range(date(self.año0, 1, 1), date(self.año0 + años - 1, 12, 31), freq="D")
+        self.fechas[self._posicion(todas)] = todas.to_numpy(dtype="datetime64[D]")
+
+    def _posicion(self, fechas) -> np.ndarray:
+        """Posición de cada fecha en la rejilla."""
+        fechas = pd.DatetimeIndex(pd.to_datetime(fechas))
+        return (fechas.year.to_numpy() - self.año0) * DIAS_CALENDARIO + hueco(fechas)
+
+    def _posicion_fecha(self, fecha) -> int:
+        """Posición de una sola fecha, sin pasar por arrays (es lo que se hace en cada comparación)."""
+        fecha = pd.Timestamp(fecha)
+        return (fecha.year - self.año0) * DIAS_CALENDARIO + int(_INICIO_MES[fecha.month - 1]) + fecha.day - 1
+
+    def _tramo(self, inicio, fin) -> tuple:
+        """(primera posición, longitud) de un periodo en la rejilla."""
+        desde = self._posicion_fecha(inicio)
+        return desde, self._posicion_fecha(fin) - desde + 1
+
+    def _sumas(self, provincias: tuple, desde: int, longitud: int) -> tuple:
+        """Suma y lecturas por día en un tramo, de toda España o de las provincias indicadas."""
+        rebanada = slice(max(desde, 0), max(desde + longitud, 0))
+        if provincias:
+            filas = [self._fila_prov[int(c)] for c in provincias if int(c) in self._fila_prov]
+            suma, n = self.suma[filas, rebanada].sum(axis=0), self.n[filas, rebanada].sum(axis=0)
+        else:
+            suma, n = self.suma_total[rebanada], self.n_total[rebanada]
+        # Lo que cae fuera de la rejilla se rellena con días sin lecturas (un periodo
+        # anterior a la rejilla queda entero delante)
+        delante = min(rebanada.start - desde, longitud)
+        detras = longitud - delante - len(suma)
+        if delante or detras:
+            suma = np.pad(suma, (delante, detras))
+            n = np.pad(n, (delante, detras))
+        return suma, n
+
+    def _fechas(self, desde: int, longitud: int) -> np.ndarray:
+        """Fecha de cada hueco de un tramo (NaT fuera de la rejilla)."""
+        posiciones = np.arange(desde, desde + longitud)
+        dentro = (posiciones >= 0) & (posiciones < len(self.fechas))
+        fechas = np.full(longitud, np.datetime64("NaT"), dtype="datetime64[D]")
+        fechas[dentro] = self.fechas[posiciones[dentro]]
+        return fechas
+
+    def comparar(self, periodo_a: tuple, periodo_b: tuple, provincias: tuple = ()) -> Comparacion:
+        """
+        Compara dos periodos día a día, alineados por día del año.
+
+        El día i del periodo A se empareja con el día del periodo B que ocupa el mismo
+        hueco del calendario (mismo mes y día si ambos empiezan el mismo mes-día). Si los
+        periodos tienen distinta longitud se compara la más corta.
+
+        Args:
+            periodo_a (tuple): (fecha_inicio, fecha_fin) del periodo de referencia.
+            periodo_b (tuple): (fecha_inicio, fecha_fin) del periodo a comparar.
+            provincias (tuple): codigo_prov a incluir; toda España si está vacío.
+
+        Returns:
+            Comparacion: Series diarias, medias mensuales y totales; b − a en las diferencias.
+        """
+        desde_a, largo_a = self._tramo(*periodo_a)
+        desde_b, largo_b = self._tramo(*periodo_b)
+        longitud = max(min(largo_a, largo_b), 0)
+        suma_a, n_a = self._sumas(provincias, desde_a, longitud)
+        suma_b, n_b = self._sumas(provincias, desde_b, longitud)
+
+        # Fechas de cada hueco; los 29 de febrero inexistentes del periodo A (y lo que cae
+        # fuera de la rejilla) quedan en NaT y se descartan
+        fechas_a, fechas_b = self._fechas(desde_a, longitud), self._fechas(desde_b, longitud)
+        validos = ~np.isnat(fechas_a)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            a, b = suma_a / n_a, suma_b / n_b
+            diaria = pd.DataFrame({
+                "fecha_a": fechas_a, "fecha_b": fechas_b,
+                "a": a, "b": b, "diferencia": b - a,
+                "n_a": n_a, "n_b": n_b,
+            })[validos].reset_index(drop=True)
+
+            # Medias mensuales ponderadas por lecturas, como AVG sobre el detalle
+            mes = pd.DatetimeIndex(diaria["fecha_a"]).to_period("M")
+            grupos, meses = pd.factorize(mes)
+            sumas = np.stack([np.bincount(grupos, w, minlength=len(meses))
+                              for w in (suma_a[validos], n_a[validos], suma_b[validos], n_b[validos])])
+            mensual = pd.DataFrame({
+                "mes": meses.to_timestamp(),
+                "a": sumas[0] / sumas[1], "b": sumas[2] / sumas[3],
+                "n_a": sumas[1].astype(np.int64), "n_b": sumas[3].astype(np.int64),
+            })
+            mensual.insert(3, "diferencia", mensual["b"] - mensual["a"])
+
+            media_a, media_b = suma_a.sum() / n_a.sum(), suma_b.sum() / n_b.sum()
+        total = pd.Series({"a": media_a, "b": media_b, "diferencia": media_b - media_a,
+                           "n_a": int(n_a.sum()), "n_b": int(n_b.sum())})
+        return Comparacion(self.metrica, tuple(provincias), diaria, mensual, total)
+
+
+def conclusiones(comparacion: Comparacion, unidad: str = "") -> list:
+    """
+    Frases con la diferencia media y los meses con más y menos diferencia.
+
+    Sustituyen a los textos fijos: se calculan con la comparación que se esté viendo.
+    """
+    total, mensual = comparacion.total, comparacion.mensual.dropna(subset=["diferencia"])
+    if comparacion.vacia or mensual.empty:
+        return ["No hay datos suficientes en alguno de los dos periodos."]
+    signo = "más alta" if total["diferencia"] > 0 else "más baja"
+    frases = [f"La media del periodo B es **{abs(total['diferencia']):.2f} {unidad}** {signo} que la del periodo A "
+              f"({total['b']:.2f} frente a {total['a']:.2f} {unidad})."]
+    if len(mensual) > 1:
+        sube, baja = mensual.loc[mensual["diferencia"].idxmax()], mensual.loc[mensual["diferencia"].idxmin()]
+        frases.append(f"Mayor subida: **{sube['mes']:%m/%Y}** ({sube['diferencia']:+.2f} {unidad}).")
+        frases.append(f"Mayor bajada: **{baja['mes']:%m/%Y}** ({baja['diferencia']:+.2f} {unidad}).")
+        contrarios = mensual[np.sign(mensual["diferencia"]) == -np.sign(total["diferencia"])]
+        if 0 < len(contrarios) < len(mensual):
+            lista = ", ".join(f"{m:%m/%Y}" for m in contrarios["mes"])
+            frases.append(f"Meses que van en sentido contrario a la media: {lista}.")
+    return frases
+
+
+def comparador_vigente(metrica: str) -> Comparador:
+    """
+    Retorna el Comparador de una métrica sobre el cubo vigente.
+
+    La rejilla se precalcula una vez por métrica y versión de los datos; cada
+    comparación solo recorta y resta.
+    """
+    global _comparadores
+    from src import cubo
+
+    actual = cubo.cubo_vigente()
+    if actual is None:
+        return None
+    with _cerrojo:
+        if _comparadores[0] is not actual:
+            _comparadores = (actual, {})
+        if metrica not in _comparadores[1]:
+            _comparadores[1][metrica] = Comparador(actual, metrica)
+        return _comparadores[1][metrica]
+
+
+if __name__ == "__main__":
+    # python -m src.comparador [años]
+    # Latencia por comparación con la rejilla precalculada frente a filtrar el detalle.
+    from src.cubo import _detalle_sintetico
+
+    años = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    detalle, provincias = _detalle_sintetico(55, años * 365 + años // 4)
+    cubo_prueba = CuboMeteorologico.desde_detalle(detalle, provincias)
+    print(f"{años} años: {len(detalle)} filas, {cubo_prueba.forma[0]} estaciones, "
+          f"{cubo_prueba.inicio} – {cubo_prueba.fin}.")
+
+    inicio = time.perf_counter()
+    comparador = Comparador(cubo_prueba, "tmed")
+    print(f"Rejilla precalculada en {(time.perf_counter() - inicio) * 1000:.1f} ms "
+          f"({(comparador.suma.nbytes + comparador.n.nbytes) / 2**20:.1f} MB)")
+
+    fechas = pd.to_datetime(detalle["fecha"])
+
+    def con_pandas(periodo_a, periodo_b, codigos):
+        """Filtrar el detalle, agregar por día y alinear por mes-día, como haría una consulta nueva."""
+        lados = []
+        for desde, hasta in (periodo_a, periodo_b):
+            mascara = (fechas >= pd.Timestamp(desde)) & (fechas <= pd.Timestamp(hasta))
+            if codigos:
+                mascara &= detalle["codigo_prov"].isin(codigos)
+            diario = detalle[mascara].groupby(fechas[mascara])["tmed"].mean()
+            lados.append(diario.set_axis(diario.index.strftime("%m-%d")))
+        return lados[0].to_frame("a").join(lados[1].rename("b"), how="outer").eval("diferencia = b - a")
+
+    rng = np.random.default_rng(1)
+    casos = []
+    for _ in range(200):
+        a, b = sorted(rng.choice(np.arange(cubo_prueba.inicio.year + 1, cubo_prueba.fin.year), 2, replace=False))
+        codigos = tuple(rng.choice(np.arange(1, 53), rng.integers(0, 4), replace=False))
+        casos.append(((date(a, 1, 1), date(a, 12, 31)), (date(b, 1, 1), date(b, 12, 31)), codigos))
+
+    # Comprobación: mismos valores que con pandas
+    periodo_a, periodo_b, codigos = casos[0]
+    referencia = con_pandas(periodo_a, periodo_b, list(codigos))
+    resultado = comparador.comparar(periodo_a, periodo_b, codigos)
+    claves = pd.DatetimeIndex(resultado.diaria["fecha_a"]).strftime("%m-%d")
+    assert np.allclose(referencia.loc[claves, "a"].to_numpy(), resultado.diaria["a"].to_numpy(), atol=1e-4, equal_nan=True)
+    assert np.allclose(referencia.loc[claves, "b"].to_numpy(), resultado.diaria["b"].to_numpy(), atol=1e-4, equal_nan=True)
+
+    # Periodos fuera de la rejilla, antes o después: sin lecturas, no un error
+    antes, despues = cubo_prueba.inicio.year - 2, cubo_prueba.fin.year + 2
+    for fuera in ((date(antes, 1, 1), date(antes, 1, 10)), (date(despues, 1, 1), date(despues, 1, 10))):
+        assert comparador.comparar(fuera, periodo_b).vacia
+        assert comparador.comparar(periodo_a, fuera).diaria["b"].isna().all()
+
+    inicio = time.perf_counter()
+    for periodo_a, periodo_b, codigos in casos[:20]:
+        con_pandas(periodo_a, periodo_b, list(codigos))
+    print(f"Filtrando el detalle: {(time.perf_counter() - inicio) / 20 * 1000:.2f} ms por comparación")
+
+    inicio = time.perf_counter()
+    for periodo_a, periodo_b, codigos in casos:
+        comparador.comparar(periodo_a, periodo_b, codigos)
+    print(f"Con la rejilla: {(time.perf_counter() - inicio) / len(casos) * 1000:.2f} ms por comparación "
+          f"(series diarias, mensuales y totales)")
+
+    inicio = time.perf_counter()
+    for periodo_a, periodo_b, codigos in casos:
+        desde_a, largo = comparador._tramo(*periodo_a)
+        desde_b, _ = comparador._tramo(*periodo_b)
+        comparador._sumas(codigos, desde_b, largo)[0] - comparador._sumas(codigos, desde_a, largo)[0]
+    print(f"Solo la resta alineada: {(time.perf_counter() - inicio) / len(casos) * 1e6:.0f} µs por comparación")
@@ -0,0 +1,97 @@
+import sys
+from datetime import date
+
+from src import conectar
+from src.consultas import ConsultaMeteorologica
+
+# Comprueba con EXPLAIN que las consultas que emite extraer_datos usan los índices
+# de data/migraciones y, si la tabla está particionada, que solo leen las
+# particiones del año consultado. Uso: python -m src.comprobar_indices
+
+# Índices cubrientes creados por la migración 001
+INDICES_CUBRIENTES = {"idx_dm_prov_fecha", "idx_dm_fecha_prov"}
+
+# (descripción, consulta, {tabla del plan: índices aceptables}, particiones esperadas en 'd')
+CASOS = [
+    (
+        "Rango de fechas, todas las provincias",
+        ConsultaMeteorologica().entre_fechas(date(2024, 1, 1), date(2024, 6, 30)),
+        {"d": INDICES_CUBRIENTES},
+        "p2024",
+    ),
+    (
+        "Rango de fechas, provincias seleccionadas",
+        ConsultaMeteorologica().entre_fechas(date(2024, 1, 1), date(2024, 6, 30)).de_provincias([28, 8]),
+        {"d": {"idx_dm_prov_fecha"}},
+        "p2024",
+    ),
+    (
+        "Un solo día",
+        ConsultaMeteorologica().en_fecha(date(2024, 1, 15)),
+        {"d": INDICES_CUBRIENTES},
+        "p2024",
+    ),
+    (
+        "Rango de fechas desde los resúmenes",
+        ConsultaMeteorologica().entre_fechas(date(2023, 6, 15), date(2025, 2, 10)).desde("resumen"),
+        {"resumen_mensual_provincia": {"PRIMARY"}, "resumen_diario_provincia": {"PRIMARY"}},
+        None,
+    ),
+    (
+        "Un solo día desde los resúmenes",
+        ConsultaMeteorologica().en_fecha(date(2024, 1, 15)).desde("resumen"),
+        {"d": {"PRIMARY"}},
+        None,
+    ),
+]
+
+
+def comprobar_plan(plan: list, indices: dict, particiones: str) -> list:
+    """
+    Revisa las filas de un EXPLAIN.
+
+    Args:
+        plan (list): Filas del EXPLAIN como diccionarios.
+        indices (dict): Tabla del plan -> conjunto de índices aceptables.
+        particiones (str): Particiones que debe leer la tabla 'd' (None para no comprobarlo).
+
+    Returns:
+        list: Descripción de cada problema encontrado (vacía si todo es correcto).
+    """
+    problemas = []
+    for tabla, aceptables in indices.items():
+        filas = [f for f in plan if f["table"] == tabla]
+        if not filas:
+            problemas.append(f"la tabla '{tabla}' no aparece en el plan")
+            continue
+        for fila in filas:
+            if fila["key"] not in aceptables:
+                problemas.append(f"'{tabla}' usa el índice {fila['key']} en lugar de {sorted(aceptables)}")
+            elif aceptables <= INDICES_CUBRIENTES and "Using index" not in (fila["Extra"] or ""):
+                problemas.append(f"'{tabla}' usa {fila['key']} pero no como índice cubriente")
+            if particiones and tabla == "d" and fila["partitions"] is not None:
+                if fila["partitions"] != particiones:
+                    problemas.append(f"'{tabla}' lee las particiones {fila['partitions']} en lugar de {particiones}")
+    return problemas
+
+
+def comprobar() -> list:
+    """Ejecuta EXPLAIN sobre cada caso y retorna la lista de problemas."""
+    problemas = []
+    with conectar.abrir_conexion() as conexion:
+        for descripcion, consulta, indices, particiones in CASOS:
+            sentencia, params = consulta.construir(explicar=True)
+            plan = [dict(fila) for fila in conexion.execute(sentencia, params).mappings()]
+            encontrados = comprobar_plan(plan, indices, particiones)
+            estado = "OK" if not encontrados else "FALLO"
+            print(f"[{estado}] {descripcion}")
+            for problema in encontrados:
+                print(f"    - {problema}")
+            problemas.extend(f"{descripcion}: {p}" for p in encontrados)
+    return problemas
+
+
+if __name__ == "__main__":
+    if comprobar():
+        sys.exit(1)
+    print("Todas las consultas usan los índices esperados.")
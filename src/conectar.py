@@ -1,17 +1,120 @@
+import threading
+import time
+from contextlib import contextmanager
+
 import streamlit as st
 
 from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
 
 
-def conexion():
-    """Retorna una nueva conexión desde el motor."""
-    usuario = st.secrets["snowflake"]["user"]
-    pw = st.secrets["snowflake"]["password"]
-    bd = st.secrets["snowflake"]["name"]
-    servidor = st.secrets["snowflake"]["host"]
-    puerto = st.secrets["snowflake"]["port"]
-
-    motor = create_engine(f"mysql+pymysql://{usuario}:{pw}@{servidor}:{puerto}/{bd}")
-    # Abrir una conexión
+# Valores por defecto del pool. Se pueden sobrescribir con una sección [pool]
+# en secrets.toml (p.ej. pool_size = 10).
+CONFIG_POOL = {
+    "pool_size": 5,  # Conexiones que se mantienen abiertas
+    "max_overflow": 10,  # Conexiones extra permitidas en picos de uso
+    "pool_timeout": 30,  # Segundos máximos esperando una conexión libre
+    "pool_recycle": 1800,  # Segundos antes de renovar una conexión (wait_timeout de MySQL)
+    "pool_pre_ping": True,  # Comprueba la conexión antes de entregarla
+}
+
+# Un único motor por proceso, compartido por todas las sesiones de Streamlit
+_motor = None
+_cerrojo = threading.Lock()
+
+# Tiempos de espera al pedir conexiones al pool
+_esperas = {"peticiones": 0, "espera_total": 0.0, "espera_max": 0.0}
+
+
+def leer_configuracion(seccion: str, por_defecto: dict) -> dict:
+    """
+    Combina unos valores por defecto con una sección opcional de secrets.toml.
+
+    Args:
+        seccion (str): Nombre de la sección (p.ej. "pool").
+        por_defecto (dict): Valores usados si la sección o el archivo no existen.
+
+    Returns:
+        dict: Configuración resultante.
+    """
+    config = dict(por_defecto)
+    try:
+        if seccion in st.secrets:
+            config.update(st.secrets[seccion])
+    except Exception:
+        # Sin secrets.toml se trabaja con los valores por defecto
+        pass
+    return config
+
+
+def obtener_motor():
+    """Retorna el motor compartido del proceso, creándolo la primera vez."""
+    global _motor
+    if _motor is None:
+        with _cerrojo:
+            if _motor is None:
+                usuario = st.secrets["snowflake"]["user"]
+                pw = st.secrets["snowflake"]["password"]
+                bd = st.secrets["snowflake"]["name"]
+                servidor = st.secrets["snowflake"]["host"]
+                puerto = st.secrets["snowflake"]["port"]
+                # Necesario solo para cargar con LOAD DATA LOCAL INFILE (src/carga_masiva.py)
+                local_infile = st.secrets["snowflake"].get("local_infile", False)
+
+                _motor = create_engine(
+                    f"mysql+pymysql://{usuario}:{pw}@{servidor}:{puerto}/{bd}",
+                    poolclass=QueuePool,
+                    connect_args={"local_infile": local_infile},
+                    **leer_configuracion("pool", CONFIG_POOL),
+                )
+    return _motor
+
+
+@contextmanager
+def abrir_conexion():
+    """
+    Toma una conexión del pool y la devuelve al salir del bloque `with`.
+
+    Yields:
+        sqlalchemy.engine.Connection: Conexión prestada por el pool.
+    """
+    motor = obtener_motor()
+    inicio = time.perf_counter()
     conectar = motor.connect()
-    return conectar
+    espera = time.perf_counter() - inicio
+    with _cerrojo:
+        _esperas["peticiones"] += 1
+        _esperas["espera_total"] += espera
+        _esperas["espera_max"] = max(_esperas["espera_max"], espera)
+    try:
+        yield conectar
+    finally:
+        conectar.close()
+
+
+def conexion():
+    """Retorna una conexión del pool compartido. Quien la use debe cerrarla."""
+    return obtener_motor().connect()
+
+
+def estadisticas_pool() -> dict:
+    """
+    Retorna el estado actual del pool para dimensionarlo con varias sesiones abiertas.
+
+    Returns:
+        dict: Tamaño, conexiones prestadas, libres, desbordamiento y tiempos de espera (s).
+    """
+    pool = obtener_motor().pool
+    with _cerrojo:
+        peticiones = _esperas["peticiones"]
+        espera_total = _esperas["espera_total"]
+        espera_max = _esperas["espera_max"]
+    return {
+        "tamaño": pool.size(),
+        "prestadas": pool.checkedout(),
+        "libres": pool.checkedin(),
+        "desbordamiento": pool.overflow(),
+        "peticiones": peticiones,
+        "espera_media": espera_total / peticiones if peticiones else 0.0,
+        "espera_max": espera_max,
+    }
@@ -0,0 +1,261 @@
+from dataclasses import dataclass, replace
+from datetime import date, timedelta
+from functools import lru_cache
+
+from sqlalchemy import bindparam, text
+
+
+# Métricas agregables: nombre -> expresión SQL. La expresión se usa también como
+# nombre de la columna resultante, que es el que esperan las páginas.
+METRICAS = {
+    "altitud": "AVG(d.altitud)",
+    "tmed": "AVG(d.tmed)",
+    "tmin": "AVG(d.tmin)",
+    "tmax": "AVG(d.tmax)",
+    "prec": "AVG(d.prec)",
+    "racha": "AVG(d.racha) * 3.6",
+    "hrMedia": "AVG(d.hrMedia)",
+}
+
+# Las mismas métricas calculadas sobre los resúmenes (sumas y conteos), con idéntico
+# nombre de columna. La media de un rango es exacta: SUM(sumas) / SUM(conteos).
+METRICAS_RESUMEN = {
+    m: f"SUM(d.suma_{m}) / NULLIF(SUM(d.n_{m}), 0)" + (" * 3.6" if m == "racha" else "")
+    for m in METRICAS
+}
+
+# Columnas que se leen de los resúmenes
+_COLUMNAS_RESUMEN = ", ".join(f"suma_{m}, n_{m}" for m in METRICAS)
+
+# Nivel de agrupación -> (columnas identificativas, claves del GROUP BY)
+NIVELES = {
+    "provincia": (["p.nombre", "d.codigo_prov"], ["d.codigo_prov", "p.nombre"]),
+    "comunidad": (["c.nombre", "p.codigo_ca"], ["p.codigo_ca", "c.nombre"]),
+}
+
+
+def _origen(fuente: str, filtro_fecha: str) -> str:
+    """
+    Tabla (o subconsulta) de la que se leen las filas, siempre con alias `d`.
+
+    Con fuente 'resumen', un rango se responde con los meses completos del resumen
+    mensual más los días sueltos de los extremos desde el resumen diario.
+    """
+    if fuente == "detalle":
+        return "datos_meteorologicos AS d"
+    if filtro_fecha == "dia":
+        return "resumen_diario_provincia AS d"
+    if filtro_fecha == "rango":
+        return (
+            "(\n"
+            f"    SELECT codigo_prov, {_COLUMNAS_RESUMEN}\n"
+            "    FROM resumen_mensual_provincia\n"
+            "    WHERE mes BETWEEN :mes_desde AND :mes_hasta\n"
+            "    UNION ALL\n"
+            f"    SELECT codigo_prov, {_COLUMNAS_RESUMEN}\n"
+            "    FROM resumen_diario_provincia\n"
+            "    WHERE fecha BETWEEN :fecha_inicio AND :fecha_fin\n"
+            "      AND NOT (fecha BETWEEN :mes_desde AND :fin_mes_hasta)\n"
+            ") AS d"
+        )
+    return "resumen_mensual_provincia AS d"
+
+
+def _meses_completos(fecha_inicio: date, fecha_fin: date) -> tuple:
+    """
+    Meses completos contenidos en [fecha_inicio, fecha_fin].
+
+    Returns:
+        tuple: (primer día del primer mes, primer día del último mes, último día del último mes).
+               Si no hay ninguno, un intervalo vacío posterior a fecha_fin.
+    """
+    if fecha_inicio.day == 1:
+        mes_desde = fecha_inicio
+    else:
+        mes_desde = (fecha_inicio.replace(day=1) + timedelta(days=32)).replace(day=1)
+    fin_mes_hasta = (fecha_fin + timedelta(days=1)).replace(day=1) - timedelta(days=1)
+    if fin_mes_hasta < mes_desde:
+        return fecha_fin + timedelta(days=1), fecha_fin, fecha_fin
+    return mes_desde, fin_mes_hasta.replace(day=1), fin_mes_hasta
+
+
+def _a_fecha(valor) -> date:
+    """Admite fechas, datetimes o textos 'AAAA-MM-DD'."""
+    if isinstance(valor, str):
+        return date.fromisoformat(valor[:10])
+    if hasattr(valor, "date"):
+        return valor.date()
+    return valor
+
+
+@lru_cache(maxsize=None)
+def _sentencia(metricas: tuple, nivel: str, filtro_fecha: str, con_provincias: bool, con_comunidades: bool,
+               fuente: str = "detalle", prefijo: str = ""):
+    """
+    Construye (una sola vez por forma) la sentencia parametrizada.
+
+    Dos consultas con la misma forma comparten exactamente el mismo texto SQL;
+    solo cambian los valores ligados.
+    """
+    expresiones = METRICAS if fuente == "detalle" else METRICAS_RESUMEN
+    columnas, agrupacion = NIVELES[nivel]
+    seleccion = columnas + [f"{expresiones[m]} AS `{METRICAS[m]}`" for m in metricas]
+
+    consulta = (
+        prefijo + "SELECT " + ",\n".join(seleccion) + "\n"
+        f"FROM {_origen(fuente, filtro_fecha)}\n"
+        "JOIN provincias AS p ON d.codigo_prov = p.codigo_prov\n"
+    )
+    if nivel == "comunidad":
+        consulta += "JOIN comunidades AS c ON p.codigo_ca = c.codigo_ca\n"
+
+    condiciones = []
+    if filtro_fecha == "dia":
+        condiciones.append("d.fecha = :fecha")
+    elif filtro_fecha == "rango" and fuente == "detalle":
+        condiciones.append("d.fecha BETWEEN :fecha_inicio AND :fecha_fin")
+    if con_provincias:
+        condiciones.append("d.codigo_prov IN :provincias")
+    if con_comunidades:
+        condiciones.append("p.codigo_ca IN :comunidades")
+    if condiciones:
+        consulta += "WHERE " + "\n  AND ".join(condiciones) + "\n"
+
+    consulta += f"GROUP BY {', '.join(agrupacion)}\nORDER BY {agrupacion[0]}"
+
+    sentencia = text(consulta)
+    if con_provincias:
+        sentencia = sentencia.bindparams(bindparam("provincias", expanding=True))
+    if con_comunidades:
+        sentencia = sentencia.bindparams(bindparam("comunidades", expanding=True))
+    return sentencia
+
+
+@dataclass(frozen=True)
+class ConsultaMeteorologica:
+    """
+    Descripción de una consulta agregada sobre datos_meteorologicos.
+
+    Cada método devuelve una consulta nueva, de modo que se pueden encadenar:
+
+        ConsultaMeteorologica().entre_fechas(inicio, fin).de_provincias([28, 8])
+
+    La página Datos filtrados no usa de_provincias() ni de_comunidades(): pide las
+    medias de todas las provincias en el rango (como mucho 52 filas) y filtra en
+    memoria, para reutilizar el resultado mientras no cambien las fechas (ver
+    agregado_por_fechas en pages/2_Datos_filtrados.py). Ninguna página filtra hoy
+    por provincia en SQL; si una consulta los lleva, los filtros sí se aplican en el
+    WHERE.
+    """
+
+    metricas: tuple = tuple(METRICAS)
+    fecha: date = None
+    fecha_inicio: date = None
+    fecha_fin: date = None
+    provincias: tuple = ()  # codigo_prov
+    comunidades: tuple = ()  # codigo_ca
+    nivel: str = "provincia"
+    fuente: str = "detalle"  # 'detalle' (datos_meteorologicos) o 'resumen' (tablas de resumen)
+
+    @classmethod
+    def desde_parametros(cls, params: dict) -> "ConsultaMeteorologica":
+        """
+        Crea la consulta a partir del diccionario de parámetros que usan las páginas.
+
+        Args:
+            params (dict): Claves admitidas: 'fecha', 'fecha_inicio' y 'fecha_fin',
+                'provincias', 'comunidades', 'metricas', 'nivel' y 'fuente'.
+        """
+        consulta = cls()
+        if params.get("metricas"):
+            consulta = consulta.con_metricas(*params["metricas"])
+        if params.get("fecha_inicio"):
+            consulta = consulta.entre_fechas(params["fecha_inicio"], params["fecha_fin"])
+        elif params.get("fecha"):
+            consulta = consulta.en_fecha(params["fecha"])
+        if params.get("provincias"):
+            consulta = consulta.de_provincias(params["provincias"])
+        if params.get("comunidades"):
+            consulta = consulta.de_comunidades(params["comunidades"])
+        if params.get("nivel"):
+            consulta = consulta.agrupada_por(params["nivel"])
+        if params.get("fuente"):
+            consulta = consulta.desde(params["fuente"])
+        return consulta
+
+    def con_metricas(self, *metricas: str) -> "ConsultaMeteorologica":
+        desconocidas = [m for m in metricas if m not in METRICAS]
+        if desconocidas:
+            raise ValueError(f"Métricas desconocidas: {desconocidas}")
+        return replace(self, metricas=tuple(metricas))
+
+    def entre_fechas(self, fecha_inicio: date, fecha_fin: date) -> "ConsultaMeteorologica":
+        return replace(self, fecha=None, fecha_inicio=_a_fecha(fecha_inicio), fecha_fin=_a_fecha(fecha_fin))
+
+    def en_fecha(self, fecha: date) -> "ConsultaMeteorologica":
+        return replace(self, fecha=_a_fecha(fecha), fecha_inicio=None, fecha_fin=None)
+
+    def de_provincias(self, codigos) -> "ConsultaMeteorologica":
+        return replace(self, provincias=tuple(int(c) for c in codigos))
+
+    def de_comunidades(self, codigos) -> "ConsultaMeteorologica":
+        return replace(self, comunidades=tuple(int(c) for c in codigos))
+
+    def agrupada_por(self, nivel: str) -> "ConsultaMeteorologica":
+        if nivel not in NIVELES:
+            raise ValueError(f"Nivel de agrupación desconocido: {nivel}")
+        return replace(self, nivel=nivel)
+
+    def desde(self, fuente: str) -> "ConsultaMeteorologica":
+        if fuente not in ("detalle", "resumen"):
+            raise ValueError(f"Fuente desconocida: {fuente}")
+        return replace(self, fuente=fuente)
+
+    @property
+    def filtro_fecha(self) -> str:
+        """'dia', 'rango' o '' según el filtro de fechas aplicado."""
+        if self.fecha_inicio is not None:
+            return "rango"
+        if self.fecha is not None:
+            return "dia"
+        return ""
+
+    def parametros(self) -> dict:
+        """Valores que se ligan a la sentencia."""
+        params = {}
+        if self.filtro_fecha == "rango":
+            params["fecha_inicio"] = self.fecha_inicio
+            params["fecha_fin"] = self.fecha_fin
+            if self.fuente == "resumen":
+                mes_desde, mes_hasta, fin_mes_hasta = _meses_completos(self.fecha_inicio, self.fecha_fin)
+                params["mes_desde"] = mes_desde
+                params["mes_hasta"] = mes_hasta
+                params["fin_mes_hasta"] = fin_mes_hasta
+        elif self.filtro_fecha == "dia":
+            params["fecha"] = self.fecha
+        if self.provincias:
+            params["provincias"] = list(self.provincias)
+        if self.comunidades:
+            params["comunidades"] = list(self.comunidades)
+        return params
+
+    def construir(self, explicar: bool = False):
+        """
+        Retorna la sentencia parametrizada y sus parámetros.
+
+        Args:
+            explicar (bool): Antepone EXPLAIN para ver el plan de ejecución.
+
+        Returns:
+            tuple: (sqlalchemy.TextClause, dict)
+        """
+        sentencia = _sentencia(
+            self.metricas,
+            self.nivel,
+            self.filtro_fecha,
+            bool(self.provincias),
+            bool(self.comunidades),
+            self.fuente,
+            "EXPLAIN " if explicar else "",
+        )
+        return sentencia, self.parametros()
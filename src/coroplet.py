@@ -1,30 +1,45 @@
-import geopandas as gpd
+import io
+import os
+
 import matplotlib.pyplot as plt
 import numpy as np
-import plotly.express as px
+import plotly.graph_objects as go
+
+from src import conectar, geometria
+from src.cache_mapas import CacheMapas, huella_mapa
+
 
+# Provincia en la que se señala 'Sin datos' (Castelló/Castellón)
+CODIGO_CASTELLON = 12
 
-# GeoJSON
-gdf = gpd.read_file('data/spain-provinces.geojson')
-gdf['codigo_prov'] = gdf['cod_prov'].astype(int)
+# Caché de mapas ya renderizados, compartida por todas las sesiones del proceso.
+# Se puede ajustar con una sección [cache_mapas] en secrets.toml.
+CONFIG_CACHE_MAPAS = {
+    "memoria_max_mb": 32,
+    "disco_max_mb": 256,
+    "dpi": 100,
+}
+_config_mapas = conectar.leer_configuracion("cache_mapas", CONFIG_CACHE_MAPAS)
+cache_mapas = CacheMapas(_config_mapas["memoria_max_mb"], _config_mapas["disco_max_mb"])
 
 def dibujar_coropletico(datos, nombre_columna, texto_titulo, etiqueta_leyenda):
     """
-    - datos: DataFrame con ['provincia', nombre_columna].
+    - datos: DataFrame con ['codigo_prov', 'nombre', nombre_columna]; 'nombre' rotula el máximo y el mínimo.
     - nombre_columna: columna a mapear (p.ej. 'tmed_promedio').
     - texto_titulo: título del gráfico.
     - etiqueta_leyenda: texto para la escala de colores.
 
     Provincias sin datos (NaN) se pintan en gris y la flecha 'Sin datos' apunta a Castellón,
-    siempre que Castellón esté en el GeoDataFrame y falte en los datos.
+    siempre que Castellón falte en los datos.
+
+    La geometría simplificada y los centroides vienen de src/geometria.py.
     """
     vmin = datos[nombre_columna].min()
     vmax = datos[nombre_columna].max()
     print(f"Rango de colores fijo: vmin = {vmin:.1f}, vmax = {vmax:.1f}")
-    # Unión geográfica
-    
-    gdf_unido = gdf.merge(datos, on='codigo_prov', how='left')
-    
+    # Unión geográfica por el índice codigo_prov
+    gdf_unido = geometria.unir(datos, [nombre_columna])
+
     # Manejo si vmin y vmax son iguales (ej. todos los valores son iguales o solo hay un valor)
     if vmin == vmax:
         vmin = vmin * 0.9 if vmin != 0 else -1
@@ -60,15 +75,16 @@ def dibujar_coropletico(datos, nombre_columna, texto_titulo, etiqueta_leyenda):
     
     # Anotamos provincia máxima 
     if datos[nombre_columna].notna().any():
-        provincia_max = datos.loc[datos[nombre_columna].idxmax(), 'nombre']
+        idx_max = datos[nombre_columna].idxmax()
+        provincia_max = datos.loc[idx_max, 'nombre']
         valor_max = datos[nombre_columna].max()
-         # Asegúrate de que la provincia_max existe en gdf_unido
-        if provincia_max in gdf_unido['nombre'].values:
-            punto_max = gdf_unido[gdf_unido['nombre'] == provincia_max].geometry.centroid.iloc[0]
+         # Asegúrate de que la provincia_max existe en la geometría
+        if datos.loc[idx_max, 'codigo_prov'] in gdf_unido.index:
+            x_max, y_max = geometria.centroide(datos.loc[idx_max, 'codigo_prov'])
             ax.annotate(
                 f"Máx: {provincia_max}\n{valor_max:.1f}", # Quitamos °C, se espera en la leyenda
-                xy=(punto_max.x, punto_max.y),
-                xytext=(punto_max.x + 1.0, punto_max.y - 1.0), # Ajusta estos valores para tu mapa
+                xy=(x_max, y_max),
+                xytext=(x_max + 1.0, y_max - 1.0), # Ajusta estos valores para tu mapa
                 arrowprops=dict(arrowstyle="->", color='black'),
                 fontsize=10,
                 bbox=dict(boxstyle="round,pad=0.3", fc="white", ec="black", alpha=0.7)
@@ -80,29 +96,24 @@ def dibujar_coropletico(datos, nombre_columna, texto_titulo, etiqueta_leyenda):
         provincia_min = datos.loc[idx_min, 'nombre']
         valor_min = datos[nombre_columna].min()
 
-        if provincia_min in gdf_unido['nombre'].values:
-            punto_min = gdf_unido[gdf_unido['nombre'] == provincia_min].geometry.centroid.iloc[0]
+        if datos.loc[idx_min, 'codigo_prov'] in gdf_unido.index:
+            x_min, y_min = geometria.centroide(datos.loc[idx_min, 'codigo_prov'])
             ax.annotate(
                 f"Mín: {provincia_min}\n{valor_min:.1f}", # Quitamos °C
-                xy=(punto_min.x, punto_min.y),
-                xytext=(punto_min.x - 2.0, punto_min.y + 1.0), # Ajusta estos valores
+                xy=(x_min, y_min),
+                xytext=(x_min - 2.0, y_min + 1.0), # Ajusta estos valores
                 arrowprops=dict(arrowstyle="->", color='black'),
                 fontsize=10,
                 bbox=dict(boxstyle="round,pad=0.3", fc="white", ec="black", alpha=0.7)
             )
     
-    # Buscamos el subconjunto de provincias con NaN en nombre_columna
-    sin_datos = gdf_unido[gdf_unido[nombre_columna].isna()]
-    
-    # Verificamos primero si 'Castellón' está en esa lista
-    if not sin_datos.empty and 'Castellón' in list(sin_datos['nombre']):
-        # Seleccionamos la fila de Castellón
-        fila_castellon = sin_datos[sin_datos['nombre'] == 'Castellón'].iloc[0]
-        centroide_c = fila_castellon.geometry.centroid
+    # Castellón se busca por código: su nombre en la geometría es 'Castelló/Castellón'
+    if CODIGO_CASTELLON in gdf_unido.index and np.isnan(gdf_unido.loc[CODIGO_CASTELLON, nombre_columna]):
+        x_c, y_c = geometria.centroide(CODIGO_CASTELLON)
         ax.annotate(
             "Sin datos",
-            xy=(centroide_c.x, centroide_c.y),
-            xytext=(centroide_c.x + 1.0, centroide_c.y - 1.0),
+            xy=(x_c, y_c),
+            xytext=(x_c + 1.0, y_c - 1.0),
             arrowprops=dict(arrowstyle="->", color='black'),
             fontsize=10,
             bbox=dict(boxstyle="round,pad=0.3", fc="white", ec="black", alpha=0.7)
@@ -113,10 +124,50 @@ def dibujar_coropletico(datos, nombre_columna, texto_titulo, etiqueta_leyenda):
 
     return fig
 
-def dibujar_coropletico_plotly(datos, nombre_columna, texto_titulo, etiqueta_leyenda):
+def dibujar_coropletico_png(datos, nombre_columna, texto_titulo, etiqueta_leyenda) -> bytes:
+    """
+    Igual que dibujar_coropletico, pero devuelve el PNG y lo guarda en caché.
+
+    Si los valores por provincia, la columna, el título y la leyenda coinciden con
+    un mapa ya dibujado, se devuelven sus bytes sin crear la figura.
+
+    Returns:
+        bytes: Imagen PNG, lista para st.image.
+    """
+    huella = huella_mapa(datos, nombre_columna, texto_titulo, etiqueta_leyenda, _config_mapas["dpi"],
+                         geometria.huella())
+    imagen = cache_mapas.obtener(huella)
+    if imagen is not None:
+        return imagen
+
+    fig = dibujar_coropletico(datos, nombre_columna, texto_titulo, etiqueta_leyenda)
+    try:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", dpi=_config_mapas["dpi"], bbox_inches="tight")
+    finally:
+        # Sin cerrarla, pyplot conserva cada figura creada durante toda la vida del proceso
+        plt.close(fig)
+    imagen = buffer.getvalue()
+    cache_mapas.guardar(huella, imagen)
+    return imagen
+
+def dibujar_coropletico_plotly(datos, nombre_columna, texto_titulo, etiqueta_leyenda, geojson=None):
+    """
+    Coroplético interactivo de Plotly que no incrusta la geometría en la figura.
+
+    El mapa apunta a la URL del GeoJSON estático (ver geometria.url_geojson), que el
+    navegador descarga una sola vez; en cada interacción la figura solo lleva los
+    códigos de provincia, los valores, el rango de color y las etiquetas.
 
-    # gdf_for_centroids = gdf.to_crs(epsg=25830)
-    gdf_unido = gdf.merge(datos, on='codigo_prov', how='left')
+    Args:
+        datos: DataFrame con ['codigo_prov', 'nombre', nombre_columna].
+        nombre_columna: columna a mapear.
+        texto_titulo: título del gráfico.
+        etiqueta_leyenda: texto para la escala de colores.
+        geojson: URL o diccionario GeoJSON con id = codigo_prov. Por defecto, la URL estática.
+    """
+    if geojson is None:
+        geojson = geometria.url_geojson()
 
     # Rango de color
     vmin = datos[nombre_columna].min()
@@ -125,64 +176,37 @@ def dibujar_coropletico_plotly(datos, nombre_columna, texto_titulo, etiqueta_ley
         vmin = vmin * 0.9 if vmin != 0 else -1
         vmax = vmax * 1.1 if vmax != 0 else 1
 
-    # Simula provincias sin datos como -999
-    datos_plot = datos.copy()
-    datos_plot[nombre_columna] = datos_plot[nombre_columna].fillna(-999)
-
-    # Color scale con gris para -999 y luego escala Viridis
-    color_scale = [
-        [0.0, "lightgrey"],  # Para -999
-        [0.00001, px.colors.sequential.Viridis[0]],  # Mismo inicio que la escala real
-        [1.0, px.colors.sequential.Viridis[-1]]
-    ]
-
-    # Crear mapa
-    fig_px = px.choropleth(
-        data_frame=datos_plot,
-        geojson=gdf_unido,
-        locations="codigo_prov",
-        featureidkey="properties.cod_prov",
-        color=nombre_columna,
-        color_continuous_scale=color_scale,
-        range_color=(vmin, vmax),
-        hover_name="nombre",
-        hover_data={nombre_columna: ":.2f"}, # Formato y ocultar 'nombre' duplicado
-        labels={nombre_columna: etiqueta_leyenda},
-        title=texto_titulo
-        #na_color="lightgrey"
-    )
-    
-    # Centrado y zoom ajustado para España
-    fig_px.update_geos(
-        fitbounds="locations",
-        visible=False,
-        # center={"lat": 40.4, "lon": -3.7},
-        # projection_scale=5,
-        # lataxis_range=[34, 44],
-        # lonaxis_range=[-10, 5],
-        #showland=False,
-        #showcountries=True,
-        #countrycolor="black",
-        #landcolor="lightgray",
-        showsubunits=True,
-        subunitcolor="darkgray"
-    )
-    #fig_px.update_traces(marker_line_width=0.5, marker_line_color="black")
+    con_datos = datos[datos[nombre_columna].notna()]
+    todas = geometria.cargar().index
 
-    # Layout
-    fig_px.update_layout(
-        # title=dict(
-        #     text=texto_titulo,
-        #     font=dict(size=20),
-        #     x=0.5,
-        #     xanchor='center',
-        #     y=0.96,
-        #     yanchor='top'
-        # ),
-        margin=dict(l=0, r=0, t=80, b=0),
-        height=900,
-        width=900,
-        coloraxis_colorbar=dict(
+    fig_px = go.Figure()
+
+    # Fondo gris: todas las provincias, tapadas después por las que tienen datos
+    fig_px.add_trace(go.Choropleth(
+        geojson=geojson,
+        featureidkey="id",
+        locations=todas,
+        z=np.zeros(len(todas)),
+        colorscale=[[0, "lightgrey"], [1, "lightgrey"]],
+        showscale=False,
+        hoverinfo="skip",
+        marker_line_color="darkgray",
+        marker_line_width=0.5,
+    ))
+
+    fig_px.add_trace(go.Choropleth(
+        geojson=geojson,
+        featureidkey="id",  # índice codigo_prov de la geometría
+        locations=con_datos["codigo_prov"],
+        z=con_datos[nombre_columna].round(2),
+        text=con_datos["nombre"],
+        zmin=vmin,
+        zmax=vmax,
+        colorscale="Viridis",
+        marker_line_color="darkgray",
+        marker_line_width=0.5,
+        hovertemplate=f"<b>%{{text}}</b><br>{etiqueta_leyenda}: %{{z:.2f}}<extra></extra>",
+        colorbar=dict(
             title=etiqueta_leyenda,
             lenmode='pixels',
             len=200,
@@ -191,47 +215,74 @@ def dibujar_coropletico_plotly(datos, nombre_columna, texto_titulo, etiqueta_ley
             xanchor='left', # Ancla la barra a la izquierda de la posición X
             yanchor='middle'
         ),
-    )
+    ))
 
-    # Anotaciones: máx y mín
-    anotaciones = []
-    def añadir_anotacion(texto, punto, dx=1.0, dy=1.0, color="black"):
-        anotaciones.append(dict(
-            x=punto.x + dx,
-            y=punto.y + dy,
-            xref="x", yref="y",
-            text=texto,
-            showarrow=True,
-            arrowhead=2,
-            ax=-dx * 50, ay=-dy * 50,
-            font=dict(size=12, color="black"),
-            bgcolor="white",
-            bordercolor=color,
-            borderwidth=1
+    # Anotaciones: mín, máx y "Sin datos" en Castellón, en el centroide de cada provincia
+    etiquetas = []
+    if not con_datos.empty:
+        fila_min = con_datos.loc[con_datos[nombre_columna].idxmin()]
+        fila_max = con_datos.loc[con_datos[nombre_columna].idxmax()]
+        etiquetas.append((fila_min["codigo_prov"], f"Mín: {fila_min['nombre']}<br>{fila_min[nombre_columna]:.1f}"))
+        etiquetas.append((fila_max["codigo_prov"], f"Máx: {fila_max['nombre']}<br>{fila_max[nombre_columna]:.1f}"))
+    if CODIGO_CASTELLON in todas and CODIGO_CASTELLON not in set(con_datos["codigo_prov"]):
+        etiquetas.append((CODIGO_CASTELLON, "Sin datos"))
+    if etiquetas:
+        centroides = [geometria.centroide(codigo) for codigo, _ in etiquetas]
+        fig_px.add_trace(go.Scattergeo(
+            lon=[x for x, _ in centroides],
+            lat=[y for _, y in centroides],
+            text=[texto for _, texto in etiquetas],
+            mode="markers+text",
+            textposition="top center",
+            marker=dict(size=6, color="black"),
+            textfont=dict(size=12, color="black"),
+            hoverinfo="skip",
+            showlegend=False,
         ))
-    #datos_validos = datos.dropna(subset=[nombre_columna])
-    # Mínimo
-    if datos[nombre_columna].notna().any():
-        idx_min = datos[nombre_columna].idxmin()
-        prov_min = datos.loc[idx_min, 'nombre']
-        valor_min = datos.loc[idx_min, nombre_columna]
-        p_min = gdf_unido[gdf_unido['nombre'] == prov_min].geometry.centroid.iloc[0]
-        añadir_anotacion(f"Mín: {prov_min}<br>{valor_min:.1f}", p_min, dx=-1.0, dy=-1.0)
-        
-    # Máximo
-        idx_max = datos[nombre_columna].idxmax()
-        prov_max = datos.loc[idx_max, 'nombre']
-        valor_max = datos.loc[idx_max, nombre_columna]
-        p_max = gdf_unido[gdf_unido['nombre'] == prov_max].geometry.centroid.iloc[0]
-        añadir_anotacion(f"Máx: {prov_max}<br>{valor_max:.1f}", p_max, dx=0.5, dy=0.5)
 
-     # "Sin datos" en Castellón si corresponde
-    sin_datos = gdf_unido[gdf_unido[nombre_columna].isna()]
-    if not sin_datos.empty and 'Castellón' in sin_datos['nombre'].values:
-        p_cas = sin_datos[sin_datos['nombre'] == 'Castellón'].geometry.centroid.iloc[0]
-        añadir_anotacion("Sin datos", p_cas, dx=0.7, dy=-0.3, color="gray")
+    # Encuadre fijo de España (península, Baleares y Canarias)
+    fig_px.update_geos(
+        visible=False,
+        lataxis_range=[27.5, 44],
+        lonaxis_range=[-18.5, 4.5],
+        projection_type="mercator",
+    )
 
-    fig_px.update_layout(annotations=anotaciones)
+    # Layout
+    fig_px.update_layout(
+        title=texto_titulo,
+        margin=dict(l=0, r=0, t=80, b=0),
+        height=900,
+        width=900,
+    )
 
     return fig_px
 
+
+if __name__ == "__main__":
+    # python -m src.coroplet  -> tamaño de la figura serializada y tiempo de generación
+    import json
+    import time
+
+    import pandas as pd
+
+    provincias = geometria.cargar()
+    datos = pd.DataFrame({"codigo_prov": provincias.index, "nombre": provincias["nombre"].to_numpy()})
+    datos["tmed"] = np.random.default_rng(0).normal(15, 4, len(datos))
+
+    with open(geometria.RUTA_GEOJSON, encoding="utf-8") as f:
+        original = json.load(f)
+    for feature in original["features"]:
+        feature["id"] = int(feature["properties"]["cod_prov"])
+    variantes = {
+        "GeoJSON original incrustado": original,
+        "geometría simplificada incrustada": json.loads(provincias[["nombre", "geometry"]].to_json(drop_id=False)),
+        "URL estática (por interacción)": geometria.url_geojson(),
+    }
+    for nombre, geojson in variantes.items():
+        inicio = time.perf_counter()
+        for _ in range(5):
+            carga = dibujar_coropletico_plotly(datos, "tmed", "Temperatura media", "ºC", geojson=geojson).to_json()
+        segundos = (time.perf_counter() - inicio) / 5
+        print(f"{nombre:<36} {len(carga.encode('utf-8')) / 1024:>9.1f} KB {segundos * 1000:>8.1f} ms")
+    print(f"{'GeoJSON estático (una vez)':<36} {os.path.getsize(geometria.RUTA_GEOJSON_ESTATICO) / 1024:>9.1f} KB")
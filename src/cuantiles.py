@@ -0,0 +1,424 @@
+import math
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from src import conectar
+
+
+# error: error de rango normalizado admitido en los cuantiles (0.01 -> el cuartil
+# devuelto está entre los percentiles 24 y 26). columnas: las que mantiene popular.py.
+CONFIG_CUANTILES = conectar.leer_configuracion("cuantiles", {
+    "error": 0.01,
+    "columnas": ["tmed"],
+})
+
+# Formato de serialización de BocetoKLL.a_bytes()
+VERSION_BOCETO = 1
+
+# Capacidad mínima de un nivel y razón entre niveles consecutivos (valores de KLL)
+_CAPACIDAD_MINIMA = 8
+_RAZON = 2 / 3
+
+_bocetos_locales = {}  # columna -> (versión de los datos, bocetos por provincia y mes)
+_cerrojo = threading.Lock()
+
+
+def k_para_error(error: float) -> int:
+    """
+    Tamaño k de un boceto KLL para un error de rango dado.
+
+    Usa la aproximación empírica de Apache DataSketches para el error en ambos
+    sentidos con confianza del 99 %: error ≈ 2.446 / k^0.9433.
+    """
+    return max(_CAPACIDAD_MINIMA, math.ceil((2.446 / error) ** (1 / 0.9433)))
+
+
+class BocetoKLL:
+    """
+    Boceto de cuantiles KLL: guarda una muestra ponderada de los valores, con un
+    tamaño que depende de k y no del número de valores.
+
+    El nivel h contiene valores que representan 2^h valores originales cada uno.
+    Cuando un nivel se llena se ordena y la mitad de sus valores (los pares o los
+    impares, al azar) sube al nivel siguiente. Dos bocetos se fusionan uniendo
+    sus niveles, así que un resumen por provincia y mes sirve para cualquier rango.
+    """
+
+    def __init__(self, k: int = None, semilla: int = None):
+        """
+        Args:
+            k (int): Tamaño del boceto; por defecto, el de CONFIG_CUANTILES["error"].
+            semilla (int): Semilla de las compactaciones (para resultados reproducibles).
+        """
+        self.k = k or k_para_error(CONFIG_CUANTILES["error"])
+        self.niveles = [np.empty(0, dtype=np.float64)]
+        self.suma = 0.0
+        self.minimo = math.inf
+        self.maximo = -math.inf
+        self._rng = np.random.default_rng(semilla)
+
+    @property
+    def n(self) -> int:
+        """Número de valores resumidos."""
+        return sum(len(nivel) << h for h, nivel in enumerate(self.niveles))
+
+    def _capacidad(self, h: int) -> int:
+        profundidad = len(self.niveles) - 1 - h
+        return max(_CAPACIDAD_MINIMA, math.ceil(self.k * _RAZON ** profundidad))
+
+    def _compactar(self):
+        """Compacta el nivel más bajo que se pase de su capacidad hasta que ninguno lo haga."""
+        h = 0
+        while h < len(self.niveles):
+            nivel = self.niveles[h]
+            if len(nivel) <= self._capacidad(h):
+                h += 1
+                continue
+            if h + 1 == len(self.niveles):
+                self.niveles.append(np.empty(0, dtype=np.float64))
+            nivel = np.sort(nivel)
+            # Con un número impar de valores, el mayor se queda en su nivel
+            pares = len(nivel) - len(nivel) % 2
+            suben = nivel[self._rng.integers(2):pares:2]
+            self.niveles[h] = nivel[pares:]
+            self.niveles[h + 1] = np.concatenate([self.niveles[h + 1], suben])
+            # Las capacidades dependen del número de niveles: se vuelve a empezar abajo
+            h = 0
+
+    def actualizar(self, valores) -> "BocetoKLL":
+        """Añade valores (se ignoran los NaN)."""
+        valores = np.asarray(valores, dtype=np.float64)
+        valores = valores[~np.isnan(valores)]
+        if len(valores) == 0:
+            return self
+        self.suma += float(valores.sum())
+        self.minimo = min(self.minimo, float(valores.min()))
+        self.maximo = max(self.maximo, float(valores.max()))
+        self.niveles[0] = np.concatenate([self.niveles[0], valores])
+        self._compactar()
+        return self
+
+    def fusionar(self, otro: "BocetoKLL") -> "BocetoKLL":
+        """Añade a este boceto los valores resumidos en otro."""
+        if otro.n == 0:
+            return self
+        self.k = min(self.k, otro.k)
+        while len(self.niveles) < len(otro.niveles):
+            self.niveles.append(np.empty(0, dtype=np.float64))
+        for h, nivel in enumerate(otro.niveles):
+            self.niveles[h] = np.concatenate([self.niveles[h], nivel])
+        self.suma += otro.suma
+        self.minimo = min(self.minimo, otro.minimo)
+        self.maximo = max(self.maximo, otro.maximo)
+        self._compactar()
+        return self
+
+    def _ordenado(self) -> tuple:
+        """Valores retenidos ordenados y su peso acumulado."""
+        valores = np.concatenate(self.niveles)
+        pesos = np.concatenate([np.full(len(nivel), 1 << h, dtype=np.int64) for h, nivel in enumerate(self.niveles)])
+        orden = np.argsort(valores, kind="stable")
+        return valores[orden], np.cumsum(pesos[orden])
+
+    def cuantiles(self, qs) -> np.ndarray:
+        """
+        Cuantiles aproximados: para cada q, el menor valor retenido cuyo rango es ≥ q.
+
+        Returns:
+            np.ndarray: Un valor por q; NaN si el boceto está vacío.
+        """
+        qs = np.asarray(qs, dtype=np.float64)
+        if self.n == 0:
+            return np.full(qs.shape, np.nan)
+        valores, acumulado = self._ordenado()
+        resultado = valores[np.minimum(np.searchsorted(acumulado, qs * self.n, side="left"), len(valores) - 1)]
+        # Los extremos se conocen exactamente
+        return np.where(qs <= 0, self.minimo, np.where(qs >= 1, self.maximo, resultado))
+
+    def rango(self, x, incluido: bool = False) -> np.ndarray:
+        """Fracción aproximada de valores < x (o ≤ x si incluido)."""
+        if self.n == 0:
+            return np.full(np.shape(x), np.nan)
+        valores, acumulado = self._ordenado()
+        posicion = np.searchsorted(valores, x, side="right" if incluido else "left")
+        return np.where(posicion > 0, acumulado[np.maximum(posicion - 1, 0)], 0) / self.n
+
+    def caja(self, whis: float = 1.5, etiqueta=None) -> dict:
+        """
+        Estadísticas de caja aproximadas en el formato de Axes.bxp (sin atípicos
+        individuales), más n y el porcentaje de valores fuera de los límites de Tukey.
+        """
+        q1, mediana, q3 = self.cuantiles([0.25, 0.5, 0.75])
+        bajo, alto = q1 - whis * (q3 - q1), q3 + whis * (q3 - q1)
+        valores, _ = self._ordenado()
+        dentro = valores[(valores >= bajo) & (valores <= alto)]
+        return {
+            "label": etiqueta,
+            "mean": self.suma / self.n if self.n else np.nan,
+            "med": mediana,
+            "q1": q1,
+            "q3": q3,
+            "whislo": self.minimo if self.minimo >= bajo else (dentro.min() if len(dentro) else q1),
+            "whishi": self.maximo if self.maximo <= alto else (dentro.max() if len(dentro) else q3),
+            "fliers": np.empty(0),
+            "n": self.n,
+            "porcentaje_atipicos": 100 * float(self.rango(bajo) + 1 - self.rango(alto, incluido=True)),
+        }
+
+    def a_bytes(self) -> bytes:
+        """Serializa el boceto (cabecera, tamaños de los niveles y valores en float64)."""
+        cabecera = struct.pack("<BHBddd", VERSION_BOCETO, self.k, len(self.niveles), self.suma, self.minimo, self.maximo)
+        tamaños = np.array([len(nivel) for nivel in self.niveles], dtype="<u4")
+        return cabecera + tamaños.tobytes() + np.concatenate(self.niveles).astype("<f8").tobytes()
+
+    @classmethod
+    def desde_bytes(cls, datos: bytes) -> "BocetoKLL":
+        """Reconstruye un boceto guardado con a_bytes()."""
+        version, k, num_niveles, suma, minimo, maximo = struct.unpack_from("<BHBddd", datos)
+        if version != VERSION_BOCETO:
+            raise ValueError(f"Versión de boceto no soportada: {version}")
+        desplazamiento = struct.calcsize("<BHBddd")
+        tamaños = np.frombuffer(datos, dtype="<u4", count=num_niveles, offset=desplazamiento)
+        valores = np.frombuffer(datos, dtype="<f8", offset=desplazamiento + 4 * num_niveles)
+        boceto = cls(k)
+        boceto.niveles = [nivel.copy() for nivel in np.split(valores, np.cumsum(tamaños)[:-1])]
+        boceto.suma, boceto.minimo, boceto.maximo = suma, minimo, maximo
+        return boceto
+
+
+def _bocetos_por_mes(df: pd.DataFrame, k: int) -> list:
+    """
+    Un boceto por provincia y mes a partir de filas (codigo_prov, fecha, valor).
+
+    Returns:
+        list: Tuplas (codigo_prov, mes, boceto).
+    """
+    df = df.dropna(subset=["valor"])
+    mes = pd.to_datetime(df["fecha"]).dt.to_period("M").dt.to_timestamp()
+    valores = df["valor"].astype(np.float64)
+    return [
+        (int(codigo_prov), mes_grupo.date(), BocetoKLL(k).actualizar(grupo.to_numpy()))
+        for (codigo_prov, mes_grupo), grupo in valores.groupby([df["codigo_prov"], mes], sort=True)
+    ]
+
+
+_GUARDAR = text("""
+INSERT INTO bocetos_cuantiles (columna, mes, codigo_prov, k, n, boceto)
+VALUES (:columna, :mes, :codigo_prov, :k, :n, :boceto)
+ON DUPLICATE KEY UPDATE k = VALUES(k), n = VALUES(n), boceto = VALUES(boceto)
+""")
+
+
+def _guardar(conexion, columna: str, bocetos: list) -> int:
+    filas = [
+        {"columna": columna, "mes": mes, "codigo_prov": codigo_prov,
+         "k": boceto.k, "n": boceto.n, "boceto": boceto.a_bytes()}
+        for codigo_prov, mes, boceto in bocetos
+    ]
+    if filas:
+        conexion.execute(_GUARDAR, filas)
+    return len(filas)
+
+
+def _valores_tocados(columna: str):
+    # Meses completos (todas las provincias) tocados por las descargas indicadas
+    return text(f"""
+SELECT d.codigo_prov, d.fecha, d.{columna} AS valor
+FROM datos_meteorologicos AS d
+JOIN (
+    SELECT DISTINCT DATE_SUB(fecha, INTERVAL DAY(fecha) - 1 DAY) AS mes
+    FROM datos_meteorologicos WHERE id_descarga IN :ids
+) AS tocados ON d.fecha >= tocados.mes AND d.fecha < tocados.mes + INTERVAL 1 MONTH
+WHERE d.codigo_prov IS NOT NULL AND d.{columna} IS NOT NULL
+""").bindparams(bindparam("ids", expanding=True))
+
+
+def actualizar_bocetos(conexion, ids_descarga, columnas: list = None) -> None:
+    """
+    Recalcula los bocetos de los meses que tocan las descargas indicadas.
+
+    Como en resumenes.actualizar_resumenes, los meses tocados se rehacen desde
+    datos_meteorologicos en lugar de fusionar el lote con el boceto guardado: la
+    carga es un upsert y fusionar contaría dos veces las filas repetidas.
+
+    Args:
+        conexion: Conexión SQLAlchemy abierta. Se confirma la transacción al terminar.
+        ids_descarga: Identificadores id_descarga de la carga recién insertada.
+        columnas (list): Columnas a resumir; por defecto, las de CONFIG_CUANTILES.
+    """
+    ids = [str(i) for i in ids_descarga]
+    if not ids:
+        return
+    k = k_para_error(CONFIG_CUANTILES["error"])
+    for columna in columnas or CONFIG_CUANTILES["columnas"]:
+        df = pd.read_sql(_valores_tocados(columna), conexion, params={"ids": ids})
+        escritas = _guardar(conexion, columna, _bocetos_por_mes(df, k))
+        conexion.commit()
+        print(f"Bocetos de {columna} actualizados: {escritas} provincias×mes.")
+
+
+def reconstruir_bocetos(conexion, columnas: list = None) -> None:
+    """Vacía y vuelve a calcular los bocetos con todo el histórico, mes a mes."""
+    k = k_para_error(CONFIG_CUANTILES["error"])
+    meses = pd.read_sql(text(
+        "SELECT DISTINCT DATE_SUB(fecha, INTERVAL DAY(fecha) - 1 DAY) AS mes FROM datos_meteorologicos ORDER BY mes"
+    ), conexion)["mes"]
+    for columna in columnas or CONFIG_CUANTILES["columnas"]:
+        conexion.execute(text("DELETE FROM bocetos_cuantiles WHERE columna = :columna"), {"columna": columna})
+        escritas = 0
+        for mes in meses:
+            df = pd.read_sql(text(f"""
+                SELECT codigo_prov, fecha, {columna} AS valor FROM datos_meteorologicos
+                WHERE fecha >= :mes AND fecha < :mes + INTERVAL 1 MONTH
+                AND codigo_prov IS NOT NULL AND {columna} IS NOT NULL
+            """), conexion, params={"mes": mes})
+            escritas += _guardar(conexion, columna, _bocetos_por_mes(df, k))
+        conexion.commit()
+        print(f"Bocetos de {columna} reconstruidos: {escritas} provincias×mes.")
+
+
+def _locales(columna: str) -> list:
+    """
+    Bocetos por provincia y mes de los almacenes locales, que no tienen la tabla
+    bocetos_cuantiles: se calculan desde el detalle una vez por versión de los datos.
+    """
+    from src import extraer_datos
+
+    version = extraer_datos.version_vigente()
+    with _cerrojo:
+        if columna not in _bocetos_locales or _bocetos_locales[columna][0] != version:
+            detalle = extraer_datos.leer_detalle(["fecha", "codigo_prov", columna])
+            if detalle.empty:
+                bocetos = []
+            else:
+                detalle = detalle.dropna(subset=["codigo_prov"]).rename(columns={columna: "valor"})
+                bocetos = _bocetos_por_mes(detalle, k_para_error(CONFIG_CUANTILES["error"]))
+            _bocetos_locales[columna] = (version, bocetos)
+        return _bocetos_locales[columna][1]
+
+
+def consultar(columna: str = "tmed", fecha_inicio=None, fecha_fin=None, provincias=None) -> BocetoKLL:
+    """
+    Fusiona los bocetos guardados de un rango de meses y provincias.
+
+    Con MySQL se leen de bocetos_cuantiles; con los almacenes locales se fusionan los
+    bocetos calculados sobre el detalle.
+
+    Args:
+        columna (str): Columna resumida.
+        fecha_inicio (date), fecha_fin (date): Meses a incluir (se toma el mes de cada fecha).
+        provincias (list): codigo_prov a incluir; todas si es None.
+
+    Returns:
+        BocetoKLL: Boceto del rango; vacío si no hay filas o si ocurre un error.
+    """
+    from src import extraer_datos
+
+    boceto = BocetoKLL()
+    if extraer_datos.ALMACEN != "mysql":
+        desde = fecha_inicio.replace(day=1) if fecha_inicio is not None else None
+        for codigo_prov, mes, parcial in _locales(columna):
+            if ((desde is None or mes >= desde) and (fecha_fin is None or mes <= fecha_fin)
+                    and (not provincias or codigo_prov in provincias)):
+                boceto.fusionar(parcial)
+        return boceto
+
+    condiciones, params = ["columna = :columna"], {"columna": columna}
+    if fecha_inicio is not None:
+        condiciones.append("mes >= DATE_SUB(:fecha_inicio, INTERVAL DAY(:fecha_inicio) - 1 DAY)")
+        params["fecha_inicio"] = fecha_inicio
+    if fecha_fin is not None:
+        condiciones.append("mes <= :fecha_fin")
+        params["fecha_fin"] = fecha_fin
+    if provincias:
+        nombres = [f"p{i}" for i in range(len(provincias))]
+        condiciones.append(f"codigo_prov IN ({', '.join(':' + nombre for nombre in nombres)})")
+        params.update({nombre: int(codigo) for nombre, codigo in zip(nombres, provincias)})
+
+    filas = extraer_datos.ejecutar_consulta_a_dataframe(
+        f"SELECT boceto FROM bocetos_cuantiles WHERE {' AND '.join(condiciones)}", params
+    )
+    for datos in filas.get("boceto", []):
+        boceto.fusionar(BocetoKLL.desde_bytes(datos))
+    return boceto
+
+
+def _error_rango(valores_ordenados: np.ndarray, estimacion: float, q: float) -> float:
+    """Distancia entre q y el intervalo de rangos exactos que ocupa la estimación."""
+    n = len(valores_ordenados)
+    menor = np.searchsorted(valores_ordenados, estimacion, side="left") / n
+    menor_igual = np.searchsorted(valores_ordenados, estimacion, side="right") / n
+    return max(0.0, menor - q, q - menor_igual)
+
+
+def _comprobar_precision(estaciones: int = 16) -> None:
+    """
+    Precisión frente a pandas: bocetos por provincia y mes fusionados en total,
+    por año y por mes, para varios errores configurados.
+    """
+    from src.estadisticas import _datos_sinteticos
+
+    provincias = 52
+    df = _datos_sinteticos(2, provincias * estaciones)
+    df["codigo_prov"] = np.repeat(np.arange(1, provincias + 1), len(df) // provincias)
+    df = df.rename(columns={"tmed": "valor"})
+    print(f"{len(df)} valores, {provincias} provincias, {df['fecha'].dt.to_period('M').nunique()} meses.")
+
+    grupos = {"Total": np.ones(len(df), dtype=bool)}
+    grupos.update({f"año {a}": (df["fecha"].dt.year == a).to_numpy() for a in sorted(df["fecha"].dt.year.unique())})
+    grupos.update({f"mes {m}": (df["fecha"].dt.month == m).to_numpy() for m in range(1, 13)})
+
+    print(f"{'error':>6} {'k':>5} {'bytes/boceto':>13} {'fusión (ms)':>12} {'error rango máx':>16} "
+          f"{'error °C máx':>13} {'error % atípicos':>17}")
+    for error in (0.05, 0.01, 0.005):
+        k = k_para_error(error)
+        por_mes = _bocetos_por_mes(df, k)
+        mes_boceto = pd.to_datetime([mes for _, mes, _ in por_mes])
+        tamaño = np.mean([len(boceto.a_bytes()) for _, _, boceto in por_mes])
+
+        error_rango = error_valor = error_atipicos = tiempo = 0.0
+        for nombre, mascara in grupos.items():
+            if nombre == "Total":
+                seleccion = np.ones(len(por_mes), dtype=bool)
+            elif nombre.startswith("año"):
+                seleccion = mes_boceto.year == int(nombre.split()[1])
+            else:
+                seleccion = mes_boceto.month == int(nombre.split()[1])
+
+            inicio = time.perf_counter()
+            boceto = BocetoKLL(k, semilla=0)
+            for (_, _, parcial), incluido in zip(por_mes, seleccion):
+                if incluido:
+                    # Se fusiona la versión serializada, como al leerla de MySQL
+                    boceto.fusionar(BocetoKLL.desde_bytes(parcial.a_bytes()))
+            caja = boceto.caja()
+            tiempo = max(tiempo, time.perf_counter() - inicio)
+
+            exactos = np.sort(df.loc[mascara, "valor"].to_numpy())
+            serie = pd.Series(exactos)
+            for q, estimado in zip((0.25, 0.5, 0.75), (caja["q1"], caja["med"], caja["q3"])):
+                error_rango = max(error_rango, _error_rango(exactos, estimado, q))
+                error_valor = max(error_valor, abs(estimado - serie.quantile(q)))
+            q1, q3 = serie.quantile(0.25), serie.quantile(0.75)
+            atipicos = 100 * ((serie < q1 - 1.5 * (q3 - q1)) | (serie > q3 + 1.5 * (q3 - q1))).mean()
+            error_atipicos = max(error_atipicos, abs(caja["porcentaje_atipicos"] - atipicos))
+
+        print(f"{error:>6} {k:>5} {tamaño:>13.0f} {tiempo * 1000:>12.1f} {error_rango:>16.4f} "
+              f"{error_valor:>13.2f} {error_atipicos:>17.2f}")
+        assert error_rango <= error, f"Error de rango {error_rango:.4f} por encima de la cota {error}"
+
+
+if __name__ == "__main__":
+    # python -m src.cuantiles reconstruir     -> carga inicial de bocetos_cuantiles
+    # python -m src.cuantiles [estaciones]    -> precisión frente a pandas con datos sintéticos
+    if len(sys.argv) > 1 and sys.argv[1] == "reconstruir":
+        with conectar.abrir_conexion() as conexion:
+            reconstruir_bocetos(conexion)
+    else:
+        _comprobar_precision(int(sys.argv[1]) if len(sys.argv) > 1 else 16)
@@ -0,0 +1,336 @@
+import sys
+import threading
+import time
+import timeit
+import warnings
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+
+# Métricas diarias que se guardan en el cubo (la altitud es de la estación, va aparte)
+METRICAS = ["tmed", "tmin", "tmax", "prec", "velmedia", "racha", "hrMedia"]
+
+# Ejes del cubo para reducir()
+EJES = {"estacion": 0, "dia": 1}
+
+_cubo = (None, None)  # (versión de los datos, CuboMeteorologico)
+_cerrojo = threading.Lock()
+
+
+@dataclass
+class CuboMeteorologico:
+    """
+    Datos diarios como un array float32 denso [estación, día, métrica] con NaN en los huecos.
+
+    Las estaciones están ordenadas por comunidad y provincia, así que cada provincia (y
+    cada comunidad) ocupa un bloque contiguo de filas: agregar por provincia es un
+    np.add.reduceat, sin máscaras ni groupby. Los días son offsets desde `inicio`, de
+    modo que un rango de fechas es una rebanada (una vista, sin copia).
+    """
+    valores: np.ndarray  # float32 (estaciones × días × métricas)
+    inicio: date  # fecha del día 0
+    metricas: list
+    estaciones: np.ndarray  # indicativo de cada fila
+    nombres: np.ndarray  # nombre de cada estación
+    altitud: np.ndarray  # float32 por estación
+    provincia: np.ndarray  # índice en codigos_prov de cada estación
+    codigos_prov: np.ndarray  # codigo_prov por índice de provincia (en el orden de los bloques)
+    comunidad: np.ndarray  # índice en codigos_ca de cada provincia
+    codigos_ca: np.ndarray  # codigo_ca por índice de comunidad
+
+    @classmethod
+    def desde_detalle(cls, detalle: pd.DataFrame, provincias: pd.DataFrame = None,
+                      metricas: list = METRICAS) -> "CuboMeteorologico":
+        """
+        Construye el cubo a partir de filas de datos_meteorologicos.
+
+        Args:
+            detalle (pd.DataFrame): Columnas fecha, indicativo, codigo_prov, las métricas
+                y, si están, nombre y altitud.
+            provincias (pd.DataFrame): Tabla provincias (codigo_prov, codigo_ca); sin ella
+                todas las provincias quedan en una sola comunidad 0.
+            metricas (list): Métricas a incluir.
+        """
+        detalle = detalle.dropna(subset=["fecha", "indicativo", "codigo_prov"])
+        fechas = pd.to_datetime(detalle["fecha"]).to_numpy(dtype="datetime64[D]")
+        inicio = fechas.min()
+        dias = int((fechas.max() - inicio).astype(np.int64)) + 1
+
+        # Una fila por estación, con su provincia y comunidad; el orden fija los bloques
+        estaciones = detalle.drop_duplicates("indicativo", keep="last").set_index("indicativo")
+        estaciones = pd.DataFrame({
+            "codigo_prov": estaciones["codigo_prov"].astype(np.int64),
+            "nombre": estaciones["nombre"] if "nombre" in estaciones else estaciones.index,
+            "altitud": estaciones["altitud"] if "altitud" in estaciones else np.nan,
+        })
+        if provincias is not None and not provincias.empty:
+            ca = provincias.set_index("codigo_prov")["codigo_ca"].astype(np.int64)
+            estaciones["codigo_ca"] = estaciones["codigo_prov"].map(ca).fillna(0).astype(np.int64)
+        else:
+            estaciones["codigo_ca"] = 0
+        estaciones = estaciones.rename_axis("indicativo").reset_index()
+        estaciones = estaciones.sort_values(["codigo_ca", "codigo_prov", "indicativo"], ignore_index=True)
+
+        # factorize numera en orden de aparición, que es el orden de los bloques
+        provincia, codigos_prov = pd.factorize(estaciones["codigo_prov"])
+        comunidad, codigos_ca = pd.factorize(estaciones.drop_duplicates("codigo_prov")["codigo_ca"])
+
+        # Índices de cada fila del detalle en el cubo; si una estación repite día, gana la última
+        fila = pd.Index(estaciones["indicativo"]).get_indexer(detalle["indicativo"])
+        dia = (fechas - inicio).astype(np.int64)
+        valores = np.full((len(estaciones), dias, len(metricas)), np.nan, dtype=np.float32)
+        valores[fila, dia, :] = detalle[metricas].to_numpy(dtype=np.float32, na_value=np.nan)
+
+        return cls(
+            valores=valores,
+            inicio=inicio.item(),
+            metricas=list(metricas),
+            estaciones=estaciones["indicativo"].to_numpy(dtype=str),
+            nombres=estaciones["nombre"].to_numpy(dtype=str),
+            altitud=estaciones["altitud"].to_numpy(dtype=np.float32),
+            provincia=provincia.astype(np.int16),
+            codigos_prov=np.asarray(codigos_prov),
+            comunidad=comunidad.astype(np.int16),
+            codigos_ca=np.asarray(codigos_ca),
+        )
+
+    @property
+    def forma(self) -> tuple:
+        """(estaciones, días, métricas)"""
+        return self.valores.shape
+
+    @property
+    def fin(self) -> date:
+        """Último día del cubo."""
+        return self.inicio + timedelta(days=self.valores.shape[1] - 1)
+
+    @property
+    def fechas(self) -> pd.DatetimeIndex:
+        return pd.date_range(self.inicio, periods=self.valores.shape[1], freq="D")
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria del cubo, los mapas de índices y los acumulados si ya se han calculado."""
+        total = sum(a.nbytes for a in (self.valores, self.estaciones, self.nombres, self.altitud,
+                                       self.provincia, self.codigos_prov, self.comunidad, self.codigos_ca))
+        for acumulado in self.__dict__.get("_acumulado", {}).values():
+            total += sum(a.nbytes for a in acumulado)
+        return total
+
+    def metrica(self, nombre: str) -> int:
+        """Posición de una métrica en el último eje."""
+        return self.metricas.index(nombre)
+
+    def dia(self, fecha) -> int:
+        """Offset de una fecha en el eje de días (puede quedar fuera del cubo)."""
+        return (pd.Timestamp(fecha).date() - self.inicio).days
+
+    def rango(self, fecha_inicio=None, fecha_fin=None) -> slice:
+        """Rebanada del eje de días para un rango de fechas (ambas incluidas), recortada al cubo."""
+        dias = self.valores.shape[1]
+        desde = 0 if fecha_inicio is None else min(max(self.dia(fecha_inicio), 0), dias)
+        hasta = dias if fecha_fin is None else min(max(self.dia(fecha_fin) + 1, desde), dias)
+        return slice(desde, hasta)
+
+    def corte(self, metrica: str, fecha_inicio=None, fecha_fin=None) -> np.ndarray:
+        """Vista (estaciones × días) de una métrica en un rango de fechas."""
+        return self.valores[:, self.rango(fecha_inicio, fecha_fin), self.metrica(metrica)]
+
+    def reducir(self, metrica: str, eje: str = "dia", funcion=np.nanmean,
+                fecha_inicio=None, fecha_fin=None) -> np.ndarray:
+        """
+        Aplica una reducción que ignora NaN (np.nanmean, np.nanmax, ...) sobre un eje.
+
+        Args:
+            metrica (str): Métrica a reducir.
+            eje (str): 'dia' (un valor por estación), 'estacion' (uno por día) o None (un escalar).
+            funcion: Reducción de NumPy con argumento axis.
+            fecha_inicio (date), fecha_fin (date): Rango de fechas (ambas incluidas).
+        """
+        corte = self.corte(metrica, fecha_inicio, fecha_fin)
+        with warnings.catch_warnings():
+            # Estaciones o días sin ningún dato dan NaN, que es lo que queremos
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return funcion(corte, axis=None if eje is None else EJES[eje])
+
+    def _limites_provincias(self) -> np.ndarray:
+        """Primera fila de cada provincia (las estaciones están agrupadas por provincia)."""
+        return np.flatnonzero(np.r_[True, np.diff(self.provincia) != 0])
+
+    def _limites_comunidades(self) -> np.ndarray:
+        """Primera provincia de cada comunidad."""
+        return np.flatnonzero(np.r_[True, np.diff(self.comunidad) != 0])
+
+    def diario_provincias(self, metrica: str, fecha_inicio=None, fecha_fin=None) -> tuple:
+        """
+        Suma y número de datos por provincia y día.
+
+        Returns:
+            tuple: (suma float64, n int32), ambos (provincias × días del rango).
+        """
+        corte = self.corte(metrica, fecha_inicio, fecha_fin)
+        presentes = ~np.isnan(corte)
+        limites = self._limites_provincias()
+        suma = np.add.reduceat(np.where(presentes, corte, 0).astype(np.float64), limites, axis=0)
+        n = np.add.reduceat(presentes.astype(np.int32), limites, axis=0)
+        return suma, n
+
+    def _acumulados(self, metrica: str) -> tuple:
+        """
+        Sumas y recuentos acumulados por provincia a lo largo de los días, con un cero delante.
+
+        Con ellos la media de cualquier rango es (S[fin] − S[inicio]) / (N[fin] − N[inicio]):
+        dos restas por provincia, sin recorrer los días. Se calculan por métrica la primera
+        vez que se piden y ocupan provincias × días, bastante menos que el cubo.
+        """
+        acumulados = self.__dict__.setdefault("_acumulado", {})
+        if metrica not in acumulados:
+            suma, n = self.diario_provincias(metrica)
+            ceros = np.zeros((len(suma), 1))
+            acumulados[metrica] = (
+                np.concatenate([ceros, suma.cumsum(axis=1)], axis=1),
+                np.concatenate([ceros.astype(np.int32), n.cumsum(axis=1, dtype=np.int32)], axis=1),
+            )
+        return acumulados[metrica]
+
+    def _suma_rango(self, metrica: str, fecha_inicio=None, fecha_fin=None) -> tuple:
+        """Suma y número de datos por provincia en un rango, con los acumulados."""
+        s, n = self._acumulados(metrica)
+        rango = self.rango(fecha_inicio, fecha_fin)
+        return s[:, rango.stop] - s[:, rango.start], n[:, rango.stop] - n[:, rango.start]
+
+    def media_provincias(self, metrica: str, fecha_inicio=None, fecha_fin=None) -> pd.Series:
+        """
+        Media de todas las lecturas de cada provincia en el rango, como AVG(d.x) agrupado por provincia.
+
+        Returns:
+            pd.Series: Índice codigo_prov; NaN en las provincias sin datos en el rango.
+        """
+        suma, n = self._suma_rango(metrica, fecha_inicio, fecha_fin)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.Series(suma / n, index=pd.Index(self.codigos_prov, name="codigo_prov"), name=metrica)
+
+    def media_comunidades(self, metrica: str, fecha_inicio=None, fecha_fin=None) -> pd.Series:
+        """Media de todas las lecturas de cada comunidad en el rango (índice codigo_ca)."""
+        suma, n = self._suma_rango(metrica, fecha_inicio, fecha_fin)
+        limites = self._limites_comunidades()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            media = np.add.reduceat(suma, limites) / np.add.reduceat(n, limites)
+        return pd.Series(media, index=pd.Index(self.codigos_ca, name="codigo_ca"), name=metrica)
+
+    def a_largo(self, fecha_inicio=None, fecha_fin=None) -> pd.DataFrame:
+        """Vuelve al formato largo (fecha, indicativo, codigo_prov, métricas) sin las filas vacías."""
+        rango = self.rango(fecha_inicio, fecha_fin)
+        bloque = self.valores[:, rango, :]
+        fila, dia = np.nonzero(~np.isnan(bloque).all(axis=2))
+        df = pd.DataFrame(bloque[fila, dia, :], columns=self.metricas)
+        df.insert(0, "fecha", self.fechas[rango][dia])
+        df.insert(1, "indicativo", self.estaciones[fila])
+        df.insert(2, "codigo_prov", self.codigos_prov[self.provincia[fila]])
+        return df
+
+
+def construir(usar_cache: bool = True) -> CuboMeteorologico:
+    """
+    Lee datos_meteorologicos del almacén configurado y construye el cubo.
+
+    Returns:
+        CuboMeteorologico: El cubo, o None si no hay datos.
+    """
+    from src import extraer_datos
+
+    detalle = extraer_datos.leer_detalle(
+        ["fecha", "indicativo", "nombre", "codigo_prov", "altitud"] + METRICAS, usar_cache=usar_cache
+    )
+    if detalle.empty:
+        return None
+    return CuboMeteorologico.desde_detalle(detalle, extraer_datos.leer_tabla("provincias"))
+
+
+def cubo_vigente() -> CuboMeteorologico:
+    """
+    Retorna el cubo compartido por todas las sesiones, reconstruido solo cuando
+    cambia la versión de los datos (una nueva carga de popular.py).
+    """
+    global _cubo
+    from src import extraer_datos
+
+    version = extraer_datos.version_vigente()
+    with _cerrojo:
+        if _cubo[1] is None or _cubo[0] != version:
+            inicio = time.perf_counter()
+            # El detalle no pasa por la caché de consultas: el cubo lo sustituye y
+            # guardarlo también duplicaría la memoria que el cubo ahorra
+            _cubo = (version, construir(usar_cache=False))
+            if _cubo[1] is not None:
+                print(f"Cubo {_cubo[1].forma} construido en {time.perf_counter() - inicio:.2f} s "
+                      f"({_cubo[1].nbytes / 2**20:.1f} MB).")
+        return _cubo[1]
+
+
+def _detalle_sintetico(estaciones: int, dias: int, semilla: int = 0) -> tuple:
+    """Filas de detalle y tabla de provincias sintéticas, con un 5 % de lecturas ausentes."""
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range("2023-05-29", periods=dias, freq="D")
+    codigo_prov = np.arange(estaciones) % 52 + 1
+    provincias = pd.DataFrame({"codigo_prov": np.arange(1, 53), "codigo_ca": np.arange(52) % 19 + 1})
+    e, d = np.meshgrid(np.arange(estaciones), np.arange(dias), indexing="ij")
+    e, d = e.ravel(), d.ravel()
+    conservar = rng.random(e.size) >= 0.05
+    e, d = e[conservar], d[conservar]
+    detalle = pd.DataFrame({
+        "fecha": fechas[d].date,
+        "indicativo": np.char.add("E", e.astype(str)).astype(object),
+        "nombre": np.char.add("ESTACION ", e.astype(str)).astype(object),
+        "codigo_prov": codigo_prov[e],
+        "altitud": (e * 17 % 1500).astype(np.float64),
+    })
+    for m in METRICAS:
+        detalle[m] = np.round(rng.normal(15, 8, e.size), 1)
+    return detalle, provincias
+
+
+if __name__ == "__main__":
+    # python -m src.cubo [estaciones] [días]
+    # Memoria y tiempo de agregados por rango: DataFrame largo frente al cubo.
+    estaciones = int(sys.argv[1]) if len(sys.argv) > 1 else 55
+    dias = int(sys.argv[2]) if len(sys.argv) > 2 else 730
+    detalle, provincias = _detalle_sintetico(estaciones, dias)
+    print(f"{estaciones} estaciones × {dias} días ({len(detalle)} filas).")
+
+    inicio = time.perf_counter()
+    cubo = CuboMeteorologico.desde_detalle(detalle, provincias)
+    print(f"Construcción: {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    cubo._acumulados("tmed")
+    memoria_df = detalle.memory_usage(deep=True).sum()
+    print(f"Memoria: DataFrame {memoria_df / 2**20:.1f} MB, cubo con acumulados {cubo.nbytes / 2**20:.2f} MB "
+          f"({cubo.nbytes / memoria_df:.0%})")
+
+    desde, hasta = date(2023, 9, 1), date(2024, 8, 31)
+    fechas = pd.to_datetime(detalle["fecha"])
+
+    def con_pandas():
+        mascara = (fechas >= pd.Timestamp(desde)) & (fechas <= pd.Timestamp(hasta))
+        return detalle[mascara].groupby("codigo_prov")["tmed"].mean()
+
+    referencia = con_pandas()
+    resultado = cubo.media_provincias("tmed", desde, hasta)
+    assert np.allclose(referencia.to_numpy(), resultado.loc[referencia.index].to_numpy(), atol=1e-4)
+    por_ca = detalle.assign(codigo_ca=detalle["codigo_prov"].map(provincias.set_index("codigo_prov")["codigo_ca"]))
+    referencia_ca = por_ca[(fechas >= pd.Timestamp(desde)) & (fechas <= pd.Timestamp(hasta))].groupby("codigo_ca")["tmed"].mean()
+    assert np.allclose(referencia_ca.to_numpy(), cubo.media_comunidades("tmed", desde, hasta).loc[referencia_ca.index].to_numpy(), atol=1e-4)
+    referencia_dia = detalle.groupby("fecha")["tmed"].mean().to_numpy()
+    assert np.allclose(referencia_dia, cubo.reducir("tmed", "estacion"), atol=1e-4)
+
+    for nombre, funcion in [
+        ("pandas (máscara + groupby)", con_pandas),
+        ("cubo media_provincias", lambda: cubo.media_provincias("tmed", desde, hasta)),
+        ("cubo media_comunidades", lambda: cubo.media_comunidades("tmed", desde, hasta)),
+        ("cubo reducir nanmean por estación", lambda: cubo.reducir("tmed", "dia", np.nanmean, desde, hasta)),
+    ]:
+        repeticiones = 20 if nombre.startswith("pandas") else 2000
+        segundos = timeit.timeit(funcion, number=repeticiones) / repeticiones
+        print(f"{nombre}: {segundos * 1e6:.0f} µs")
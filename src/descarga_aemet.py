@@ -0,0 +1,481 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.puntos_control import PuntosControl, ventanas_incrementales
+
+
+URL_BASE = "https://opendata.aemet.es/opendata/api"
+RUTA_DIARIOS = (
+    "/valores/climatologicos/diarios/datos/"
+    "fechaini/{fechaini}/fechafin/{fechafin}/estacion/{indicativo}"
+)
+
+CSV_ESTACIONES = "data/estaciones_filtradas.csv"
+ARCHIVO_SALIDA = "data/temperaturas_historicas_ampliadas.csv"
+
+# 4 rangos de fechas para cubrir 2 años (la API limita cada petición a 6 meses)
+FECHAS = [
+    ("2023-05-29T00:00:00UTC", "2023-11-28T00:00:00UTC"),
+    ("2023-11-29T00:00:00UTC", "2024-05-28T00:00:00UTC"),
+    ("2024-05-29T00:00:00UTC", "2024-11-28T00:00:00UTC"),
+    ("2024-11-29T00:00:00UTC", "2025-05-28T00:00:00UTC"),
+]
+
+# Campos de los valores climatológicos diarios de la API, más los que añade
+# descargar_trabajo. Una estación omite los que no mide, así que la cabecera del
+# CSV se fija con la lista completa y no con las columnas de la primera unidad.
+COLUMNAS_DIARIAS = [
+    "fecha", "indicativo", "nombre", "provincia", "altitud",
+    "tmed", "prec", "tmin", "horatmin", "tmax", "horatmax",
+    "dir", "velmedia", "racha", "horaracha", "sol",
+    "presMax", "horaPresMax", "presMin", "horaPresMin",
+    "hrMedia", "hrMax", "horaHrMax", "hrMin", "horaHrMin",
+    "idema", "nombre_estacion", "timestamp_extraccion", "id_descarga",
+]
+
+# Respuestas que indican saturación o fallo temporal del servidor
+ESTADOS_REINTENTO = {429, 500, 502, 503, 504}
+
+
+class ErrorDescarga(Exception):
+    """Fallo definitivo de una petición (no se reintenta)."""
+
+
+class ErrorReintentable(ErrorDescarga):
+    """Fallo temporal: cuota agotada o error del servidor."""
+
+    def __init__(self, mensaje: str, espera: float = None):
+        super().__init__(mensaje)
+        self.espera = espera  # Segundos indicados por Retry-After, si los hay
+
+
+class LimitadorTokens:
+    """
+    Cubo de tokens compartido entre hilos: cada petición consume un token y los
+    tokens se reponen a ritmo constante hasta la capacidad máxima.
+    """
+
+    def __init__(self, tasa: float, capacidad: int = 1):
+        """
+        Args:
+            tasa (float): Tokens repuestos por segundo.
+            capacidad (int): Ráfaga máxima de peticiones seguidas.
+        """
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self._tokens = float(capacidad)
+        self._ultimo = time.monotonic()
+        self._cerrojo = threading.Lock()
+
+    def adquirir(self):
+        """Bloquea hasta que haya un token disponible y lo consume."""
+        while True:
+            with self._cerrojo:
+                ahora = time.monotonic()
+                self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+                self._ultimo = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.tasa
+            time.sleep(espera)
+
+
+@dataclass
+class Trabajo:
+    """Una estación y una ventana de fechas de la API."""
+
+    indicativo: str
+    nombre: str
+    fechaini: str
+    fechafin: str
+
+
+@dataclass
+class ResultadoTrabajo:
+    """Resultado de un trabajo: filas descargadas o el error que lo hizo fallar."""
+
+    trabajo: Trabajo
+    filas: list = field(default_factory=list)
+    error: str = None
+    intentos: int = 0
+    duracion: float = 0.0
+
+    @property
+    def correcto(self) -> bool:
+        return self.error is None
+
+
+class DescargadorAEMET:
+    """
+    Descarga valores climatológicos diarios de varias estaciones en paralelo.
+
+    Cada trabajo sigue el protocolo de dos pasos de la API: la primera petición
+    devuelve un JSON con la URL de 'datos' y la segunda descarga esos datos.
+    Todas las peticiones pasan por un mismo LimitadorTokens ajustado a la cuota.
+    """
+
+    def __init__(self, api_key: str, url_base: str = URL_BASE, peticiones_por_minuto: float = 40,
+                 hilos: int = 4, reintentos: int = 5, espera_base: float = 2.0,
+                 espera_max: float = 60.0, timeout: float = 30.0, id_descarga: str = None):
+        """
+        Args:
+            api_key (str): Clave de la API de AEMET.
+            url_base (str): Raíz de la API (se puede apuntar a un servidor simulado).
+            peticiones_por_minuto (float): Cuota total repartida entre todos los hilos.
+            hilos (int): Trabajos descargados a la vez.
+            reintentos (int): Reintentos por petición ante 429/5xx o errores de red.
+            espera_base (float): Espera inicial del retroceso exponencial (s).
+            espera_max (float): Espera máxima entre reintentos (s).
+            timeout (float): Tiempo máximo por petición HTTP (s).
+            id_descarga (str): Identificador de la descarga; se genera uno si no se indica.
+        """
+        self.api_key = api_key
+        self.url_base = url_base.rstrip("/")
+        self.limitador = LimitadorTokens(peticiones_por_minuto / 60.0)
+        self.hilos = hilos
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.timeout = timeout
+        self.id_descarga = id_descarga or str(uuid.uuid4())
+        self._local = threading.local()
+
+    def _sesion(self) -> requests.Session:
+        """Sesión HTTP propia de cada hilo, que mantiene vivas sus conexiones."""
+        sesion = getattr(self._local, "sesion", None)
+        if sesion is None:
+            sesion = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=2, pool_maxsize=2)
+            sesion.mount("http://", adaptador)
+            sesion.mount("https://", adaptador)
+            self._local.sesion = sesion
+        return sesion
+
+    def _pedir_json(self, url: str, params: dict = None):
+        """Hace una petición GET respetando la cuota y devuelve el JSON."""
+        self.limitador.adquirir()
+        try:
+            respuesta = self._sesion().get(url, params=params, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise ErrorReintentable(f"Error de red: {e}")
+
+        if respuesta.status_code in ESTADOS_REINTENTO:
+            espera = respuesta.headers.get("Retry-After")
+            raise ErrorReintentable(
+                f"HTTP {respuesta.status_code} en {url}",
+                float(espera) if espera and espera.isdigit() else None,
+            )
+        if respuesta.status_code == 404:
+            # "No hay datos que satisfagan esos criterios de búsqueda"
+            return {"estado": 404}
+        if respuesta.status_code != 200:
+            raise ErrorDescarga(f"HTTP {respuesta.status_code} en {url}")
+
+        contenido = respuesta.json()
+        # La API a veces responde 200 con el error real en el campo 'estado'
+        if isinstance(contenido, dict) and contenido.get("estado") in ESTADOS_REINTENTO:
+            raise ErrorReintentable(f"Estado {contenido['estado']}: {contenido.get('descripcion')}")
+        return contenido
+
+    def _con_reintentos(self, url: str, params: dict, resultado: ResultadoTrabajo):
+        """Repite la petición con retroceso exponencial y jitter ante fallos temporales."""
+        for intento in range(self.reintentos + 1):
+            resultado.intentos += 1
+            try:
+                return self._pedir_json(url, params)
+            except ErrorReintentable as e:
+                if intento == self.reintentos:
+                    raise
+                espera = e.espera or random.uniform(0, min(self.espera_max, self.espera_base * 2 ** intento))
+                time.sleep(espera)
+
+    def descargar_trabajo(self, trabajo: Trabajo) -> ResultadoTrabajo:
+        """Descarga una estación y una ventana de fechas."""
+        resultado = ResultadoTrabajo(trabajo)
+        inicio = time.perf_counter()
+        try:
+            url_meta = self.url_base + RUTA_DIARIOS.format(
+                fechaini=trabajo.fechaini, fechafin=trabajo.fechafin, indicativo=trabajo.indicativo
+            )
+            meta = self._con_reintentos(url_meta, {"api_key": self.api_key}, resultado)
+            url_datos = meta.get("datos") if isinstance(meta, dict) else None
+            if url_datos:
+                datos_json = self._con_reintentos(url_datos, None, resultado)
+                if not isinstance(datos_json, list):
+                    raise ErrorDescarga(f"Respuesta de datos inesperada: {datos_json}")
+                marca = datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+                for fila in datos_json:
+                    fila["idema"] = trabajo.indicativo
+                    fila["nombre_estacion"] = trabajo.nombre
+                    fila["timestamp_extraccion"] = marca
+                    fila["id_descarga"] = self.id_descarga  # ID de descarga
+                resultado.filas = datos_json
+            elif isinstance(meta, dict) and meta.get("estado") == 404:
+                # Sin datos para esa estación y ventana: no es un fallo
+                pass
+            else:
+                raise ErrorDescarga(f"Respuesta sin URL de datos: {meta}")
+        except Exception as e:
+            resultado.error = str(e)
+        resultado.duracion = time.perf_counter() - inicio
+        return resultado
+
+    def descargar(self, trabajos: list, al_completar=None) -> list:
+        """
+        Descarga todos los trabajos en paralelo.
+
+        Args:
+            trabajos (list): Lista de Trabajo.
+            al_completar (callable): Se llama con cada ResultadoTrabajo en cuanto termina.
+
+        Returns:
+            list: Un ResultadoTrabajo por trabajo, en orden de finalización.
+        """
+        resultados = []
+        with ThreadPoolExecutor(max_workers=self.hilos) as ejecutor:
+            futuros = [ejecutor.submit(self.descargar_trabajo, t) for t in trabajos]
+            for futuro in as_completed(futuros):
+                resultado = futuro.result()
+                resultados.append(resultado)
+                if al_completar:
+                    al_completar(resultado)
+        return resultados
+
+
+def trabajos_desde_estaciones(estaciones: pd.DataFrame, ventanas: list = FECHAS,
+                              puntos: PuntosControl = None, hasta: date = None) -> list:
+    """
+    Crea los trabajos pendientes de cada estación.
+
+    Sin puntos de control, un Trabajo por estación y ventana. Con puntos de control
+    se añaden además los días posteriores a las ventanas fijas (hasta `hasta`, por
+    defecto ayer), empezando tras la marca de agua de cada estación, y se descartan
+    las unidades ya completadas.
+    """
+    if not puntos:
+        return [
+            Trabajo(str(fila["indicativo"]), fila["nombre"], fechaini, fechafin)
+            for _, fila in estaciones.iterrows()
+            for fechaini, fechafin in ventanas
+        ]
+
+    hasta = hasta or date.today() - timedelta(days=1)
+    fin_ventanas = max(date.fromisoformat(fechafin[:10]) for _, fechafin in ventanas)
+    trabajos = []
+    for _, fila in estaciones.iterrows():
+        indicativo = str(fila["indicativo"])
+        marca = puntos.marca(indicativo)
+        desde = max(marca, fin_ventanas) if marca else fin_ventanas
+        for fechaini, fechafin in ventanas + ventanas_incrementales(desde + timedelta(days=1), hasta):
+            trabajos.append(Trabajo(indicativo, fila["nombre"], fechaini, fechafin))
+    return puntos.pendientes(trabajos)
+
+
+class GuardadoPorUnidad:
+    """
+    Añade al CSV de salida las filas de cada unidad en cuanto termina y solo
+    después la anota en los puntos de control, de modo que un fallo a mitad de
+    la descarga no pierde lo ya descargado.
+
+    La cabecera parte de COLUMNAS_DIARIAS; si una unidad trae un campo que no está
+    en ella, se reescribe el archivo con la columna nueva (vacía en las filas
+    anteriores) en lugar de descartarlo.
+    """
+
+    def __init__(self, ruta: str, puntos: PuntosControl):
+        self.ruta = ruta
+        self.puntos = puntos
+        self.filas = 0
+        # Se mantienen las columnas del archivo existente para poder seguir añadiendo
+        self.columnas = pd.read_csv(ruta, nrows=0).columns.tolist() if os.path.exists(ruta) else None
+
+    def _ampliar_cabecera(self, nuevas: list) -> None:
+        """Reescribe el CSV con las columnas nuevas al final (se reemplaza de forma atómica)."""
+        existente = pd.read_csv(self.ruta, dtype=str, keep_default_na=False)
+        self.columnas = self.columnas + nuevas
+        temporal = f"{self.ruta}.{os.getpid()}.tmp"
+        existente.reindex(columns=self.columnas, fill_value="").to_csv(temporal, index=False)
+        os.replace(temporal, self.ruta)
+        print(f"Columnas nuevas en {self.ruta}: {', '.join(nuevas)}.")
+
+    def __call__(self, resultado: ResultadoTrabajo) -> None:
+        if not resultado.correcto:
+            return
+        if resultado.filas:
+            df = pd.DataFrame(resultado.filas)
+            if self.columnas is None:
+                self.columnas = COLUMNAS_DIARIAS + [c for c in df.columns if c not in COLUMNAS_DIARIAS]
+                df.reindex(columns=self.columnas).to_csv(self.ruta, index=False)
+            else:
+                nuevas = [c for c in df.columns if c not in self.columnas]
+                if nuevas:
+                    self._ampliar_cabecera(nuevas)
+                df.reindex(columns=self.columnas).to_csv(self.ruta, mode="a", index=False, header=False)
+            self.filas += len(df)
+        self.puntos.registrar(resultado)
+
+
+def resumir(resultados: list) -> None:
+    """Muestra filas descargadas y fallos por trabajo."""
+    fallidos = [r for r in resultados if not r.correcto]
+    filas = sum(len(r.filas) for r in resultados)
+    print(f"{len(resultados)} trabajos, {filas} filas, {len(fallidos)} fallidos.")
+    for r in fallidos:
+        t = r.trabajo
+        print(f"  - {t.indicativo} {t.fechaini}..{t.fechafin}: {r.error} ({r.intentos} intentos)")
+
+
+# Comportamiento del servidor simulado por estación: (fallos de la petición de
+# metadatos, fallos de la de datos, filas). Los fallos son (estado HTTP, cabeceras).
+_ESCENARIOS = {
+    "NORMAL": ([], [], 3),
+    "CUOTA": ([(429, {"Retry-After": "1"})], [], 2),
+    "SERVIDOR": ([], [(503, {}), (502, {})], 4),
+    "ESTADO": ([(200, {"estado": 429})], [], 1),  # 200 con el error en el cuerpo
+    "SIN_DATOS": ([(404, {})] * 10, [], 0),
+    "CAIDA": ([(500, {})] * 10, [], 0),
+    "PROHIBIDA": ([(401, {})] * 10, [], 0),
+}
+
+
+class _ServidorSimulado(BaseHTTPRequestHandler):
+    """
+    Imita los dos pasos de la API: la petición de la estación devuelve un JSON con la
+    URL de 'datos' y esa URL devuelve las filas. Los fallos de _ESCENARIOS se sirven
+    en orden, una vez por petición, antes de la respuesta correcta.
+    """
+
+    protocol_version = "HTTP/1.1"  # Conexiones persistentes, como la API real
+    cerrojo = threading.Lock()
+    peticiones = {}  # (paso, estación, ventana) -> peticiones recibidas
+    conexiones = set()  # Puertos de cliente distintos
+    claves = set()  # api_key recibidas
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, estado: int, contenido, cabeceras: dict = None):
+        cuerpo = json.dumps(contenido).encode()
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        ruta, _, consulta = self.path.partition("?")
+        partes = ruta.strip("/").split("/")
+        if partes[0] == "datos":
+            paso, indicativo, ventana = "datos", partes[1], partes[2]
+        else:
+            paso, indicativo, ventana = "meta", partes[-1], partes[-5]
+        with self.cerrojo:
+            clave = (paso, indicativo, ventana)
+            numero = self.peticiones.get(clave, 0)
+            self.peticiones[clave] = numero + 1
+            self.conexiones.add(self.client_address[1])
+            if paso == "meta":
+                self.claves.add(consulta)
+
+        fallos_meta, fallos_datos, filas = _ESCENARIOS[indicativo]
+        fallos = fallos_meta if paso == "meta" else fallos_datos
+        if numero < len(fallos):
+            estado, extra = fallos[numero]
+            if estado == 200:
+                return self._responder(200, extra)
+            if estado == 404:
+                return self._responder(404, {"descripcion": "No hay datos que satisfagan esos criterios de búsqueda",
+                                             "estado": 404})
+            return self._responder(estado, {"estado": estado}, extra)
+        if paso == "meta":
+            host, puerto = self.server.server_address
+            return self._responder(200, {"estado": 200, "datos": f"http://{host}:{puerto}/datos/{indicativo}/{ventana}"})
+        self._responder(200, [{"fecha": f"2024-01-{dia + 1:02d}", "tmed": "10,5"} for dia in range(filas)])
+
+
+def _prueba() -> None:
+    """
+    Descarga contra un servidor HTTP local que imita la API y comprueba filas,
+    intentos y fallos de cada trabajo.
+    """
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _ServidorSimulado)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host, puerto = servidor.server_address
+    hilos, reintentos = 4, 3
+
+    estaciones = pd.DataFrame({"indicativo": list(_ESCENARIOS), "nombre": [e.title() for e in _ESCENARIOS]})
+    trabajos = trabajos_desde_estaciones(estaciones, FECHAS[:2])
+    descargador = DescargadorAEMET("clave-prueba", url_base=f"http://{host}:{puerto}", peticiones_por_minuto=6000,
+                                   hilos=hilos, reintentos=reintentos, espera_base=0.01, timeout=5)
+    inicio = time.perf_counter()
+    resultados = descargador.descargar(trabajos)
+    duracion = time.perf_counter() - inicio
+    servidor.shutdown()
+    resumir(resultados)
+
+    # (filas, intentos, correcto) esperados de cada trabajo
+    esperado = {
+        "NORMAL": (3, 2, True),
+        "CUOTA": (2, 3, True),
+        "SERVIDOR": (4, 4, True),
+        "ESTADO": (1, 3, True),
+        "SIN_DATOS": (0, 1, True),
+        "CAIDA": (0, reintentos + 1, False),
+        "PROHIBIDA": (0, 1, False),
+    }
+    assert len(resultados) == len(trabajos)
+    for resultado in resultados:
+        indicativo = resultado.trabajo.indicativo
+        obtenido = (len(resultado.filas), resultado.intentos, resultado.correcto)
+        assert obtenido == esperado[indicativo], f"{indicativo}: {obtenido} en lugar de {esperado[indicativo]}"
+        assert all(f["idema"] == indicativo and f["id_descarga"] == descargador.id_descarga for f in resultado.filas)
+    errores = {r.trabajo.indicativo: r.error for r in resultados if not r.correcto}
+    assert "HTTP 500" in errores["CAIDA"] and "HTTP 401" in errores["PROHIBIDA"]
+    assert _ServidorSimulado.claves == {"api_key=clave-prueba"}
+    # Cada hilo reutiliza su sesión: pocas conexiones para todas las peticiones
+    peticiones = sum(_ServidorSimulado.peticiones.values())
+    assert len(_ServidorSimulado.conexiones) <= 2 * hilos, _ServidorSimulado.conexiones
+    # El 429 con Retry-After: 1 obliga a esperar al menos un segundo
+    assert duracion >= 1
+    print(f"{peticiones} peticiones en {len(_ServidorSimulado.conexiones)} conexiones, {duracion:.2f} s. Todo correcto.")
+
+
+if __name__ == "__main__":
+    # python -m src.descarga_aemet          -> descarga real (requiere AEMET_API_KEY en el entorno)
+    # python -m src.descarga_aemet prueba   -> comprobación contra un servidor simulado local
+    # La descarga real se puede interrumpir y relanzar: continúa por las unidades pendientes.
+    if len(sys.argv) > 1 and sys.argv[1] == "prueba":
+        _prueba()
+        sys.exit()
+
+    estaciones = pd.read_csv(CSV_ESTACIONES)
+    puntos = PuntosControl()
+    guardado = GuardadoPorUnidad(ARCHIVO_SALIDA, puntos)
+    trabajos = trabajos_desde_estaciones(estaciones, puntos=puntos)
+    print(f"{len(trabajos)} unidades pendientes.")
+
+    descargador = DescargadorAEMET(os.getenv("AEMET_API_KEY"))
+    resultados = descargador.descargar(trabajos, al_completar=guardado)
+    resumir(resultados)
+    puntos.cerrar()
+
+    if guardado.filas:
+        print(f"Se han guardado {guardado.filas} filas nuevas en {ARCHIVO_SALIDA}.")
+    else:
+        print("No se obtuvieron datos nuevos.")
@@ -0,0 +1,411 @@
+import sys
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src import extraer_datos
+
+
+# Columnas con una cifra decimal (DECIMAL(4,1) o similar): sus valores distintos son
+# pocos, así que una tabla de frecuencias (valor, número de filas) es exacta y pequeña
+COLUMNAS_FRECUENCIAS = ["tmed", "tmin", "tmax", "prec", "velmedia", "racha", "hrMedia"]
+
+# Todas ellas tienen una cifra decimal: los valores se guardan en float32 y se
+# redondean a esta precisión al pasarlos a float64 para calcular
+DECIMALES = 1
+
+# Claves de agrupación de la tabla de frecuencias
+AGRUPACIONES = {
+    "mes": ["anio", "mes"],
+}
+
+_SQL_FRECUENCIAS = {
+    "mes": (
+        "SELECT YEAR(fecha) AS anio, MONTH(fecha) AS mes, {columna} AS valor, COUNT(*) AS n\n"
+        "FROM datos_meteorologicos\n"
+        "WHERE {columna} IS NOT NULL\n"
+        "GROUP BY anio, mes, valor\n"
+        "ORDER BY anio, mes, valor"
+    ),
+}
+
+# Resumen diario agregado en el servidor: una fila por día, sea cual sea el número
+# de estaciones. La mediana exacta se toma de las filas centrales de cada día con
+# funciones de ventana (MySQL 8): la fila (n + 1) / 2 si n es impar y la media de
+# las filas n / 2 y n / 2 + 1 si es par, como pandas.
+_SQL_DIARIO = (
+    "SELECT fecha, COUNT(*) AS count, AVG(valor) AS mean, MIN(valor) AS min,\n"
+    "       AVG(CASE WHEN 2 * fila IN (n, n + 1, n + 2) THEN valor END) AS mediana,\n"
+    "       MAX(valor) AS max\n"
+    "FROM (\n"
+    "    SELECT fecha, {columna} AS valor,\n"
+    "           ROW_NUMBER() OVER (PARTITION BY fecha ORDER BY {columna}) AS fila,\n"
+    "           COUNT(*) OVER (PARTITION BY fecha) AS n\n"
+    "    FROM datos_meteorologicos\n"
+    "    WHERE {columna} IS NOT NULL\n"
+    ") AS ordenadas\n"
+    "GROUP BY fecha\n"
+    "ORDER BY fecha"
+)
+
+COLUMNAS_DIARIO = ["count", "mean", "min", "50%", "max"]
+
+
+def frecuencias(columna: str = "tmed", por: str = "mes", usar_cache: bool = True) -> pd.DataFrame:
+    """
+    Tabla de frecuencias de una columna: cuántas filas tienen cada valor en cada mes.
+
+    Con MySQL se agrega en el servidor; con los almacenes locales se leen solo la
+    fecha y la columna. En ambos casos el tamaño del
+    resultado depende del número de valores distintos, no del número de estaciones.
+
+    Args:
+        columna (str): Columna de datos_meteorologicos (ver COLUMNAS_FRECUENCIAS).
+        por (str): 'mes' (anio, mes, valor, n).
+        usar_cache (bool): Si es False se consulta siempre el almacén.
+
+    Returns:
+        pd.DataFrame: Ordenada por claves y valor; vacía si ocurre un error.
+    """
+    if columna not in COLUMNAS_FRECUENCIAS:
+        raise ValueError(f"Columna sin tabla de frecuencias: {columna}")
+    if por not in AGRUPACIONES:
+        raise ValueError(f"Agrupación desconocida: {por}")
+    claves = AGRUPACIONES[por]
+
+    if extraer_datos.ALMACEN == "mysql":
+        frec = extraer_datos.ejecutar_consulta_a_dataframe(
+            _SQL_FRECUENCIAS[por].format(columna=columna), usar_cache=usar_cache
+        )
+    else:
+        detalle = extraer_datos.leer_detalle(["fecha", columna], usar_cache=usar_cache)
+        if detalle.empty:
+            return pd.DataFrame(columns=[*claves, "valor", "n"])
+        # float32 basta para una cifra decimal y reduce a la mitad la memoria del groupby
+        detalle = detalle.dropna(subset=[columna]).astype({columna: np.float32})
+        fechas = pd.to_datetime(detalle["fecha"])
+        agrupar = [fechas.dt.year.rename("anio"), fechas.dt.month.rename("mes")]
+        frec = (
+            detalle.groupby([*agrupar, detalle[columna].rename("valor")], sort=True)
+            .size().rename("n").reset_index()
+        )
+
+    if frec.empty:
+        return frec
+    # DECIMAL llega como Decimal desde PyMySQL
+    frec["valor"] = frec["valor"].astype(np.float32)
+    frec["n"] = frec["n"].astype(np.int32)
+    return frec.sort_values([*claves, "valor"], ignore_index=True)
+
+
+def diario(columna: str = "tmed", usar_cache: bool = True) -> pd.DataFrame:
+    """
+    Lecturas, media, mínimo, mediana y máximo exactos de una columna por día.
+
+    Con MySQL se agrega en el servidor con GROUP BY fecha (ver _SQL_DIARIO), así que
+    se transfiere una fila por día; con los almacenes locales se agrega el detalle.
+
+    Returns:
+        pd.DataFrame: Índice fecha y columnas COLUMNAS_DIARIO; vacío si no hay datos.
+    """
+    if columna not in COLUMNAS_FRECUENCIAS:
+        raise ValueError(f"Columna sin resumen diario: {columna}")
+    vacio = pd.DataFrame(columns=COLUMNAS_DIARIO, index=pd.DatetimeIndex([], name="fecha"))
+
+    if extraer_datos.ALMACEN == "mysql":
+        dia = extraer_datos.ejecutar_consulta_a_dataframe(_SQL_DIARIO.format(columna=columna), usar_cache=usar_cache)
+        if dia.empty:
+            return vacio
+        dia = dia.rename(columns={"mediana": "50%"})
+    else:
+        detalle = extraer_datos.leer_detalle(["fecha", columna], usar_cache=usar_cache)
+        if detalle.empty:
+            return vacio
+        dia = _diario_detalle(detalle, columna)
+
+    # AVG y DECIMAL llegan como Decimal desde PyMySQL
+    dia = dia.astype({"count": np.int64, **{c: np.float64 for c in COLUMNAS_DIARIO[1:]}})
+    dia["fecha"] = pd.to_datetime(dia["fecha"])
+    return dia.set_index("fecha")[COLUMNAS_DIARIO]
+
+
+def _diario_detalle(detalle: pd.DataFrame, columna: str) -> pd.DataFrame:
+    """Lo que agrega _SQL_DIARIO, sobre filas (fecha, columna)."""
+    detalle = detalle.dropna(subset=[columna])
+    valores = np.round(detalle[columna].astype(np.float64), DECIMALES)
+    dia = valores.groupby(pd.to_datetime(detalle["fecha"]).rename("fecha"), sort=True).agg(
+        ["count", "mean", "min", "median", "max"]
+    )
+    return dia.rename(columns={"median": "50%"}).reset_index()
+
+
+ESTADISTICOS = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+
+# Niveles que resumir() calcula a partir de la tabla mensual
+NIVELES = {
+    "mensual": ["anio", "mes"],
+    "anual": ["anio"],
+    "por_mes": ["mes"],
+    "total": [],
+}
+
+
+@dataclass
+class ResumenEstadistico:
+    """
+    Estadísticas de una columna en todos los niveles, calculadas en una sola pasada.
+
+    Cada DataFrame tiene las columnas de describe() (ESTADISTICOS) más las de Tukey:
+    limite_bajo, limite_alto, whislo, whishi y n_atipicos.
+    """
+    columna: str
+    mensual: pd.DataFrame  # índice (anio, mes)
+    anual: pd.DataFrame  # índice anio
+    por_mes: pd.DataFrame  # índice mes, todos los años juntos
+    total: pd.Series
+    diario: pd.DataFrame  # índice fecha, columnas COLUMNAS_DIARIO (ver diario()); vacío si no se pasó
+    histograma: pd.Series  # filas por valor
+    cajas_mes: list  # un diccionario por mes, en el formato de Axes.bxp
+    caja_total: dict
+
+    @property
+    def vacio(self) -> bool:
+        return self.total["count"] == 0
+
+
+def _una_pasada(ids: np.ndarray, valores: np.ndarray, pesos: np.ndarray, grupos: int, whis: float) -> tuple:
+    """
+    describe() y estadísticas de caja de todos los grupos a la vez.
+
+    Args:
+        ids (np.ndarray): Grupo (0..grupos-1) de cada fila.
+        valores (np.ndarray): Valor de cada fila (float64).
+        pesos (np.ndarray): Filas originales que representa cada fila.
+        grupos (int): Número de grupos; todos deben tener al menos una fila.
+        whis (float): Longitud de los bigotes en rangos intercuartílicos.
+
+    Returns:
+        tuple: (DataFrame con una fila por grupo, ids, valores y máscara de atípicos
+               de las filas ya ordenadas por grupo y valor)
+    """
+    orden = np.lexsort((valores, ids))
+    ids, valores, pesos = ids[orden], valores[orden], pesos[orden]
+
+    # Posición que ocuparía cada fila si se expandiera la tabla; con ella los
+    # cuantiles se buscan con searchsorted en lugar de ordenar los datos originales
+    acumulado = np.cumsum(pesos)
+    cortes = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    inicio = (acumulado - pesos)[cortes]
+    total = np.bincount(ids, weights=pesos, minlength=grupos)
+
+    def valor_en(posiciones):
+        return valores[np.searchsorted(acumulado, posiciones, side="right")]
+
+    def cuantil(q):
+        # Interpolación lineal, como pandas y numpy
+        h = (total - 1) * q
+        abajo = np.floor(h)
+        v_abajo, v_arriba = valor_en(inicio + abajo), valor_en(inicio + np.ceil(h))
+        return v_abajo + (h - abajo) * (v_arriba - v_abajo)
+
+    media = np.bincount(ids, weights=valores * pesos, minlength=grupos) / total
+    suma_cuadrados = np.bincount(ids, weights=pesos * (valores - media[ids]) ** 2, minlength=grupos)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = np.sqrt(suma_cuadrados / (total - 1))
+
+    q1, mediana, q3 = cuantil(0.25), cuantil(0.5), cuantil(0.75)
+    limite_bajo, limite_alto = q1 - whis * (q3 - q1), q3 + whis * (q3 - q1)
+    dentro = (valores >= limite_bajo[ids]) & (valores <= limite_alto[ids])
+
+    # Bigotes: dato más extremo dentro de los límites (como matplotlib.cbook.boxplot_stats)
+    whislo = np.minimum.reduceat(np.where(dentro, valores, np.inf), cortes)
+    whishi = np.maximum.reduceat(np.where(dentro, valores, -np.inf), cortes)
+    whislo = np.where(np.isfinite(whislo), whislo, q1)
+    whishi = np.where(np.isfinite(whishi), whishi, q3)
+
+    estadisticas = pd.DataFrame({
+        "count": total,
+        "mean": media,
+        "std": std,
+        "min": valor_en(inicio),
+        "25%": q1,
+        "50%": mediana,
+        "75%": q3,
+        "max": valor_en(inicio + total - 1),
+        "limite_bajo": limite_bajo,
+        "limite_alto": limite_alto,
+        "whislo": whislo,
+        "whishi": whishi,
+        "n_atipicos": np.bincount(ids, weights=np.where(dentro, 0, pesos), minlength=grupos).astype(np.int64),
+    })
+    fuera = (valores < whislo[ids]) | (valores > whishi[ids])
+    return estadisticas, ids, valores, fuera
+
+
+def _cajas(estadisticas: pd.DataFrame, etiquetas, ids: np.ndarray, valores: np.ndarray, fuera: np.ndarray,
+           desde: int) -> list:
+    """Diccionarios para Axes.bxp de los grupos desde..desde+len(etiquetas)."""
+    cajas = []
+    for i, etiqueta in enumerate(etiquetas):
+        fila = estadisticas.iloc[desde + i]
+        seleccion = (ids == desde + i) & fuera
+        cajas.append({
+            "label": etiqueta,
+            "mean": fila["mean"],
+            "med": fila["50%"],
+            "q1": fila["25%"],
+            "q3": fila["75%"],
+            "whislo": fila["whislo"],
+            "whishi": fila["whishi"],
+            "fliers": np.unique(valores[seleccion]),
+        })
+    return cajas
+
+
+def resumir(frec_mes: pd.DataFrame, por_dia: pd.DataFrame = None, columna: str = "tmed",
+            whis: float = 1.5) -> ResumenEstadistico:
+    """
+    Calcula los resúmenes anual, mensual, por mes y total de una columna.
+
+    Los niveles se apilan en un único arreglo con un id de grupo por nivel y clave,
+    y se resuelven con una sola ordenación. Los cuantiles son exactos (interpolación
+    lineal de pandas) porque las tablas de frecuencias no pierden información.
+
+    Args:
+        frec_mes (pd.DataFrame): frecuencias(columna, por='mes').
+        por_dia (pd.DataFrame): diario(columna), que se guarda tal cual; opcional.
+        columna (str): Nombre de la columna resumida.
+        whis (float): Longitud de los bigotes y de los límites de Tukey.
+
+    Returns:
+        ResumenEstadistico: Resultado único para la página de EDA y las demás.
+    """
+    niveles = {nombre: (frec_mes, claves) for nombre, claves in NIVELES.items()}
+
+    ids, valores, pesos, indices, desplazamiento = [], [], [], {}, 0
+    for nombre, (frec, claves) in niveles.items():
+        if claves:
+            agrupado = frec.groupby(claves, sort=True)
+            codigos, indice = agrupado.ngroup().to_numpy(), agrupado.size().index
+        else:
+            codigos, indice = np.zeros(len(frec), dtype=np.int64), pd.Index(["Total"])
+        ids.append(codigos + desplazamiento)
+        valores.append(frec["valor"].to_numpy())
+        pesos.append(frec["n"].to_numpy())
+        indices[nombre] = (desplazamiento, indice)
+        desplazamiento += len(indice) if len(frec) else 0
+
+    # float32 -> float64 conservando los valores decimales exactos (15.2 y no 15.19999980)
+    valores = np.round(np.concatenate(valores).astype(np.float64), DECIMALES)
+    estadisticas, ids, valores, fuera = _una_pasada(
+        np.concatenate(ids), valores, np.concatenate(pesos).astype(np.int64), desplazamiento, whis
+    )
+
+    def nivel(nombre):
+        desde, indice = indices[nombre]
+        return estadisticas.iloc[desde:desde + len(indice)].set_axis(indice)
+
+    desde_mes, meses = indices["por_mes"]
+    return ResumenEstadistico(
+        columna=columna,
+        mensual=nivel("mensual"),
+        anual=nivel("anual"),
+        por_mes=nivel("por_mes"),
+        total=nivel("total").iloc[0],
+        diario=por_dia if por_dia is not None else pd.DataFrame(columns=COLUMNAS_DIARIO),
+        histograma=frec_mes.groupby(
+            np.round(frec_mes["valor"].astype(np.float64), DECIMALES).rename("valor"), sort=True
+        )["n"].sum(),
+        cajas_mes=_cajas(estadisticas, meses, ids, valores, fuera, desde_mes),
+        caja_total=_cajas(estadisticas, ["Total"], ids, valores, fuera, indices["total"][0])[0],
+    )
+
+
+def resumen(columna: str = "tmed", usar_cache: bool = True) -> ResumenEstadistico:
+    """
+    Lee la tabla de frecuencias mensual y el resumen diario de una columna y los resume.
+
+    Returns:
+        ResumenEstadistico: None si no hay datos.
+    """
+    frec_mes = frecuencias(columna, por="mes", usar_cache=usar_cache)
+    if frec_mes.empty:
+        return None
+    return resumir(frec_mes, diario(columna, usar_cache=usar_cache), columna)
+
+
+def _datos_sinteticos(años: int, estaciones: int, semilla: int = 0) -> pd.DataFrame:
+    """Una fila por estación y día con tmed de una cifra decimal."""
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range("2015-01-01", periods=365 * años, freq="D")
+    estacional = 15 - 9 * np.cos(2 * np.pi * (fechas.dayofyear.to_numpy() - 15) / 365)
+    tmed = estacional[None, :] + rng.normal(0, 4, (estaciones, len(fechas)))
+    return pd.DataFrame({
+        "fecha": np.tile(fechas.to_numpy(), estaciones),
+        "tmed": np.round(tmed.ravel(), 1),
+    })
+
+
+def _a_frecuencias(detalle: pd.DataFrame) -> tuple:
+    """Lo que hacen frecuencias() y diario() con los almacenes locales, sin pasar por extraer_datos."""
+    detalle = detalle.dropna(subset=["tmed"]).astype({"tmed": np.float32})
+    fechas = detalle["fecha"]
+    frec_mes = detalle.groupby(
+        [fechas.dt.year.rename("anio"), fechas.dt.month.rename("mes"), detalle["tmed"].rename("valor")]
+    ).size().rename("n").reset_index()
+    dia = _diario_detalle(detalle, "tmed").set_index("fecha")[COLUMNAS_DIARIO]
+    return frec_mes, dia
+
+
+def _resumen_pandas(df: pd.DataFrame) -> tuple:
+    """El cálculo anterior de la página: un describe por año, uno por año y mes, y Tukey dos veces."""
+    df = df.copy()
+    df["año"], df["mes"] = df["fecha"].dt.year, df["fecha"].dt.month
+    anual = {año: df[df["año"] == año]["tmed"].describe() for año in sorted(df["año"].unique())}
+    mensual = {año: df[df["año"] == año].groupby("mes")["tmed"].describe() for año in anual}
+    por_mes = [df[df["mes"] == m]["tmed"].dropna() for m in range(1, 13)]
+    diario = df.groupby("fecha")["tmed"].agg(["mean", "median", "min", "max"])
+    for _ in range(2):
+        datos = df["tmed"].dropna()
+        q1, q3 = datos.quantile(0.25), datos.quantile(0.75)
+        atipicos = ((datos < q1 - 1.5 * (q3 - q1)) | (datos > q3 + 1.5 * (q3 - q1))).sum()
+    return anual, mensual, por_mes, diario, atipicos
+
+
+if __name__ == "__main__":
+    # python -m src.estadisticas [estaciones]
+    # Escalado de 1 a 10 años: cálculo anterior sobre las filas diarias frente a
+    # tablas de frecuencias + resumir(). Con MySQL la tabla se agrega en el servidor
+    # y en la página solo queda la última columna.
+    estaciones = int(sys.argv[1]) if len(sys.argv) > 1 else 850
+    print(f"{'años':>4} {'filas':>10} {'pandas (s)':>11} {'frecuencias (s)':>16} {'resumir (s)':>12} {'filas tabla':>12}")
+    for años in (1, 2, 5, 10):
+        df = _datos_sinteticos(años, estaciones)
+
+        inicio = time.perf_counter()
+        anual, mensual, _, diario, atipicos = _resumen_pandas(df)
+        t_pandas = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        frec_mes, dia = _a_frecuencias(df)
+        t_frecuencias = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        resultado = resumir(frec_mes, dia)
+        t_resumir = time.perf_counter() - inicio
+
+        # Mismo resultado que el cálculo anterior
+        esperado = pd.concat(anual, axis=1).T
+        np.testing.assert_allclose(resultado.anual[ESTADISTICOS].to_numpy(), esperado.to_numpy(), rtol=1e-9)
+        np.testing.assert_allclose(
+            resultado.mensual[ESTADISTICOS].to_numpy(), pd.concat(mensual).to_numpy(), rtol=1e-9
+        )
+        np.testing.assert_allclose(
+            resultado.diario[["mean", "50%", "min", "max"]].to_numpy(), diario.to_numpy(), rtol=1e-9
+        )
+        assert resultado.total["n_atipicos"] == atipicos
+
+        print(f"{años:>4} {len(df):>10} {t_pandas:>11.2f} {t_frecuencias:>16.2f} {t_resumir:>12.3f} "
+              f"{len(frec_mes) + len(dia):>12}")
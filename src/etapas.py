@@ -0,0 +1,89 @@
+import functools
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+
+# Claves de st.session_state: último resultado de cada etapa y registro del rerun actual
+_MEMORIA = "_etapas_memoria"
+_REGISTRO = "_etapas_registro"
+
+
+def _iguales(a, b) -> bool:
+    """
+    Compara dos entradas de una etapa.
+
+    Los DataFrame, Series y arrays se comparan por identidad: son la salida de una
+    etapa anterior, que devuelve el mismo objeto mientras no se vuelve a ejecutar.
+    """
+    if a is b:
+        return True
+    if isinstance(a, (pd.DataFrame, pd.Series, np.ndarray)) or isinstance(b, (pd.DataFrame, pd.Series, np.ndarray)):
+        return False
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return type(a) is type(b) and len(a) == len(b) and all(_iguales(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_iguales(a[k], b[k]) for k in a)
+    try:
+        return type(a) is type(b) and bool(a == b)
+    except Exception:
+        return False
+
+
+def iniciar_ejecucion() -> None:
+    """Vacía el registro de etapas. Se llama al principio de cada rerun de la página."""
+    st.session_state[_REGISTRO] = []
+
+
+def etapa(nombre: str):
+    """
+    Memoriza una etapa de la página en st.session_state.
+
+    La etapa solo se vuelve a ejecutar si cambia alguna de sus entradas respecto al
+    rerun anterior de la misma sesión; si no, devuelve el objeto guardado. Encadenando
+    etapas (tablas de referencia -> agregado -> filtro -> ...) un cambio en un widget
+    solo recalcula las etapas que dependen de él.
+
+    Args:
+        nombre (str): Nombre único de la etapa en la sesión (p.ej. "datos_filtrados.agregado").
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            memoria = st.session_state.setdefault(_MEMORIA, {})
+            registro = st.session_state.setdefault(_REGISTRO, [])
+            entradas = (args, kwargs)
+
+            anterior = memoria.get(nombre)
+            if anterior is not None and _iguales(anterior[0], entradas):
+                registro.append({"etapa": nombre, "ejecutada": False, "ms": 0.0})
+                return anterior[1]
+
+            inicio = time.perf_counter()
+            resultado = funcion(*args, **kwargs)
+            ms = (time.perf_counter() - inicio) * 1000
+            memoria[nombre] = (entradas, resultado)
+            registro.append({"etapa": nombre, "ejecutada": True, "ms": ms})
+            print(f"Etapa {nombre}: {ms:.1f} ms")
+            return resultado
+        return envoltura
+    return decorador
+
+
+def registro() -> pd.DataFrame:
+    """Etapas de este rerun: si se ejecutaron o se reutilizaron y cuánto tardaron."""
+    return pd.DataFrame(st.session_state.get(_REGISTRO, []), columns=["etapa", "ejecutada", "ms"])
+
+
+def mostrar_registro() -> None:
+    """Muestra el registro de etapas del rerun en un desplegable."""
+    df = registro()
+    ejecutadas = int(df["ejecutada"].sum())
+    with st.expander(f"Etapas de esta ejecución ({ejecutadas} de {len(df)} recalculadas, {df['ms'].sum():.0f} ms)"):
+        st.dataframe(df, hide_index=True, use_container_width=True, column_config={
+            "etapa": st.column_config.TextColumn("Etapa"),
+            "ejecutada": st.column_config.CheckboxColumn("Recalculada"),
+            "ms": st.column_config.NumberColumn("Tiempo (ms)", format="%.1f"),
+        })
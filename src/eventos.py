@@ -0,0 +1,414 @@
+import os
+import sys
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from src import conectar
+from src.comparador import hueco
+
+
+# dias_minimos: días seguidos por encima (o por debajo) del umbral para que haya evento
+CONFIG_EVENTOS = conectar.leer_configuracion("eventos", {
+    "dias_minimos": 3,
+})
+
+# tipo -> (columna, percentil de la climatología usado como umbral, sentido)
+# sentido 1: el evento es superar el umbral; -1: quedar por debajo
+TIPOS = {
+    "calor": ("tmax", 95, 1),
+    "frio": ("tmin", 5, -1),
+}
+
+COLUMNAS_EVENTO = ["tipo", "indicativo", "inicio", "fin", "codigo_prov", "dias", "pico", "fecha_pico", "exceso_medio"]
+
+_eventos_locales = (None, None)  # (cubo del que salen, DataFrame de eventos)
+_cerrojo = threading.Lock()
+
+
+def rachas(supera: np.ndarray, dias_minimos: int) -> tuple:
+    """
+    Rachas de True de al menos dias_minimos en cada fila, con run-length encoding vectorizado.
+
+    Se añade una columna False a cada lado para que ninguna racha cruce de una fila a
+    la siguiente; los inicios y finales son los +1 y −1 de la diferencia por filas.
+    np.nonzero recorre en orden de filas, así que el k-ésimo inicio y el k-ésimo final
+    son de la misma racha.
+
+    Args:
+        supera (np.ndarray): Booleanos (estaciones × días).
+        dias_minimos (int): Longitud mínima de racha.
+
+    Returns:
+        tuple: (fila, inicio, fin) con fin excluido, ordenados por fila e inicio.
+    """
+    marcado = np.zeros((supera.shape[0], supera.shape[1] + 2), dtype=np.int8)
+    marcado[:, 1:-1] = supera
+    cambios = np.diff(marcado, axis=1)
+    fila, inicio = np.nonzero(cambios == 1)
+    _, fin = np.nonzero(cambios == -1)
+    largas = fin - inicio >= dias_minimos
+    return fila[largas], inicio[largas], fin[largas]
+
+
+def detectar(valores: np.ndarray, umbrales: np.ndarray, sentido: int, dias_minimos: int) -> dict:
+    """
+    Eventos de todas las estaciones a la vez.
+
+    Args:
+        valores (np.ndarray): Lecturas (estaciones × días), NaN en los huecos (un hueco corta la racha).
+        umbrales (np.ndarray): Umbral de cada estación y día, misma forma.
+        sentido (int): 1 si el evento es superar el umbral, −1 si es quedar por debajo.
+        dias_minimos (int): Días seguidos mínimos.
+
+    Returns:
+        dict: Arrays fila, inicio, fin (incluido), dias, pico, posicion_pico y exceso_medio.
+    """
+    with np.errstate(invalid="ignore"):
+        exceso = (valores - umbrales) * sentido
+        supera = exceso > 0
+    fila, inicio, fin = rachas(supera, dias_minimos)
+    dias = fin - inicio
+    if len(fila) == 0:
+        vacio = np.array([], dtype=np.int64)
+        return {"fila": vacio, "inicio": vacio, "fin": vacio, "dias": vacio, "pico": np.array([]),
+                "posicion_pico": vacio, "exceso_medio": np.array([])}
+
+    # Elementos de cada racha en el array aplanado: racha k ocupa [fila·d + inicio, fila·d + fin)
+    d = valores.shape[1]
+    racha = np.repeat(np.arange(len(fila)), dias)
+    desplazamiento = np.arange(racha.size) - np.repeat(np.cumsum(dias) - dias, dias)
+    posicion = np.repeat(fila * d + inicio, dias) + desplazamiento
+    valor = valores.ravel()[posicion] * sentido
+    limites = np.cumsum(dias) - dias
+
+    pico = np.maximum.reduceat(valor, limites)
+    # Primer día de cada racha que alcanza el pico
+    es_pico = np.flatnonzero(valor == pico[racha])
+    _, primero = np.unique(racha[es_pico], return_index=True)
+    posicion_pico = desplazamiento[es_pico[primero]] + inicio
+    exceso_medio = np.add.reduceat(exceso.ravel()[posicion].astype(np.float64), limites) / dias
+
+    return {"fila": fila, "inicio": inicio, "fin": fin - 1, "dias": dias, "pico": pico * sentido,
+            "posicion_pico": posicion_pico, "exceso_medio": exceso_medio}
+
+
+def eventos(valores: dict, estaciones: np.ndarray, codigos_prov: np.ndarray, fechas: pd.DatetimeIndex,
+            climatologia, dias_minimos: int = None) -> pd.DataFrame:
+    """
+    Eventos de todos los tipos sobre matrices estaciones × días.
+
+    Args:
+        valores (dict): columna -> matriz (estaciones × días) para las columnas de TIPOS.
+        estaciones (np.ndarray): indicativo de cada fila.
+        codigos_prov (np.ndarray): codigo_prov de cada fila.
+        fechas (pd.DatetimeIndex): Fecha de cada columna (días seguidos).
+        climatologia (Climatologia): Percentiles por estación y día del año (src/climatologia.py).
+        dias_minimos (int): Por defecto, el de CONFIG_EVENTOS.
+
+    Returns:
+        pd.DataFrame: Columnas COLUMNAS_EVENTO.
+    """
+    dias_minimos = dias_minimos or CONFIG_EVENTOS["dias_minimos"]
+    fila_clima = pd.Index(climatologia.estaciones).get_indexer(estaciones)
+    huecos = hueco(fechas)
+    partes = []
+    for tipo, (columna, percentil, sentido) in TIPOS.items():
+        # Umbral de cada lectura: el percentil de su estación en su día del año
+        umbral = climatologia.umbral(columna, percentil)
+        umbrales = np.where(fila_clima[:, None] >= 0, umbral[np.maximum(fila_clima, 0)][:, huecos], np.nan)
+        encontrados = detectar(valores[columna], umbrales, sentido, dias_minimos)
+        fila = encontrados["fila"]
+        partes.append(pd.DataFrame({
+            "tipo": tipo,
+            "indicativo": estaciones[fila],
+            "inicio": fechas[encontrados["inicio"]].date,
+            "fin": fechas[encontrados["fin"]].date,
+            "codigo_prov": codigos_prov[fila],
+            "dias": encontrados["dias"],
+            "pico": np.round(encontrados["pico"].astype(np.float64), 1),
+            "fecha_pico": fechas[encontrados["posicion_pico"]].date,
+            "exceso_medio": encontrados["exceso_medio"],
+        }, columns=COLUMNAS_EVENTO))
+    return pd.concat(partes, ignore_index=True)
+
+
+def eventos_desde_detalle(detalle: pd.DataFrame, climatologia) -> pd.DataFrame:
+    """Eventos a partir de filas (fecha, indicativo, codigo_prov, tmax, tmin)."""
+    detalle = detalle.dropna(subset=["fecha", "indicativo", "codigo_prov"])
+    if detalle.empty:
+        return pd.DataFrame(columns=COLUMNAS_EVENTO)
+    fechas = pd.to_datetime(detalle["fecha"]).to_numpy(dtype="datetime64[D]")
+    inicio = fechas.min()
+    dia = (fechas - inicio).astype(np.int64)
+    fila, estaciones = pd.factorize(detalle["indicativo"].astype(str))
+    codigos_prov = np.zeros(len(estaciones), dtype=np.int64)
+    codigos_prov[fila] = detalle["codigo_prov"].to_numpy(dtype=np.int64)
+
+    forma = (len(estaciones), int(dia.max()) + 1)
+    valores = {}
+    for columna in {columna for columna, _, _ in TIPOS.values()}:
+        matriz = np.full(forma, np.nan, dtype=np.float32)
+        matriz[fila, dia] = detalle[columna].to_numpy(dtype=np.float32, na_value=np.nan)
+        valores[columna] = matriz
+    return eventos(valores, np.asarray(estaciones), codigos_prov,
+                   pd.date_range(inicio, periods=forma[1], freq="D"), climatologia)
+
+
+def eventos_desde_cubo(cubo, climatologia) -> pd.DataFrame:
+    """Eventos sobre el cubo en memoria, para los almacenes sin tabla eventos_extremos."""
+    valores = {columna: cubo.corte(columna) for columna, _, _ in TIPOS.values()}
+    return eventos(valores, cubo.estaciones, cubo.codigos_prov[cubo.provincia], cubo.fechas, climatologia)
+
+
+_GUARDAR = text("""
+INSERT INTO eventos_extremos (tipo, indicativo, inicio, fin, codigo_prov, dias, pico, fecha_pico, exceso_medio)
+VALUES (:tipo, :indicativo, :inicio, :fin, :codigo_prov, :dias, :pico, :fecha_pico, :exceso_medio)
+ON DUPLICATE KEY UPDATE fin = VALUES(fin), codigo_prov = VALUES(codigo_prov), dias = VALUES(dias),
+    pico = VALUES(pico), fecha_pico = VALUES(fecha_pico), exceso_medio = VALUES(exceso_medio)
+""")
+
+_FECHAS_TOCADAS = text(
+    "SELECT MIN(fecha) AS desde FROM datos_meteorologicos WHERE id_descarga IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+
+# Eventos que llegan a la fecha nueva o la pasan: usan el índice (tipo, fin)
+_ABIERTOS = text("SELECT MIN(inicio) FROM eventos_extremos WHERE tipo = :tipo AND fin >= :limite")
+_BORRAR_ABIERTOS = text("DELETE FROM eventos_extremos WHERE tipo = :tipo AND fin >= :limite")
+
+
+def _guardar(conexion, df: pd.DataFrame) -> int:
+    filas = df.astype({"codigo_prov": int, "dias": int, "pico": float, "exceso_medio": float}).to_dict("records")
+    if filas:
+        conexion.execute(_GUARDAR, filas)
+    return len(filas)
+
+
+def _leer_detalle(conexion, desde=None) -> pd.DataFrame:
+    columnas = ", ".join(["fecha", "indicativo", "codigo_prov"] + sorted({c for c, _, _ in TIPOS.values()}))
+    sentencia = f"SELECT {columnas} FROM datos_meteorologicos" + (" WHERE fecha >= :desde" if desde else "")
+    return pd.read_sql(text(sentencia), conexion, params={"desde": desde} if desde else None)
+
+
+def _cargar_climatologia():
+    from src import climatologia
+
+    if not os.path.exists(climatologia.RUTA_CLIMATOLOGIA):
+        print("No hay climatología guardada; no se buscan eventos.")
+        return None
+    return climatologia.Climatologia.cargar(climatologia.RUTA_CLIMATOLOGIA, estadisticos=False)
+
+
+def actualizar_eventos(conexion, ids_descarga) -> None:
+    """
+    Extiende eventos_extremos con los días de una carga de popular.py.
+
+    Solo se rehace la cola: se borran los eventos que llegan al día anterior al primero
+    cargado (pueden alargarse) y se vuelven a detectar desde el inicio del más antiguo
+    de ellos, o desde dias_minimos días antes para recoger rachas que aún no eran evento.
+    Los umbrales son los de la climatología vigente; `python -m src.eventos reconstruir`
+    recalcula todo el histórico con ellos.
+
+    Args:
+        conexion: Conexión SQLAlchemy abierta. Se confirma la transacción al terminar.
+        ids_descarga: Identificadores id_descarga de la carga recién insertada.
+    """
+    ids = [str(i) for i in ids_descarga]
+    if not ids:
+        return
+    inicio = time.perf_counter()
+    desde = conexion.execute(_FECHAS_TOCADAS, {"ids": ids}).scalar()
+    climatologia = _cargar_climatologia()
+    if desde is None or climatologia is None:
+        return
+
+    limite = desde - timedelta(days=1)
+    ventana = desde - timedelta(days=CONFIG_EVENTOS["dias_minimos"])
+    # Una consulta por tipo para que el índice (tipo, fin) sirva la búsqueda
+    for tipo in TIPOS:
+        abierto = conexion.execute(_ABIERTOS, {"tipo": tipo, "limite": limite}).scalar()
+        if abierto is not None:
+            ventana = min(ventana, abierto)
+
+    encontrados = eventos_desde_detalle(_leer_detalle(conexion, ventana), climatologia)
+    # Los que terminan antes del límite ya están guardados (y pueden salir recortados por la ventana)
+    encontrados = encontrados[pd.to_datetime(encontrados["fin"]) >= pd.Timestamp(limite)]
+    conexion.execute(_BORRAR_ABIERTOS, [{"tipo": tipo, "limite": limite} for tipo in TIPOS])
+    escritos = _guardar(conexion, encontrados)
+    conexion.commit()
+    print(f"Eventos extremos desde {ventana}: {escritos} en {time.perf_counter() - inicio:.2f} s.")
+
+
+def reconstruir_eventos(conexion) -> None:
+    """Vacía y vuelve a detectar los eventos de todo el histórico."""
+    climatologia = _cargar_climatologia()
+    if climatologia is None:
+        return
+    encontrados = eventos_desde_detalle(_leer_detalle(conexion), climatologia)
+    conexion.execute(text("DELETE FROM eventos_extremos"))
+    escritos = _guardar(conexion, encontrados)
+    conexion.commit()
+    print(f"{escritos} eventos extremos guardados.")
+
+
+def _locales() -> pd.DataFrame:
+    """Eventos del cubo vigente, calculados una vez por versión de los datos."""
+    global _eventos_locales
+    from src import climatologia, cubo
+
+    actual = cubo.cubo_vigente()
+    normales = climatologia.climatologia_vigente()
+    if actual is None or normales is None:
+        return pd.DataFrame(columns=COLUMNAS_EVENTO)
+    with _cerrojo:
+        if _eventos_locales[0] is not actual:
+            _eventos_locales = (actual, eventos_desde_cubo(actual, normales))
+        return _eventos_locales[1]
+
+
+def consultar(tipo: str, fecha_inicio=None, fecha_fin=None, provincias=None) -> pd.DataFrame:
+    """
+    Eventos de un tipo que empiezan en un rango de fechas.
+
+    Con MySQL es una búsqueda por el índice (tipo, inicio, codigo_prov); con los almacenes
+    locales se filtran los eventos detectados sobre el cubo.
+
+    Args:
+        tipo (str): 'calor' o 'frio'.
+        fecha_inicio (date), fecha_fin (date): Rango de fechas de inicio (ambas incluidas).
+        provincias (list): codigo_prov a incluir; todas si es None.
+
+    Returns:
+        pd.DataFrame: Columnas COLUMNAS_EVENTO, vacío si no hay eventos o si ocurre un error.
+    """
+    from src import extraer_datos
+
+    if extraer_datos.ALMACEN != "mysql":
+        df = _locales()
+        fechas = pd.to_datetime(df["inicio"])
+        mascara = df["tipo"] == tipo
+        if fecha_inicio is not None:
+            mascara &= fechas >= pd.Timestamp(fecha_inicio)
+        if fecha_fin is not None:
+            mascara &= fechas <= pd.Timestamp(fecha_fin)
+        if provincias:
+            mascara &= df["codigo_prov"].isin(provincias)
+        return df[mascara].reset_index(drop=True)
+
+    condiciones, params = ["tipo = :tipo"], {"tipo": tipo}
+    if fecha_inicio is not None:
+        condiciones.append("inicio >= :fecha_inicio")
+        params["fecha_inicio"] = fecha_inicio
+    if fecha_fin is not None:
+        condiciones.append("inicio <= :fecha_fin")
+        params["fecha_fin"] = fecha_fin
+    if provincias:
+        nombres = [f"p{i}" for i in range(len(provincias))]
+        condiciones.append(f"codigo_prov IN ({', '.join(':' + nombre for nombre in nombres)})")
+        params.update({nombre: int(codigo) for nombre, codigo in zip(nombres, provincias)})
+    return extraer_datos.ejecutar_consulta_a_dataframe(
+        f"SELECT {', '.join(COLUMNAS_EVENTO)} FROM eventos_extremos WHERE {' AND '.join(condiciones)} "
+        f"ORDER BY inicio, codigo_prov", params
+    )
+
+
+def por_provincia(tipo: str, fecha_inicio=None, fecha_fin=None) -> pd.DataFrame:
+    """
+    Eventos de un tipo por provincia en un rango: número, días, racha más larga, pico y estaciones.
+
+    Returns:
+        pd.DataFrame: Una fila por provincia con eventos (codigo_prov, eventos, dias,
+        racha_max, pico, estaciones).
+    """
+    df = consultar(tipo, fecha_inicio, fecha_fin)
+    columnas = ["codigo_prov", "eventos", "dias", "racha_max", "pico", "estaciones"]
+    if df.empty:
+        return pd.DataFrame(columns=columnas)
+    pico = "max" if TIPOS[tipo][2] > 0 else "min"
+    resumen = df.astype({"pico": float}).groupby("codigo_prov").agg(
+        eventos=("dias", "size"),
+        dias=("dias", "sum"),
+        racha_max=("dias", "max"),
+        pico=("pico", pico),
+        estaciones=("indicativo", "nunique"),
+    )
+    return resumen.reset_index()[columnas]
+
+
+def _eventos_con_bucles(detalle: pd.DataFrame, climatologia) -> pd.DataFrame:
+    """Misma detección con un bucle por estación y día, como referencia del benchmark."""
+    filas = []
+    for tipo, (columna, percentil, sentido) in TIPOS.items():
+        umbral = climatologia.umbral(columna, percentil)
+        fila_clima = {e: i for i, e in enumerate(climatologia.estaciones)}
+        for indicativo, grupo in detalle.groupby("indicativo"):
+            serie = grupo.set_index(pd.to_datetime(grupo["fecha"]))[columna].sort_index()
+            serie = serie.reindex(pd.date_range(serie.index.min(), serie.index.max(), freq="D"))
+            umbrales = umbral[fila_clima[indicativo]][hueco(serie.index)]
+            racha = []
+            for fecha, valor, u in zip(serie.index, serie.to_numpy(), umbrales):
+                if not np.isnan(valor) and (valor - u) * sentido > 0:
+                    racha.append((fecha, valor))
+                    continue
+                if len(racha) >= CONFIG_EVENTOS["dias_minimos"]:
+                    filas.append((tipo, indicativo, racha[0][0].date(), len(racha)))
+                racha = []
+            if len(racha) >= CONFIG_EVENTOS["dias_minimos"]:
+                filas.append((tipo, indicativo, racha[0][0].date(), len(racha)))
+    return pd.DataFrame(filas, columns=["tipo", "indicativo", "inicio", "dias"])
+
+
+if __name__ == "__main__":
+    # python -m src.eventos reconstruir   -> carga inicial de eventos_extremos
+    # python -m src.eventos [años]        -> detección vectorizada frente a bucles con datos sintéticos
+    if len(sys.argv) > 1 and sys.argv[1] == "reconstruir":
+        with conectar.abrir_conexion() as conexion:
+            reconstruir_eventos(conexion)
+        sys.exit()
+
+    from src.climatologia import Climatologia
+    from src.cubo import _detalle_sintetico
+
+    años = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    detalle, _ = _detalle_sintetico(55, años * 365 + años // 4)
+    # Persistencia día a día para que haya rachas, como en una serie real
+    for columna in ("tmax", "tmin"):
+        ruido = detalle.pivot(index="fecha", columns="indicativo", values=columna)
+        ruido = ruido.ewm(alpha=0.3).mean().stack().rename(columna)
+        detalle = detalle.drop(columns=columna).merge(ruido.reset_index(), on=["fecha", "indicativo"], how="left")
+    climatologia = Climatologia.desde_detalle(detalle)
+    print(f"{años} años: {len(detalle)} filas, {detalle['indicativo'].nunique()} estaciones.")
+
+    inicio = time.perf_counter()
+    vectorizado = eventos_desde_detalle(detalle, climatologia)
+    segundos = time.perf_counter() - inicio
+    print(f"Vectorizado: {segundos * 1000:.0f} ms, {len(vectorizado)} eventos "
+          f"({(vectorizado['tipo'] == 'calor').sum()} de calor, {(vectorizado['tipo'] == 'frio').sum()} de frío)")
+
+    inicio = time.perf_counter()
+    referencia = _eventos_con_bucles(detalle, climatologia)
+    print(f"Con bucles por estación y día: {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    clave = ["tipo", "indicativo", "inicio", "dias"]
+    comparacion = vectorizado[clave].merge(referencia, on=clave, how="outer", indicator=True)
+    assert (comparacion["_merge"] == "both").all(), comparacion[comparacion["_merge"] != "both"]
+
+    # Extensión incremental: detectar la cola desde la ventana da lo mismo que todo el histórico
+    corte = pd.Timestamp(detalle["fecha"].max()) - pd.Timedelta(days=45)
+    fechas = pd.to_datetime(detalle["fecha"])
+    previos = eventos_desde_detalle(detalle[fechas <= corte], climatologia)
+    limite = corte  # el día anterior al primero que se añade
+    abiertos = previos[pd.to_datetime(previos["fin"]) >= limite]
+    ventana = limite + pd.Timedelta(days=1) - pd.Timedelta(days=CONFIG_EVENTOS["dias_minimos"])
+    if not abiertos.empty:
+        ventana = min(ventana, pd.Timestamp(abiertos["inicio"].min()))
+    cola = eventos_desde_detalle(detalle[fechas >= ventana], climatologia)
+    cola = cola[pd.to_datetime(cola["fin"]) >= limite]
+    extendidos = pd.concat([previos[pd.to_datetime(previos["fin"]) < limite], cola])
+    a = extendidos.sort_values(["tipo", "indicativo", "inicio"]).reset_index(drop=True)
+    b = vectorizado.sort_values(["tipo", "indicativo", "inicio"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(a, b, check_dtype=False)
+    print("Extensión incremental: mismos eventos que detectando todo el histórico.")
@@ -1,60 +1,222 @@
+import os
+import threading
+
 import pandas as pd
 from sqlalchemy import text
 
-from src import conectar
+from src import almacen, conectar
+from src.motor_embebido import MotorEmbebido
+from src.cache_consultas import CacheConsultas, clave_consulta
+from src.consultas import ConsultaMeteorologica
+
+
+# Caché de resultados compartida por todas las sesiones del proceso.
+# Se puede ajustar con una sección [cache] en secrets.toml.
+CONFIG_CACHE = {
+    "memoria_max_mb": 64,
+    "ttl": 3600,
+    "intervalo_version": 30,
+}
+cache = CacheConsultas(**conectar.leer_configuracion("cache", CONFIG_CACHE))
+
+# Con usar_resumenes, los agregados por provincia se responden desde las tablas
+# resumen_diario_provincia y resumen_mensual_provincia (ver src/resumenes.py).
+CONFIG_DATOS = conectar.leer_configuracion("datos", {
+    "usar_resumenes": True,
+    "almacen": "mysql",  # 'mysql', 'parquet' o 'embebido' (ver src/almacen.py y src/motor_embebido.py)
+    "ruta_almacen": almacen.RUTA_ALMACEN,
+    "motor_embebido": "",  # 'duckdb' o 'sqlite'; vacío: DuckDB si está instalado
+})
+
+# La variable de entorno AEMET_ALMACEN tiene prioridad sobre secrets.toml,
+# p.ej. AEMET_ALMACEN=parquet streamlit run ./Inicio.py para trabajar sin MySQL.
+ALMACEN = os.environ.get("AEMET_ALMACEN", CONFIG_DATOS["almacen"])
+
+# Motor embebido del proceso y versión del almacén con la que se creó
+_motor_embebido = (None, None)
+_cerrojo_motor = threading.Lock()
+
+
+def obtener_motor_embebido() -> MotorEmbebido:
+    """Retorna el motor embebido compartido, recreándolo si el almacén ha cambiado."""
+    global _motor_embebido
+    ruta = CONFIG_DATOS["ruta_almacen"]
+    version = almacen.version(ruta)
+    with _cerrojo_motor:
+        if _motor_embebido[0] is None or _motor_embebido[1] != version:
+            _motor_embebido = (MotorEmbebido(ruta, CONFIG_DATOS["motor_embebido"] or None), version)
+        return _motor_embebido[0]
 
 
-# Cadena de conexión para MySQL usando PyMySQL
-try:
-    motor = conectar.conexion()
-    print("Conexión a la base de datos establecida correctamente.")
-except Exception as e:
-    print(f"Error al conectar a la base de datos: {e}")
-    exit()
+def version_datos() -> tuple:
+    """
+    Retorna la última descarga cargada en datos_meteorologicos.
+
+    Cada carga de popular.py añade un id_descarga y un timestamp_extraccion nuevos,
+    así que un cambio en esta tupla indica que los resultados guardados han caducado.
+    """
+    if ALMACEN != "mysql":
+        return almacen.version(CONFIG_DATOS["ruta_almacen"])
+    with conectar.abrir_conexion() as conexion:
+        fila = conexion.execute(text(
+            "SELECT id_descarga, timestamp_extraccion FROM datos_meteorologicos "
+            "ORDER BY timestamp_extraccion DESC LIMIT 1"
+        )).first()
+    return tuple(fila) if fila else None
+
+
+def version_vigente() -> tuple:
+    """
+    Versión de los datos tal como la ve la caché de consultas.
+
+    Solo consulta la base de datos una vez cada `intervalo_version` segundos, así que
+    sirve como entrada barata para memorizar resultados en cada rerun de Streamlit.
+    """
+    try:
+        cache.comprobar_version(version_datos)
+    except Exception as e:
+        print(f"No se pudo comprobar la versión de los datos: {e}")
+    return cache.estadisticas()["version"]
+
+
+def estadisticas_cache() -> dict:
+    """Retorna aciertos, fallos y ocupación de la caché de consultas."""
+    return cache.estadisticas()
+
+
+def invalidar_cache():
+    """Descarta todos los resultados guardados."""
+    cache.invalidar()
+
+
+def _leer(sentencia, params: dict, usar_cache: bool, calcular=None) -> pd.DataFrame:
+    """
+    Ejecuta una sentencia con parámetros ligados, pasando por la caché si procede.
+
+    Args:
+        calcular: Función sin argumentos que obtiene el resultado por otra vía
+                  (p.ej. el almacén Parquet). La sentencia sigue sirviendo de clave.
+    """
+    if usar_cache:
+        try:
+            cache.comprobar_version(version_datos)
+        except Exception as e:
+            print(f"No se pudo comprobar la versión de los datos: {e}")
+        clave = clave_consulta(sentencia.text, params)
+        df_resultado = cache.obtener(clave)
+        if df_resultado is not None:
+            return df_resultado
+
+    if calcular is not None:
+        df_resultado = calcular()
+    else:
+        # La conexión se toma del pool compartido y se devuelve al terminar
+        with conectar.abrir_conexion() as conexion:
+            df_resultado = pd.read_sql(sentencia, conexion, params=params or None)
+    print(
+        f"\nConsulta ejecutada con éxito. Se recuperaron {len(df_resultado)} filas."
+    )
+    if usar_cache:
+        cache.guardar(clave, df_resultado)
+    return df_resultado
+
+
+def ejecutar_consulta(consulta: ConsultaMeteorologica, usar_cache: bool = True) -> pd.DataFrame:
+    """
+    Ejecuta una consulta agregada construida con ConsultaMeteorologica.
+
+    Args:
+        consulta (ConsultaMeteorologica): Métricas, filtros y nivel de agrupación.
+        usar_cache (bool): Si es False se consulta siempre la base de datos.
+
+    Returns:
+        pd.DataFrame: Resultado agregado, vacío si ocurre un error.
+    """
+    sentencia, params = consulta.construir()
+    try:
+        if ALMACEN == "parquet":
+            ruta = CONFIG_DATOS["ruta_almacen"]
+            return _leer(sentencia, params, usar_cache, lambda: almacen.consultar(consulta, ruta))
+        if ALMACEN == "embebido":
+            return _leer(sentencia, params, usar_cache, lambda: obtener_motor_embebido().consultar(consulta))
+        return _leer(sentencia, params, usar_cache)
+    except Exception as e:
+        print(f"Error al ejecutar la consulta:\n{sentencia}\nParámetros: {params}\nError: {e}")
+        if consulta.fuente == "resumen" and ALMACEN == "mysql":
+            # Sin resúmenes (p.ej. aún no creados) se recurre a la tabla de detalle
+            return ejecutar_consulta(consulta.desde("detalle"), usar_cache=usar_cache)
+        return pd.DataFrame()
 
 
 # Función para ejecutar una consulta y obtener un DataFrame
-def ejecutar_consulta_a_dataframe(consulta_recibida: str = "", params: dict = {}) -> pd.DataFrame:
+def ejecutar_consulta_a_dataframe(consulta_recibida: str = "", params: dict = {}, usar_cache: bool = True) -> pd.DataFrame:
     """
     Ejecuta una consulta SQL en la base de datos y devuelve los resultados en un DataFrame de pandas.
 
+    Sin consulta, construye el agregado por provincia a partir de `params`
+    (ver ConsultaMeteorologica.desde_parametros).
+
     Args:
-        consulta_recibida (str): La consulta SQL a ejecutar.
+        consulta_recibida (str): La consulta SQL a ejecutar. Puede usar parámetros ':nombre'.
+        params (dict): Valores de los parámetros o filtros del agregado por defecto.
+        usar_cache (bool): Si es False se consulta siempre la base de datos.
 
     Returns:
         pd.DataFrame: Un DataFrame de pandas con los resultados de la consulta.
                       Devuelve un DataFrame vacío si no hay resultados o si ocurre un error.
     """
+    if not consulta_recibida:
+        consulta = ConsultaMeteorologica.desde_parametros(params)
+        if CONFIG_DATOS["usar_resumenes"] and "fuente" not in params:
+            consulta = consulta.desde("resumen")
+        return ejecutar_consulta(consulta, usar_cache=usar_cache)
+    if ALMACEN == "parquet":
+        print("El almacén Parquet no admite SQL libre; usa leer_tabla o leer_detalle.")
+        return pd.DataFrame()
     try:
-        if consulta_recibida:
-            df_resultado = pd.read_sql(text(consulta_recibida), motor)
-            print(
-                f"\nConsulta ejecutada con éxito. Se recuperaron {len(df_resultado)} filas."
-            )
-            return df_resultado
-        else:
-            consulta = """
-            SELECT p.nombre,
-            d.codigo_prov,
-            AVG(d.altitud), 
-            AVG(d.tmed),
-            AVG(d.tmin),
-            AVG(d.tmax),
-            AVG(d.prec),
-            AVG(d.racha) * 3.6,
-            AVG(d.hrMedia)
-            FROM datos_meteorologicos as d, provincias as p
-            WHERE (d.codigo_prov = p.codigo_prov)
-            """
-            if params:
-                for p in params:
-                    if p == "fecha":
-                        consulta = consulta + f" AND (d.fecha = '{params[p]}')"
-                    elif p == "fecha_inicio":
-                        consulta = consulta + f" AND (d.fecha BETWEEN '{params['fecha_inicio']}' AND '{params['fecha_fin']}')"
-            consulta = consulta + " GROUP BY codigo_prov ORDER BY codigo_prov;"
-            df_resultado = ejecutar_consulta_a_dataframe(consulta)
-            return df_resultado
+        if ALMACEN == "embebido":
+            return _leer(text(consulta_recibida), params, usar_cache,
+                         lambda: obtener_motor_embebido().ejecutar(consulta_recibida, params))
+        return _leer(text(consulta_recibida), params, usar_cache)
     except Exception as e:
         print(f"Error al ejecutar la consulta:\n{consulta_recibida}\nError: {e}")
         return pd.DataFrame()  # Devuelve un DataFrame vacío en caso de error
+
+
+def leer_tabla(nombre: str) -> pd.DataFrame:
+    """
+    Lee una tabla de referencia completa ('provincias' o 'comunidades') del almacén configurado.
+
+    Returns:
+        pd.DataFrame: La tabla, vacía si ocurre un error.
+    """
+    try:
+        if ALMACEN != "mysql":
+            return almacen.leer_tabla(nombre, CONFIG_DATOS["ruta_almacen"])
+        with conectar.abrir_conexion() as conexion:
+            return pd.read_sql_table(nombre, conexion)
+    except Exception as e:
+        print(f"Error al leer la tabla {nombre}: {e}")
+        return pd.DataFrame()
+
+
+def leer_detalle(columnas: list = None, usar_cache: bool = True) -> pd.DataFrame:
+    """
+    Lee filas de datos_meteorologicos, solo con las columnas pedidas.
+
+    Args:
+        columnas (list): Columnas a leer; todas si es None.
+        usar_cache (bool): Si es False se lee siempre del almacén.
+
+    Returns:
+        pd.DataFrame: Filas de detalle, vacío si ocurre un error.
+    """
+    sentencia = text(f"SELECT {', '.join(columnas) if columnas else '*'} FROM datos_meteorologicos")
+    try:
+        if ALMACEN != "mysql":
+            ruta = CONFIG_DATOS["ruta_almacen"]
+            return _leer(sentencia, {}, usar_cache, lambda: almacen.leer_datos(columnas, ruta=ruta))
+        return _leer(sentencia, {}, usar_cache)
+    except Exception as e:
+        print(f"Error al leer datos_meteorologicos: {e}")
+        return pd.DataFrame()
@@ -0,0 +1,164 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+import warnings
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+
+RUTA_GEOJSON = os.path.join("data", "spain-provinces.geojson")
+
+# Geometrías simplificadas y centroides ya calculados, en GeoParquet
+RUTA_GEOMETRIA = os.path.join("data", "provincias_simplificadas.parquet")
+
+# Tolerancia de simplificación en grados (0.005 ≈ 500 m). Los islotes con un área
+# menor que tolerancia² se descartan; son la mayor parte de los vértices del GeoJSON
+# y no se ven en el mapa.
+TOLERANCIA = 0.005
+
+# GeoJSON simplificado que Streamlit sirve como archivo estático (enableStaticServing
+# en .streamlit/config.toml). El navegador lo descarga una vez y lo guarda en su caché.
+RUTA_GEOJSON_ESTATICO = os.path.join("static", "provincias.geojson")
+URL_GEOJSON = "app/static/provincias.geojson"
+
+# Decimales de las coordenadas publicadas (4 ≈ 10 m)
+DECIMALES_GEOJSON = 4
+
+# Proyección para calcular centroides (ETRS89 / LAEA Europa, de área equivalente)
+CRS_CENTROIDES = "EPSG:3035"
+
+_geometria = None
+_huella = None
+_cerrojo = threading.Lock()
+
+
+def construir(tolerancia: float = TOLERANCIA, origen: str = RUTA_GEOJSON, destino: str = RUTA_GEOMETRIA) -> gpd.GeoDataFrame:
+    """
+    Genera la caché de geometría de provincias a partir del GeoJSON.
+
+    Args:
+        tolerancia (float): Distancia máxima (grados) entre la forma original y la simplificada.
+        origen (str): GeoJSON de provincias.
+        destino (str): GeoParquet de salida.
+
+    Returns:
+        gpd.GeoDataFrame: Indexado por codigo_prov, con nombre, geometry y
+                          centroide_x / centroide_y (longitud y latitud).
+    """
+    inicio = time.perf_counter()
+    gdf = gpd.read_file(origen)
+    gdf["codigo_prov"] = gdf["cod_prov"].astype(int)
+
+    # Se descartan los islotes diminutos, salvo el polígono mayor de cada provincia
+    partes = gdf[["codigo_prov", "geometry"]].explode(index_parts=False)
+    with warnings.catch_warnings():
+        # Área en grados²: solo se compara con la tolerancia, también en grados
+        warnings.simplefilter("ignore", UserWarning)
+        area = partes.area
+    mayor = area.groupby(partes["codigo_prov"]).transform("max")
+    partes = partes[(area >= tolerancia ** 2) | (area == mayor)]
+
+    geometria = partes.dissolve(by="codigo_prov")
+    geometria["geometry"] = geometria.geometry.simplify(tolerancia, preserve_topology=True)
+    geometria["nombre"] = gdf.set_index("codigo_prov")["name"]
+
+    # Centroides en una proyección métrica, devueltos a longitud/latitud
+    centroides = geometria.geometry.to_crs(CRS_CENTROIDES).centroid.to_crs(gdf.crs)
+    geometria["centroide_x"] = centroides.x
+    geometria["centroide_y"] = centroides.y
+
+    geometria = geometria[["nombre", "centroide_x", "centroide_y", "geometry"]].sort_index()
+    geometria.to_parquet(destino)
+    print(
+        f"{destino}: {len(geometria)} provincias, {os.path.getsize(destino) / 1024:.0f} KB "
+        f"(GeoJSON {os.path.getsize(origen) / 1024:.0f} KB) en {time.perf_counter() - inicio:.2f} s."
+    )
+    return geometria
+
+
+def cargar() -> gpd.GeoDataFrame:
+    """
+    Retorna la geometría de provincias, leída una sola vez por proceso.
+
+    Si la caché no existe o es anterior al GeoJSON, se genera con la tolerancia por defecto.
+    """
+    global _geometria
+    if _geometria is None:
+        with _cerrojo:
+            if _geometria is None:
+                if not os.path.exists(RUTA_GEOMETRIA) or (
+                    os.path.getmtime(RUTA_GEOMETRIA) < os.path.getmtime(RUTA_GEOJSON)
+                ):
+                    _geometria = construir()
+                else:
+                    _geometria = gpd.read_parquet(RUTA_GEOMETRIA)
+    return _geometria
+
+
+def huella() -> str:
+    """
+    Huella (SHA-256) del GeoParquet en uso, leída una vez por proceso.
+
+    Cambia cada vez que construir() rehace la geometría; entra en la huella de los
+    mapas ya dibujados (ver src/cache_mapas.py) para que no se sirvan los anteriores.
+    """
+    global _huella
+    if _huella is None:
+        cargar()
+        with open(RUTA_GEOMETRIA, "rb") as f:
+            _huella = hashlib.sha256(f.read()).hexdigest()
+    return _huella
+
+
+def exportar_geojson(destino: str = RUTA_GEOJSON_ESTATICO, decimales: int = DECIMALES_GEOJSON) -> str:
+    """
+    Escribe la geometría simplificada como GeoJSON para el navegador, con el
+    codigo_prov como id de cada provincia y coordenadas redondeadas.
+
+    Returns:
+        str: Ruta del archivo escrito.
+    """
+    geometria = cargar()[["nombre", "geometry"]].copy()
+    geometria["geometry"] = shapely.transform(geometria.geometry.values, lambda c: np.round(c, decimales))
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with open(destino, "w", encoding="utf-8") as f:
+        f.write(geometria.to_json(drop_id=False, ensure_ascii=False))
+    return destino
+
+
+def url_geojson() -> str:
+    """URL relativa del GeoJSON estático, generándolo si aún no existe."""
+    if not os.path.exists(RUTA_GEOJSON_ESTATICO) or (
+        os.path.getmtime(RUTA_GEOJSON_ESTATICO) < os.path.getmtime(RUTA_GEOMETRIA)
+    ):
+        exportar_geojson()
+    return URL_GEOJSON
+
+
+def unir(datos, columnas) -> gpd.GeoDataFrame:
+    """
+    Añade a la geometría las columnas de `datos` por codigo_prov (búsqueda en el índice).
+
+    Args:
+        datos (pd.DataFrame): Filas con codigo_prov.
+        columnas (list): Columnas de datos a copiar; las provincias sin fila quedan en NaN.
+    """
+    geometria = cargar()
+    valores = datos.set_index("codigo_prov")[columnas].reindex(geometria.index)
+    return geometria.assign(**{c: valores[c].to_numpy() for c in columnas})
+
+
+def centroide(codigo_prov: int) -> tuple:
+    """(longitud, latitud) del centroide de la provincia."""
+    fila = cargar().loc[codigo_prov]
+    return fila["centroide_x"], fila["centroide_y"]
+
+
+if __name__ == "__main__":
+    # python -m src.geometria [tolerancia]
+    construir(float(sys.argv[1]) if len(sys.argv) > 1 else TOLERANCIA)
+    exportar_geojson()
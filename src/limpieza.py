@@ -0,0 +1,158 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+
+COLUMNAS_A_IMPUTAR = ["tmin", "tmax", "tmed", "prec", "velmedia", "racha", "hrMedia"]
+
+# Bloques de NaN de esta longitud o menos se rellenan con la mediana de la estación
+LONGITUD_MAX_BLOQUE_CORTO = 3
+
+
+def rellenar_por_estacion(grupo):
+    """
+    Versión original del notebook de limpieza, aplicada estación a estación con
+    groupby().apply(). Se conserva como referencia para comparar resultados.
+    """
+    inicio, fin = grupo["fecha"].min(), grupo["fecha"].max()
+    grupo = grupo[(grupo["fecha"] >= inicio) & (grupo["fecha"] <= fin)].copy()
+
+    columnas_a_imputar = COLUMNAS_A_IMPUTAR
+    for col in columnas_a_imputar:
+        serie = grupo[col]
+        mediana = serie.median()
+        es_nan = serie.isna()
+        # Bloques de NaN seguidos
+        bloques = (es_nan != es_nan.shift()).cumsum()
+        for b in bloques[es_nan].unique():
+            idx_bloque = bloques[bloques == b].index
+            if len(idx_bloque) <= LONGITUD_MAX_BLOQUE_CORTO:
+                grupo.loc[idx_bloque, col] = mediana
+        # Interpolamos linealmente donde queden NaN
+        grupo[col] = grupo[col].interpolate(method="linear", limit_direction="both")
+        # Si aún hay NaN, completo con la mediana
+        grupo[col] = grupo[col].fillna(mediana)
+
+    return grupo
+
+
+def rellenar_huecos(df: pd.DataFrame, columnas: list = COLUMNAS_A_IMPUTAR, clave: str = "indicativo") -> pd.DataFrame:
+    """
+    Rellena los huecos de todas las estaciones y columnas a la vez, sin bucles por bloque.
+
+    Da el mismo resultado que df.groupby(clave, group_keys=False).apply(rellenar_por_estacion):
+      - Bloques de hasta 3 NaN seguidos: mediana de la estación.
+      - Resto: interpolación lineal entre los valores vecinos de la misma estación
+        (los extremos toman el valor conocido más cercano).
+      - Si la estación no tiene ningún valor, se queda con la mediana (NaN).
+
+    Args:
+        df (pd.DataFrame): Datos ordenados por estación y fecha, como en el notebook.
+        columnas (list): Columnas numéricas a imputar.
+        clave (str): Columna que identifica la estación.
+
+    Returns:
+        pd.DataFrame: Copia con los huecos rellenados. Igual que en el notebook, se
+                      descartan las filas sin fecha o sin estación.
+    """
+    df = df[df["fecha"].notna() & df[clave].notna()]
+    # Orden estable por estación: reproduce el orden en que groupby().apply() concatena los grupos
+    df = df.iloc[np.argsort(df[clave].to_numpy(), kind="stable")].copy()
+    n = len(df)
+    if n == 0:
+        return df
+
+    estaciones = df[clave].to_numpy()
+    nuevo_grupo = np.empty(n, dtype=bool)
+    nuevo_grupo[0] = True
+    nuevo_grupo[1:] = estaciones[1:] != estaciones[:-1]
+    id_grupo = np.cumsum(nuevo_grupo) - 1
+    inicio_grupo = np.flatnonzero(nuevo_grupo)
+    fin_grupo = np.append(inicio_grupo[1:], n) - 1  # última posición de cada grupo
+    posiciones = np.arange(n)
+
+    valores = df[columnas].to_numpy(dtype=np.float64, copy=True)
+    medianas = df.groupby(id_grupo)[columnas].median().to_numpy()[id_grupo]
+    es_nan = np.isnan(valores)
+
+    # Longitud de cada bloque de NaN seguidos (dentro de la misma estación)
+    cambio = np.ones_like(es_nan)
+    cambio[1:] = (es_nan[1:] != es_nan[:-1]) | nuevo_grupo[1:, None]
+    id_bloque = np.cumsum(cambio.ravel(order="F")).reshape(es_nan.shape, order="F") - 1
+    longitudes = np.bincount(id_bloque.ravel())[id_bloque]
+    cortos = es_nan & (longitudes <= LONGITUD_MAX_BLOQUE_CORTO)
+    valores[cortos] = medianas[cortos]
+
+    # Vecino válido anterior y siguiente de cada posición, sin salir de su estación
+    validos = ~np.isnan(valores)
+    anterior = np.maximum.accumulate(np.where(validos, posiciones[:, None], -1), axis=0)
+    siguiente = np.minimum.accumulate(np.where(validos, posiciones[:, None], n)[::-1], axis=0)[::-1]
+    anterior[anterior < inicio_grupo[id_grupo][:, None]] = -1
+    siguiente[siguiente > fin_grupo[id_grupo][:, None]] = n
+
+    huecos = ~validos
+    con_anterior = huecos & (anterior >= 0)
+    con_siguiente = huecos & (siguiente < n)
+    columnas_idx = np.broadcast_to(np.arange(len(columnas)), valores.shape)
+
+    # Entre dos valores: misma fórmula que np.interp, que usa interpolate(method="linear")
+    entre = con_anterior & con_siguiente
+    x0, x1, c = anterior[entre], siguiente[entre], columnas_idx[entre]
+    y0, y1 = valores[x0, c], valores[x1, c]
+    pendiente = (y1 - y0) / (x1 - x0).astype(np.float64)
+    rellenos = valores.copy()
+    rellenos[entre] = pendiente * (posiciones[:, None].repeat(len(columnas), axis=1)[entre] - x0) + y0
+
+    # Extremos: se extiende el valor conocido más cercano
+    solo_anterior = con_anterior & ~con_siguiente
+    rellenos[solo_anterior] = valores[anterior[solo_anterior], columnas_idx[solo_anterior]]
+    solo_siguiente = con_siguiente & ~con_anterior
+    rellenos[solo_siguiente] = valores[siguiente[solo_siguiente], columnas_idx[solo_siguiente]]
+
+    # Estaciones sin ningún valor: la mediana (que también es NaN)
+    sin_vecinos = huecos & ~con_anterior & ~con_siguiente
+    rellenos[sin_vecinos] = medianas[sin_vecinos]
+
+    df[columnas] = rellenos
+    return df
+
+
+def _datos_sinteticos(estaciones: int, años: int, semilla: int = 0) -> pd.DataFrame:
+    """Serie diaria por estación con huecos aislados y bloques largos de NaN."""
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range("2015-01-01", periods=365 * años, freq="D")
+    dias = len(fechas)
+    df = pd.DataFrame({
+        "indicativo": np.repeat([f"E{i:04d}" for i in range(estaciones)], dias),
+        "fecha": np.tile(fechas, estaciones),
+    })
+    for col in COLUMNAS_A_IMPUTAR:
+        valores = rng.normal(15, 8, len(df)).round(1)
+        valores[rng.random(len(df)) < 0.05] = np.nan
+        # Bloques largos de 4 a 20 días
+        for inicio in rng.integers(0, len(df), len(df) // 500):
+            valores[inicio:inicio + rng.integers(4, 21)] = np.nan
+        df[col] = valores
+    return df
+
+
+if __name__ == "__main__":
+    # python -m src.limpieza  -> compara tiempos y resultados con la versión del notebook
+    for estaciones, años in [(20, 2), (100, 3), (300, 5)]:
+        df = _datos_sinteticos(estaciones, años)
+
+        inicio = time.perf_counter()
+        referencia = df.groupby("indicativo", group_keys=False).apply(rellenar_por_estacion).reset_index(drop=True)
+        t_referencia = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        vectorizado = rellenar_huecos(df).reset_index(drop=True)
+        t_vectorizado = time.perf_counter() - inicio
+
+        pd.testing.assert_frame_equal(referencia, vectorizado)
+        print(
+            f"{estaciones} estaciones x {años} años ({len(df)} filas): "
+            f"notebook {t_referencia:.2f} s, vectorizado {t_vectorizado:.3f} s "
+            f"({t_referencia / t_vectorizado:.0f}x), resultados idénticos"
+        )
@@ -0,0 +1,78 @@
+import os
+import sys
+
+from sqlalchemy import text
+
+from src import conectar
+
+
+RUTA_MIGRACIONES = os.path.join("data", "migraciones")
+
+_CREAR_REGISTRO = text("""
+CREATE TABLE IF NOT EXISTS migraciones_aplicadas (
+    version VARCHAR(100) PRIMARY KEY,
+    aplicada_en DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+""")
+
+
+def leer_sentencias(ruta: str) -> list:
+    """Separa un archivo .sql en sentencias, ignorando los comentarios '--'."""
+    with open(ruta, "r", encoding="utf-8") as f:
+        lineas = [linea.split("--", 1)[0] for linea in f]
+    return [s.strip() for s in "\n".join(lineas).split(";") if s.strip()]
+
+
+def es_opcional(ruta: str) -> bool:
+    """Las migraciones marcadas '(opcional)' en su primera línea solo se aplican a petición."""
+    with open(ruta, "r", encoding="utf-8") as f:
+        return "(opcional)" in f.readline()
+
+
+def migraciones_pendientes(conexion, incluir_opcionales: bool = False) -> list:
+    """
+    Retorna las rutas de las migraciones aún no aplicadas, en orden de versión.
+
+    Args:
+        conexion: Conexión SQLAlchemy abierta.
+        incluir_opcionales (bool): Incluir las migraciones marcadas como opcionales.
+    """
+    conexion.execute(_CREAR_REGISTRO)
+    aplicadas = {fila[0] for fila in conexion.execute(text("SELECT version FROM migraciones_aplicadas"))}
+    pendientes = []
+    for archivo in sorted(os.listdir(RUTA_MIGRACIONES)):
+        ruta = os.path.join(RUTA_MIGRACIONES, archivo)
+        version = os.path.splitext(archivo)[0]
+        if not archivo.endswith(".sql") or version in aplicadas:
+            continue
+        if es_opcional(ruta) and not incluir_opcionales:
+            continue
+        pendientes.append(ruta)
+    return pendientes
+
+
+def aplicar_migraciones(incluir_opcionales: bool = False) -> None:
+    """Aplica en orden las migraciones pendientes y las anota en migraciones_aplicadas."""
+    with conectar.abrir_conexion() as conexion:
+        pendientes = migraciones_pendientes(conexion, incluir_opcionales)
+        if not pendientes:
+            print("No hay migraciones pendientes.")
+            return
+        for ruta in pendientes:
+            version = os.path.splitext(os.path.basename(ruta))[0]
+            print(f"Aplicando migración {version}...")
+            # MySQL confirma implícitamente cada sentencia DDL: si una falla, se
+            # detiene aquí y la versión queda sin anotar para revisarla a mano.
+            for sentencia in leer_sentencias(ruta):
+                conexion.execute(text(sentencia))
+            conexion.execute(
+                text("INSERT INTO migraciones_aplicadas (version) VALUES (:version)"),
+                {"version": version},
+            )
+            conexion.commit()
+        print(f"{len(pendientes)} migraciones aplicadas.")
+
+
+if __name__ == "__main__":
+    # python -m src.migrar [--particiones]
+    aplicar_migraciones(incluir_opcionales="--particiones" in sys.argv[1:])
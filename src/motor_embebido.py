@@ -0,0 +1,281 @@
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, create_engine, text
+
+from src import almacen
+from src.consultas import ConsultaMeteorologica
+from src.resumenes import COLUMNAS_RESUMEN
+
+try:
+    import duckdb
+except ImportError:  # Sin DuckDB se usa SQLite con las tablas de resumen
+    duckdb = None
+
+
+# Base SQLite con provincias, comunidades y resúmenes, junto al almacén Parquet
+ARCHIVO_SQLITE = "resumenes.sqlite"
+
+_COLUMNAS = ", ".join(f"suma_{c} REAL, n_{c} INTEGER NOT NULL DEFAULT 0" for c in COLUMNAS_RESUMEN)
+_TABLAS_SQLITE = [
+    "CREATE TABLE provincias (codigo_prov INTEGER PRIMARY KEY, nombre TEXT NOT NULL, codigo_ca INTEGER NOT NULL)",
+    "CREATE TABLE comunidades (codigo_ca INTEGER PRIMARY KEY, nombre TEXT NOT NULL)",
+    f"CREATE TABLE resumen_diario_provincia (fecha TEXT NOT NULL, codigo_prov INTEGER NOT NULL, {_COLUMNAS}, "
+    "PRIMARY KEY (fecha, codigo_prov))",
+    f"CREATE TABLE resumen_mensual_provincia (mes TEXT NOT NULL, codigo_prov INTEGER NOT NULL, {_COLUMNAS}, "
+    "PRIMARY KEY (mes, codigo_prov))",
+]
+
+# Parámetros ':nombre' del texto SQL (no confunde '::' ni horas como '10:00')
+_PARAMETRO = re.compile(r"(?<![:\w]):(\w+)")
+
+
+def motor_disponible() -> str:
+    """'duckdb' si está instalado; si no, 'sqlite'."""
+    return "duckdb" if duckdb is not None else "sqlite"
+
+
+def _resumir(detalle: pd.DataFrame, clave: str) -> pd.DataFrame:
+    """Sumas y conteos por (clave, codigo_prov), como las tablas de resumen de MySQL."""
+    grupos = detalle.groupby([clave, "codigo_prov"])[COLUMNAS_RESUMEN]
+    sumas, conteos = grupos.sum(min_count=1), grupos.count()
+    resumen = pd.DataFrame(index=sumas.index)
+    for c in COLUMNAS_RESUMEN:
+        resumen[f"suma_{c}"] = sumas[c]
+        resumen[f"n_{c}"] = conteos[c]
+    return resumen.reset_index()
+
+
+def construir_sqlite(ruta: str = almacen.RUTA_ALMACEN) -> str:
+    """
+    Crea (o rehace) la base SQLite de resúmenes a partir del almacén Parquet.
+
+    Returns:
+        str: Ruta del archivo creado.
+    """
+    ruta_sqlite = os.path.join(ruta, ARCHIVO_SQLITE)
+    detalle = almacen.leer_datos(["fecha", "codigo_prov", *COLUMNAS_RESUMEN], ruta=ruta)
+    detalle["fecha"] = pd.to_datetime(detalle["fecha"])
+
+    diario = _resumir(detalle, "fecha")
+    detalle["mes"] = detalle["fecha"].dt.to_period("M").dt.to_timestamp()
+    mensual = _resumir(detalle, "mes")
+    diario["fecha"] = diario["fecha"].dt.strftime("%Y-%m-%d")
+    mensual["mes"] = mensual["mes"].dt.strftime("%Y-%m-%d")
+
+    if os.path.exists(ruta_sqlite):
+        os.remove(ruta_sqlite)
+    motor = create_engine(f"sqlite:///{ruta_sqlite}")
+    with motor.begin() as conexion:
+        for sentencia in _TABLAS_SQLITE:
+            conexion.execute(text(sentencia))
+        for nombre in almacen.TABLAS_REFERENCIA:
+            almacen.leer_tabla(nombre, ruta).to_sql(nombre, conexion, if_exists="append", index=False)
+        diario.to_sql("resumen_diario_provincia", conexion, if_exists="append", index=False)
+        mensual.to_sql("resumen_mensual_provincia", conexion, if_exists="append", index=False)
+    motor.dispose()
+    print(f"{ruta_sqlite}: {len(diario)} filas diarias y {len(mensual)} mensuales.")
+    return ruta_sqlite
+
+
+def _a_duckdb(consulta: str, params: dict) -> tuple:
+    """
+    Adapta el SQL de MySQL al dialecto de DuckDB: comillas dobles en lugar de
+    acentos graves, '$nombre' en lugar de ':nombre' y listas desplegadas para IN.
+    """
+    valores = {}
+
+    def sustituir(coincidencia):
+        nombre = coincidencia.group(1)
+        valor = params[nombre]
+        if isinstance(valor, (list, tuple)):
+            for i, v in enumerate(valor):
+                valores[f"{nombre}_{i}"] = v
+            return "(" + ", ".join(f"${nombre}_{i}" for i in range(len(valor))) + ")"
+        valores[nombre] = valor
+        return f"${nombre}"
+
+    consulta = _PARAMETRO.sub(sustituir, consulta.replace("`", '"'))
+    return consulta, valores
+
+
+class MotorEmbebido:
+    """
+    Motor SQL analítico dentro del proceso, sobre los archivos de data/almacen.
+
+    Con DuckDB, datos_meteorologicos se carga del dataset Parquet al crear el motor
+    y las consultas se resuelven desde el detalle. Sin DuckDB, se usa la base SQLite de
+    construir_sqlite() y las consultas se resuelven desde los resúmenes.
+    """
+
+    def __init__(self, ruta: str = almacen.RUTA_ALMACEN, motor: str = None):
+        self.ruta = ruta
+        self.motor = motor or motor_disponible()
+        self._cerrojo = threading.Lock()
+        if self.motor == "duckdb":
+            self._duckdb = duckdb.connect()
+            # Se cargan una vez en memoria (formato columnar comprimido de DuckDB): abrir
+            # los cientos de archivos de las particiones en cada consulta cuesta más que leerlos
+            patron = os.path.join(ruta, almacen.DATASET, "**", "*.parquet").replace("'", "''")
+            self._duckdb.execute(
+                "CREATE TABLE datos_meteorologicos AS "
+                f"SELECT * FROM read_parquet('{patron}', hive_partitioning = true)"
+            )
+            for nombre in almacen.TABLAS_REFERENCIA:
+                archivo = os.path.join(ruta, f"{nombre}.parquet").replace("'", "''")
+                self._duckdb.execute(f"CREATE TABLE {nombre} AS SELECT * FROM read_parquet('{archivo}')")
+        elif self.motor == "sqlite":
+            ruta_sqlite = os.path.join(ruta, ARCHIVO_SQLITE)
+            ruta_version = os.path.join(ruta, "version.txt")
+            # Se rehace si el almacén ha cambiado después de construirla
+            if not os.path.exists(ruta_sqlite) or (
+                os.path.exists(ruta_version) and os.path.getmtime(ruta_sqlite) < os.path.getmtime(ruta_version)
+            ):
+                construir_sqlite(ruta)
+            self._sqlite = create_engine(f"sqlite:///{ruta_sqlite}")
+        else:
+            raise ValueError(f"Motor embebido desconocido: {self.motor}")
+
+    def ejecutar(self, sentencia, params: dict = None) -> pd.DataFrame:
+        """
+        Ejecuta SQL con parámetros ':nombre' en el motor embebido.
+
+        Args:
+            sentencia: Texto SQL o sqlalchemy.TextClause (p.ej. de ConsultaMeteorologica).
+            params (dict): Valores ligados; las listas se despliegan para IN.
+        """
+        params = params or {}
+        consulta = getattr(sentencia, "text", sentencia)
+        if self.motor == "duckdb":
+            consulta, valores = _a_duckdb(consulta, params)
+            # Cada hilo usa su propio cursor sobre la misma base en memoria
+            with self._cerrojo:
+                cursor = self._duckdb.cursor()
+            try:
+                return cursor.execute(consulta, valores).df()
+            finally:
+                cursor.close()
+
+        # SQLite guarda las fechas como texto 'AAAA-MM-DD'
+        valores = {k: v.isoformat() if isinstance(v, date) else v for k, v in params.items()}
+        if isinstance(sentencia, str):
+            listas = [bindparam(k, expanding=True) for k, v in valores.items() if isinstance(v, (list, tuple))]
+            sentencia = text(sentencia).bindparams(*listas)
+        with self._sqlite.connect() as conexion:
+            return pd.read_sql(sentencia, conexion, params=valores or None)
+
+    def consultar(self, consulta: ConsultaMeteorologica) -> pd.DataFrame:
+        """Resuelve una ConsultaMeteorologica con el mismo resultado que en MySQL."""
+        consulta = consulta.desde("detalle" if self.motor == "duckdb" else "resumen")
+        sentencia, params = consulta.construir()
+        return self.ejecutar(sentencia, params)
+
+    def leer_tabla(self, nombre: str) -> pd.DataFrame:
+        return self.ejecutar(f"SELECT * FROM {nombre}")
+
+
+def _almacen_sintetico(ruta: str, estaciones: int, dias: int, semilla: int = 0) -> None:
+    """Almacén con el volumen de producción: una fila por estación y día."""
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range("2023-05-29", periods=dias, freq="D")
+    n = estaciones * dias
+    provincias = pd.DataFrame({
+        "codigo_prov": np.arange(1, 53),
+        "nombre": [f"Provincia {i}" for i in range(1, 53)],
+        "codigo_ca": np.arange(52) % 19 + 1,
+    })
+    comunidades = pd.DataFrame({"codigo_ca": np.arange(1, 20), "nombre": [f"Comunidad {i}" for i in range(1, 20)]})
+    os.makedirs(ruta, exist_ok=True)
+    provincias.to_parquet(os.path.join(ruta, "provincias.parquet"), index=False)
+    comunidades.to_parquet(os.path.join(ruta, "comunidades.parquet"), index=False)
+
+    df = pd.DataFrame({
+        "id_descarga": "sintetica",
+        "fecha": np.tile(fechas, estaciones),
+        "indicativo": np.repeat([f"E{i:04d}" for i in range(estaciones)], dias),
+        "nombre": "Estación",
+        "codigo_prov": np.repeat(np.arange(estaciones) % 52 + 1, dias),
+        "timestamp_extraccion": pd.Timestamp("2025-06-01"),
+    })
+    for c in almacen.COLUMNAS_NUMERICAS:
+        valores = rng.normal(15, 8, n).round(1)
+        valores[rng.random(n) < 0.03] = np.nan
+        df[c] = valores
+    almacen.escribir_trozo(df, ruta)
+
+
+def _consultar_mysql(consulta: ConsultaMeteorologica) -> pd.DataFrame:
+    """La misma consulta en MySQL, desde los resúmenes y sin caché."""
+    from src import conectar
+
+    sentencia, params = consulta.desde("resumen").construir()
+    with conectar.abrir_conexion() as conexion:
+        return pd.read_sql(sentencia, conexion, params=params)
+
+
+def _latencia(funcion, repeticiones: int) -> float:
+    """Mediana en milisegundos de varias ejecuciones (tras una de calentamiento)."""
+    funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+if __name__ == "__main__":
+    # python -m src.motor_embebido [estaciones] [dias]
+    # Latencia por consulta del agregado del dashboard en cada motor. Por defecto,
+    # el volumen de producción: las 54 estaciones de estaciones_filtradas.csv y dos años.
+    estaciones = int(sys.argv[1]) if len(sys.argv) > 1 else 54
+    dias = int(sys.argv[2]) if len(sys.argv) > 2 else 731
+    repeticiones = 20
+
+    ruta = tempfile.mkdtemp(prefix="almacen_")
+    _almacen_sintetico(ruta, estaciones, dias)
+    print(f"Almacén sintético: {estaciones} estaciones x {dias} días en {ruta}")
+
+    casos = {
+        "todo el histórico": ConsultaMeteorologica(),
+        "rango de 8 meses": ConsultaMeteorologica().entre_fechas(date(2024, 1, 15), date(2024, 9, 3)),
+        "un día": ConsultaMeteorologica().en_fecha(date(2024, 2, 29)),
+        "3 provincias": ConsultaMeteorologica().entre_fechas(date(2023, 6, 1), date(2025, 5, 28)).de_provincias([8, 12, 28]),
+        "por comunidad": ConsultaMeteorologica().agrupada_por("comunidad"),
+    }
+
+    motores = {"parquet (pyarrow)": lambda c: almacen.consultar(c, ruta)}
+    for nombre in ["duckdb", "sqlite"]:
+        if nombre == "duckdb" and duckdb is None:
+            print("DuckDB no está instalado; se omite.")
+            continue
+        motor = MotorEmbebido(ruta, nombre)
+        motores[nombre] = motor.consultar
+    try:
+        # MySQL con sus propios datos: sirve como referencia de latencia, no de resultados
+        _consultar_mysql(ConsultaMeteorologica().en_fecha(date(2024, 1, 1)))
+        motores["mysql"] = _consultar_mysql
+    except Exception as e:
+        print(f"MySQL no disponible ({e}); se omite.")
+
+    referencia = {caso: almacen.consultar(consulta, ruta) for caso, consulta in casos.items()}
+    print(f"\n{'consulta':<20}" + "".join(f"{m:>20}" for m in motores))
+    for caso, consulta in casos.items():
+        fila = f"{caso:<20}"
+        for nombre, consultar in motores.items():
+            if nombre != "mysql":
+                resultado = consultar(consulta)
+                np.testing.assert_allclose(
+                    resultado.iloc[:, 2:].to_numpy(dtype=float), referencia[caso].iloc[:, 2:].to_numpy(dtype=float)
+                )
+            fila += f"{_latencia(lambda: consultar(consulta), repeticiones):>17.1f} ms"
+        print(fila)
+
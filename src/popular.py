@@ -1,61 +1,167 @@
+import os
+import sys
+import time
+from dataclasses import dataclass
+
 import pandas as pd
 
-import conectar
+from src import carga_masiva, climatologia, conectar, cuantiles, eventos, predicciones, resumenes
 
-df = pd.read_csv(r".\data\temperaturas_limpias.csv")
 
-provincias = pd.read_sql_table("provincias", con=conectar.conexion())
+RUTA_CSV = os.path.join("data", "temperaturas_limpias.csv")
 
-valores_insertar = pd.merge(
-    df,
-    provincias["codigo_prov"],  # <--- Seleccionar solo las columnas necesarias de 'provincias'
-    left_on=df["provincia"],  # Columna de unión en df
-    right_on=provincias["nombre"],  # Columna de unión en provincias
-    how="left"
-    )
+# Filas por trozo: la memoria depende de este valor, no del tamaño del CSV
+TAMAÑO_TROZO = 50000
 
-valores_insertar = valores_insertar.drop(columns=["provincia", "id_limpieza", "key_0"]) #key_0 aparece al hacer el merge, pero la podemos eliminar
-
-orden_columnas = [
-    "id_descarga",
-    "fecha",
-    "indicativo",
-    "nombre",
-    "codigo_prov",
-    "altitud",
-    "tmed",
-    "tmin",
-    "tmax",
-    "prec",
-    "velmedia",
-    "racha",
-    "hrMedia",
-    "timestamp_extraccion",
-    ]
-
-valores_insertar = valores_insertar[orden_columnas]
-
-try:
-    print(
-        f"Iniciando inserción de {len(valores_insertar)} filas usando valores_insertar.to_sql()..."
-    )
+# Tipos explícitos: pandas no tiene que inferirlos (ni guardar copias como object) en cada trozo
+TIPOS_CSV = {
+    "id_descarga": "string",
+    "indicativo": "string",
+    "nombre": "string",
+    "provincia": "string",
+    "altitud": "float64",
+    "tmin": "float64",
+    "tmax": "float64",
+    "tmed": "float64",
+    "prec": "float64",
+    "velmedia": "float64",
+    "racha": "float64",
+    "hrMedia": "float64",
+}
+FECHAS_CSV = ["fecha", "timestamp_extraccion"]
 
-    # 'if_exists='append'' significa que añadirá las filas (no reemplaza ni falla si ya existe)
-    # 'index=False' para no escribir el índice del DataFrame como una columna
-    # 'method='multi'' es bueno para MySQL, inserta múltiples filas por sentencia INSERT.
-    # 'chunksize' puede ayudar a gestionar la memoria para DataFrames muy grandes.
-    #  Ajusta chunksize según la memoria disponible y el ancho de tus filas.
-    valores_insertar.to_sql(
-        name="datos_meteorologicos",  # Nombre de la tabla
-        con=conectar.conexion(),
-        if_exists="append",
-        index=False,
-        method="multi",  # Muy importante para el rendimiento con MySQL
-        chunksize=10000,  # Inserta en lotes de 10000 filas, ajusta según necesidad
-    )
-    print(
-        f"¡{len(valores_insertar)} filas insertadas correctamente usando valores_insertar.to_sql()!"
+# Tablas y artefactos derivados que se ponen al día tras cada carga, en este orden
+ACTUALIZACIONES = [
+    resumenes.actualizar_resumenes,
+    cuantiles.actualizar_bocetos,
+    predicciones.actualizar_modelo,
+    climatologia.actualizar_climatologia,
+    eventos.actualizar_eventos,
+]
+
+
+@dataclass
+class Etapa:
+    """Filas procesadas y tiempo propio de una etapa del proceso."""
+    nombre: str
+    filas: int = 0
+    segundos: float = 0.0
+
+    def informe(self) -> str:
+        velocidad = self.filas / self.segundos if self.segundos else float("inf")
+        return f"{self.nombre}: {self.filas} filas en {self.segundos:.1f} s ({velocidad:.0f} filas/s)"
+
+
+def leer_trozos(ruta: str, etapa: Etapa, tamaño: int = TAMAÑO_TROZO):
+    """Lee el CSV limpio por trozos con tipos fijos."""
+    lector = pd.read_csv(
+        ruta,
+        usecols=list(TIPOS_CSV) + FECHAS_CSV,
+        dtype=TIPOS_CSV,
+        parse_dates=FECHAS_CSV,
+        chunksize=tamaño,
     )
+    while True:
+        inicio = time.perf_counter()
+        trozo = next(lector, None)
+        etapa.segundos += time.perf_counter() - inicio
+        if trozo is None:
+            return
+        etapa.filas += len(trozo)
+        yield trozo
+
+
+def asignar_provincias(trozos, codigos: dict, etapa: Etapa):
+    """
+    Sustituye el nombre de la provincia por su codigo_prov con un diccionario
+    precalculado, en lugar de un merge por trozo.
+    """
+    for trozo in trozos:
+        inicio = time.perf_counter()
+        trozo["codigo_prov"] = trozo["provincia"].map(codigos).astype("Int64")
+        sin_codigo = trozo["codigo_prov"].isna().sum()
+        if sin_codigo:
+            print(f"{sin_codigo} filas con provincia desconocida se cargan sin codigo_prov.")
+        trozo = trozo[carga_masiva.COLUMNAS_DATOS]
+        etapa.segundos += time.perf_counter() - inicio
+        etapa.filas += len(trozo)
+        yield trozo
+
+
+def escribir_trozos(conexion, trozos, metodo: str, etapa: Etapa, ids_descarga: set) -> None:
+    """
+    Escribe cada trozo antes de leer el siguiente.
+
+    carga_masiva confirma cada lote, así que los id_descarga se añaden al conjunto
+    que pasa quien llama antes de escribir el trozo: si la carga falla a mitad, sigue
+    teniendo los de todas las filas que pueden haber quedado confirmadas.
+    """
+    for trozo in trozos:
+        ids_descarga.update(trozo["id_descarga"].dropna().unique())
+        inicio = time.perf_counter()
+        carga_masiva.METODOS[metodo](conexion, trozo)
+        etapa.segundos += time.perf_counter() - inicio
+        etapa.filas += len(trozo)
+
+
+def popular(ruta: str = RUTA_CSV, metodo: str = "executemany", tamaño: int = TAMAÑO_TROZO) -> None:
+    """
+    Carga el CSV limpio en datos_meteorologicos trozo a trozo y actualiza los
+    resúmenes, los bocetos de cuantiles, el modelo de predicción, la climatología
+    y los eventos extremos con los días y meses que trae.
+
+    Args:
+        ruta (str): CSV generado por el notebook de limpieza.
+        metodo (str): 'executemany' o 'load_data' (ver carga_masiva).
+        tamaño (int): Filas por trozo.
+    """
+    etapas = [Etapa("lectura"), Etapa("provincias"), Etapa("escritura")]
+    lectura, provincias, escritura = etapas
+
+    # id_descarga de los trozos ya confirmados, también si la carga falla a mitad
+    ids_descarga = set()
+
+    # Una sola conexión del pool para leer provincias, cargar y actualizar resúmenes
+    with conectar.abrir_conexion() as conexion:
+        error = None
+        try:
+            tabla_provincias = pd.read_sql_table("provincias", con=conexion)
+            codigos = dict(zip(tabla_provincias["nombre"], tabla_provincias["codigo_prov"]))
+
+            print(f"Iniciando carga de {ruta} en trozos de {tamaño} filas con {metodo}...")
+            inicio = time.perf_counter()
+
+            trozos = leer_trozos(ruta, lectura, tamaño)
+            trozos = asignar_provincias(trozos, codigos, provincias)
+            # Las filas que ya existen (misma fecha y estación) se actualizan en lugar de fallar
+            escribir_trozos(conexion, trozos, metodo, escritura, ids_descarga)
+
+            total = time.perf_counter() - inicio
+            for etapa in etapas:
+                print(etapa.informe())
+            print(f"Total: {escritura.filas} filas en {total:.1f} s ({escritura.filas / total if total else 0:.0f} filas/s).")
+
+        except Exception as e:
+            error = e
+            conexion.rollback()
+            if ids_descarga:
+                print(f"La carga se ha interrumpido tras al menos {escritura.filas} filas confirmadas; "
+                      f"se actualizan los resúmenes con ellas.")
+
+        # Solo se recalculan los días y meses que trae esta carga. Las filas ya están
+        # confirmadas: si falla una actualización, se avisa y se sigue con las demás
+        for actualizar in ACTUALIZACIONES if ids_descarga else []:
+            try:
+                actualizar(conexion, sorted(ids_descarga))
+            except Exception as e:
+                conexion.rollback()
+                print(f"Error en {actualizar.__module__}.{actualizar.__name__}: {e}")
+
+        if error is not None:
+            print(f"Error durante la carga con {metodo}: {error}")
+
 
-except Exception as e:
-    print(f"Error durante la inserción con valores_insertar.to_sql(): {e}")
+if __name__ == "__main__":
+    # Método de carga: 'executemany' (por defecto) o 'load_data'
+    # python -m src.popular [load_data]
+    popular(metodo=sys.argv[1] if len(sys.argv) > 1 else "executemany")
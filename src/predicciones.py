@@ -0,0 +1,335 @@
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+
+# Coeficientes ajustados: el artefacto que lee la página de predicciones
+RUTA_MODELO = os.path.join("data", "modelos", "prediccion_tmed.npz")
+
+# Día 0 de la tendencia y periodo del ciclo anual (días)
+ORIGEN = date(2023, 1, 1)
+PERIODO = 365.25
+
+# Pares seno/coseno: 1 = ciclo anual, 2 = anual y semestral
+ARMONICOS = 2
+
+_modelo = (None, None)  # (fecha de modificación del artefacto, ModeloArmonico)
+_cerrojo = threading.Lock()
+
+
+def _dias(fechas) -> np.ndarray:
+    """Días transcurridos desde ORIGEN."""
+    return ((pd.to_datetime(fechas) - pd.Timestamp(ORIGEN)) / pd.Timedelta(days=1)).to_numpy(dtype=np.float64)
+
+
+def diseño(fechas, armonicos: int = ARMONICOS) -> np.ndarray:
+    """
+    Matriz de diseño común a todas las provincias.
+
+    Columnas: constante, tendencia (años desde ORIGEN) y un coseno y un seno por armónico.
+
+    Returns:
+        np.ndarray: Matriz (días × (2 + 2·armonicos)).
+    """
+    t = _dias(fechas) / PERIODO
+    columnas = [np.ones_like(t), t]
+    for h in range(1, armonicos + 1):
+        columnas += [np.cos(2 * np.pi * h * t), np.sin(2 * np.pi * h * t)]
+    return np.column_stack(columnas)
+
+
+def apilar(diario: pd.DataFrame, codigos) -> tuple:
+    """
+    Pasa la serie diaria (fecha, codigo_prov, tmed) a una matriz días × provincias.
+
+    Returns:
+        tuple: (fechas, matriz con NaN donde falta el dato)
+    """
+    tabla = diario.pivot_table(index="fecha", columns="codigo_prov", values="tmed", aggfunc="mean")
+    tabla = tabla.reindex(columns=list(codigos)).sort_index()
+    return pd.DatetimeIndex(tabla.index), tabla.to_numpy(dtype=np.float64)
+
+
+@dataclass
+class ModeloArmonico:
+    """
+    Regresión armónica con tendencia, ajustada a la vez para todas las provincias.
+
+    Solo se guardan estadísticos suficientes (XᵀX, Xᵀy, yᵀy y n por provincia). Son
+    sumas sobre los días, así que añadir días nuevos es sumar su aportación y volver
+    a resolver 52 sistemas pequeños, sin releer el histórico.
+    """
+    codigos: np.ndarray  # codigo_prov de cada fila
+    armonicos: int
+    hasta: date  # último día incluido
+    xtx: np.ndarray  # (provincias × k × k)
+    xty: np.ndarray  # (provincias × k)
+    yty: np.ndarray  # (provincias,)
+    n: np.ndarray  # días con dato por provincia
+
+    @classmethod
+    def vacio(cls, codigos, armonicos: int = ARMONICOS) -> "ModeloArmonico":
+        p, k = len(codigos), 2 + 2 * armonicos
+        return cls(np.asarray(codigos), armonicos, None,
+                   np.zeros((p, k, k)), np.zeros((p, k)), np.zeros(p), np.zeros(p, dtype=np.int64))
+
+    def añadir(self, diario: pd.DataFrame) -> "ModeloArmonico":
+        """
+        Suma la aportación de nuevos días (fecha, codigo_prov, tmed).
+
+        Los días deben ser posteriores a `hasta`; para rehacer días ya incluidos
+        hay que ajustar de nuevo desde cero (ver actualizar_modelo).
+        """
+        if diario.empty:
+            return self
+        return self._sumar(*apilar(diario, self.codigos))
+
+    def _sumar(self, fechas: pd.DatetimeIndex, y: np.ndarray) -> "ModeloArmonico":
+        """Suma los estadísticos de una matriz días × provincias ya apilada."""
+        x = diseño(fechas, self.armonicos)
+        presentes = ~np.isnan(y)
+        y = np.where(presentes, y, 0.0)
+
+        # Una sola contracción para las 52 provincias: XᵀMₚX con Mₚ la máscara de días con dato
+        self.xtx += np.einsum("tk,tp,tl->pkl", x, presentes.astype(np.float64), x, optimize=True)
+        self.xty += (x.T @ y).T
+        self.yty += (y ** 2).sum(axis=0)
+        self.n += presentes.sum(axis=0)
+        ultimo = fechas.max().date()
+        self.hasta = ultimo if self.hasta is None else max(self.hasta, ultimo)
+        self.__dict__.pop("_resuelto", None)
+        return self
+
+    def _resolver(self) -> tuple:
+        """Coeficientes y desviación residual de todas las provincias con un solve por lotes."""
+        if "_resuelto" not in self.__dict__:
+            k = self.xtx.shape[1]
+            coeficientes = np.full(self.xty.shape, np.nan)
+            sigma = np.full(len(self.n), np.nan)
+            validas = self.n > k
+            if validas.any():
+                beta = np.linalg.solve(self.xtx[validas], self.xty[validas][..., None])[..., 0]
+                # Suma de cuadrados residual: yᵀy − 2βᵀXᵀy + βᵀXᵀXβ
+                rss = (self.yty[validas] - 2 * np.einsum("pk,pk->p", beta, self.xty[validas])
+                       + np.einsum("pk,pkl,pl->p", beta, self.xtx[validas], beta))
+                coeficientes[validas] = beta
+                sigma[validas] = np.sqrt(np.maximum(rss, 0) / (self.n[validas] - k))
+            self.__dict__["_resuelto"] = (coeficientes, sigma)
+        return self.__dict__["_resuelto"]
+
+    @property
+    def coeficientes(self) -> np.ndarray:
+        """(provincias × k): constante, tendencia por año y pares coseno/seno."""
+        return self._resolver()[0]
+
+    @property
+    def sigma(self) -> np.ndarray:
+        """Desviación típica de los residuos por provincia (°C)."""
+        return self._resolver()[1]
+
+    def predecir(self, fechas) -> pd.DataFrame:
+        """
+        Temperatura media prevista para cada fecha y provincia.
+
+        Returns:
+            pd.DataFrame: Índice fecha, una columna por codigo_prov.
+        """
+        fechas = pd.DatetimeIndex(fechas)
+        return pd.DataFrame(diseño(fechas, self.armonicos) @ self.coeficientes.T, index=fechas, columns=self.codigos)
+
+    def resumen(self) -> pd.DataFrame:
+        """Tendencia (°C/año), amplitud del ciclo anual y error típico por provincia."""
+        c = self.coeficientes
+        return pd.DataFrame({
+            "codigo_prov": self.codigos,
+            "media": c[:, 0],
+            "tendencia": c[:, 1],
+            "amplitud_anual": np.hypot(c[:, 2], c[:, 3]),
+            "sigma": self.sigma,
+            "dias": self.n,
+        })
+
+    def guardar(self, ruta: str = RUTA_MODELO) -> None:
+        """Escribe el artefacto .npz (se reemplaza de forma atómica)."""
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp.npz"
+        np.savez(
+            temporal, codigos=self.codigos, armonicos=self.armonicos,
+            hasta=np.datetime64(self.hasta, "D") if self.hasta else np.datetime64("NaT"),
+            xtx=self.xtx, xty=self.xty, yty=self.yty, n=self.n,
+            coeficientes=self.coeficientes, sigma=self.sigma,
+        )
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta: str = RUTA_MODELO) -> "ModeloArmonico":
+        with np.load(ruta) as datos:
+            hasta = datos["hasta"]
+            modelo = cls(datos["codigos"], int(datos["armonicos"]),
+                         None if np.isnat(hasta) else hasta.item(),
+                         datos["xtx"], datos["xty"], datos["yty"], datos["n"])
+            modelo.__dict__["_resuelto"] = (datos["coeficientes"], datos["sigma"])
+        return modelo
+
+
+_DIARIO = "SELECT fecha, codigo_prov, suma_tmed / n_tmed AS tmed FROM resumen_diario_provincia WHERE n_tmed > 0"
+
+
+def serie_diaria(desde: date = None, conexion=None) -> pd.DataFrame:
+    """
+    Media diaria de tmed por provincia.
+
+    Con MySQL se lee del resumen diario; con los almacenes locales se agrega el detalle.
+
+    Args:
+        desde (date): Primer día a leer; todo el histórico si es None.
+        conexion: Conexión abierta (la de popular.py); si es None se usa extraer_datos.
+
+    Returns:
+        pd.DataFrame: Columnas fecha, codigo_prov y tmed.
+    """
+    from src import almacen, extraer_datos
+
+    if conexion is None and extraer_datos.ALMACEN != "mysql":
+        detalle = almacen.leer_datos(["fecha", "codigo_prov", "tmed"], fecha_inicio=desde,
+                                     fecha_fin=date.max if desde else None,
+                                     ruta=extraer_datos.CONFIG_DATOS["ruta_almacen"])
+        diario = detalle.groupby(["fecha", "codigo_prov"], as_index=False)["tmed"].mean()
+    else:
+        sentencia = _DIARIO + (" AND fecha >= :desde" if desde else "")
+        params = {"desde": desde} if desde else {}
+        if conexion is None:
+            diario = extraer_datos.ejecutar_consulta_a_dataframe(sentencia, params)
+        else:
+            diario = pd.read_sql(text(sentencia), conexion, params=params or None)
+    if diario.empty:
+        return pd.DataFrame(columns=["fecha", "codigo_prov", "tmed"])
+    diario["fecha"] = pd.to_datetime(diario["fecha"])
+    diario["tmed"] = diario["tmed"].astype(np.float64)
+    return diario.dropna(subset=["tmed"])
+
+
+def ajustar(codigos, conexion=None, armonicos: int = ARMONICOS) -> ModeloArmonico:
+    """Ajusta el modelo con todo el histórico."""
+    return ModeloArmonico.vacio(codigos, armonicos).añadir(serie_diaria(conexion=conexion))
+
+
+_FECHAS_TOCADAS = text(
+    "SELECT MIN(fecha) AS desde FROM datos_meteorologicos WHERE id_descarga IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+
+
+def actualizar_modelo(conexion, ids_descarga, ruta: str = RUTA_MODELO) -> None:
+    """
+    Actualiza el artefacto tras una carga de popular.py.
+
+    Si la carga solo trae días posteriores al último incluido, se suman sus
+    estadísticos al modelo guardado; si repite días ya incluidos (la carga es un
+    upsert) se ajusta de nuevo con todo el histórico, que sigue siendo barato.
+    """
+    ids = [str(i) for i in ids_descarga]
+    if not ids:
+        return
+    inicio = time.perf_counter()
+    desde = conexion.execute(_FECHAS_TOCADAS, {"ids": ids}).scalar()
+    if desde is None:
+        return
+    codigos = pd.read_sql(text("SELECT codigo_prov FROM provincias ORDER BY codigo_prov"), conexion)["codigo_prov"]
+
+    modelo = ModeloArmonico.cargar(ruta) if os.path.exists(ruta) else None
+    if modelo is not None and modelo.hasta is not None and desde > modelo.hasta and list(modelo.codigos) == list(codigos):
+        modelo.añadir(serie_diaria(desde, conexion))
+        modo = "incremental"
+    else:
+        modelo = ajustar(codigos, conexion)
+        modo = "completo"
+    modelo.guardar(ruta)
+    print(f"Modelo de predicción actualizado ({modo}) hasta {modelo.hasta} en {time.perf_counter() - inicio:.2f} s.")
+
+
+def cargar_modelo(ruta: str = RUTA_MODELO) -> ModeloArmonico:
+    """
+    Retorna el modelo guardado, leído de nuevo solo si el artefacto ha cambiado.
+    Si no existe, se ajusta con los datos disponibles y se guarda.
+    """
+    global _modelo
+    with _cerrojo:
+        if not os.path.exists(ruta):
+            from src import extraer_datos
+
+            codigos = extraer_datos.leer_tabla("provincias")["codigo_prov"].sort_values()
+            ajustar(codigos).guardar(ruta)
+        modificado = os.path.getmtime(ruta)
+        if _modelo[0] != modificado:
+            _modelo = (modificado, ModeloArmonico.cargar(ruta))
+        return _modelo[1]
+
+
+def _series_sinteticas(provincias: int, dias: int, semilla: int = 0) -> pd.DataFrame:
+    """Serie diaria con ciclo anual, tendencia, ruido y un 3 % de huecos."""
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range(ORIGEN, periods=dias, freq="D")
+    t = _dias(fechas) / PERIODO
+    media = rng.uniform(8, 20, provincias)
+    amplitud = rng.uniform(4, 10, provincias)
+    y = (media[None, :] + 0.3 * t[:, None] - amplitud[None, :] * np.cos(2 * np.pi * (t[:, None] - 0.04))
+         + rng.normal(0, 2, (dias, provincias)))
+    y[rng.random(y.shape) < 0.03] = np.nan
+    diario = pd.DataFrame(y, index=fechas, columns=np.arange(1, provincias + 1))
+    diario = diario.rename_axis(index="fecha", columns="codigo_prov").stack().rename("tmed").reset_index()
+    return diario
+
+
+if __name__ == "__main__":
+    # python -m src.predicciones [días]
+    # Ajuste por lotes frente a 52 ajustes por separado, actualización incremental y predicción.
+    dias = int(sys.argv[1]) if len(sys.argv) > 1 else 3 * 365
+    provincias = 52
+    diario = _series_sinteticas(provincias, dias)
+    codigos = np.arange(1, provincias + 1)
+    print(f"{provincias} provincias × {dias} días ({len(diario)} valores).")
+
+    inicio = time.perf_counter()
+    fechas, y = apilar(diario, codigos)
+    t_apilar = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    modelo = ModeloArmonico.vacio(codigos)._sumar(fechas, y)
+    lotes = modelo.coeficientes
+    t_lotes = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    x = diseño(fechas)
+    separados = np.vstack([np.linalg.lstsq(x[~np.isnan(y[:, p])], y[~np.isnan(y[:, p]), p], rcond=None)[0]
+                           for p in range(provincias)])
+    t_separados = time.perf_counter() - inicio
+    np.testing.assert_allclose(lotes, separados, rtol=1e-8, atol=1e-8)
+    print(f"Apilado días × provincias: {t_apilar * 1000:.1f} ms")
+    print(f"Ajuste por lotes: {t_lotes * 1000:.1f} ms; 52 lstsq por separado: {t_separados * 1000:.1f} ms")
+
+    # Incremental: los últimos 30 días añadidos a un modelo que no los tenía
+    corte = diario["fecha"].max() - pd.Timedelta(days=30)
+    parcial = ModeloArmonico.vacio(codigos).añadir(diario[diario["fecha"] <= corte])
+    inicio = time.perf_counter()
+    parcial.añadir(diario[diario["fecha"] > corte])
+    parcial.coeficientes
+    t_incremental = time.perf_counter() - inicio
+    np.testing.assert_allclose(parcial.coeficientes, lotes, rtol=1e-8, atol=1e-8)
+    print(f"Actualización con 30 días nuevos: {t_incremental * 1000:.1f} ms (mismos coeficientes)")
+
+    ruta = os.path.join("data", "modelos", "_benchmark.npz")
+    modelo.guardar(ruta)
+    inicio = time.perf_counter()
+    cargado = ModeloArmonico.cargar(ruta)
+    prediccion = cargado.predecir(pd.date_range(modelo.hasta, periods=365, freq="D"))
+    t_prediccion = time.perf_counter() - inicio
+    print(f"Artefacto: {os.path.getsize(ruta) / 1024:.0f} KB; carga + predicción de 365 días × 52 provincias: "
+          f"{t_prediccion * 1000:.1f} ms {prediccion.shape}")
+    os.remove(ruta)
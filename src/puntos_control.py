@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+
+RUTA_PUNTOS_CONTROL = "data/puntos_control.sqlite"
+
+# Formato de fechas que espera la API de AEMET
+FORMATO_API = "%Y-%m-%dT00:00:00UTC"
+
+# La API no admite ventanas de más de 6 meses
+DIAS_MAX_VENTANA = 180
+
+
+class PuntosControl:
+    """
+    Registro persistente (SQLite) de la descarga.
+
+    Guarda cada unidad completada (estación, fechaini, fechafin) y, por estación,
+    la última fecha con datos recibida (marca de agua). Una descarga interrumpida
+    se reanuda saltando las unidades ya completadas, y una descarga periódica pide
+    solo los días posteriores a la marca de cada estación.
+    """
+
+    def __init__(self, ruta: str = RUTA_PUNTOS_CONTROL):
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._cerrojo = threading.Lock()
+        with self._cerrojo, self._conexion:
+            self._conexion.execute("""
+                CREATE TABLE IF NOT EXISTS unidades (
+                    indicativo TEXT NOT NULL,
+                    fechaini TEXT NOT NULL,
+                    fechafin TEXT NOT NULL,
+                    filas INTEGER NOT NULL,
+                    completada_en TEXT NOT NULL,
+                    PRIMARY KEY (indicativo, fechaini, fechafin)
+                )""")
+            self._conexion.execute("""
+                CREATE TABLE IF NOT EXISTS marcas (
+                    indicativo TEXT PRIMARY KEY,
+                    ultima_fecha TEXT NOT NULL
+                )""")
+
+    def completada(self, trabajo) -> bool:
+        """Indica si la unidad del trabajo ya se descargó y guardó."""
+        with self._cerrojo:
+            fila = self._conexion.execute(
+                "SELECT 1 FROM unidades WHERE indicativo = ? AND fechaini = ? AND fechafin = ?",
+                (trabajo.indicativo, trabajo.fechaini, trabajo.fechafin),
+            ).fetchone()
+        return fila is not None
+
+    def pendientes(self, trabajos: list) -> list:
+        """Filtra los trabajos cuya unidad aún no está completada."""
+        with self._cerrojo:
+            hechas = set(self._conexion.execute("SELECT indicativo, fechaini, fechafin FROM unidades"))
+        return [t for t in trabajos if (t.indicativo, t.fechaini, t.fechafin) not in hechas]
+
+    def registrar(self, resultado) -> None:
+        """
+        Marca como completada la unidad de un ResultadoTrabajo correcto y avanza la
+        marca de agua de su estación. Debe llamarse después de guardar sus filas.
+        """
+        trabajo = resultado.trabajo
+        fechas = [fila["fecha"] for fila in resultado.filas if fila.get("fecha")]
+        with self._cerrojo, self._conexion:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO unidades VALUES (?, ?, ?, ?, ?)",
+                (trabajo.indicativo, trabajo.fechaini, trabajo.fechafin,
+                 len(resultado.filas), datetime.now().isoformat()),
+            )
+            if fechas:
+                self._conexion.execute(
+                    """INSERT INTO marcas VALUES (?, ?)
+                       ON CONFLICT(indicativo) DO UPDATE
+                       SET ultima_fecha = MAX(ultima_fecha, excluded.ultima_fecha)""",
+                    (trabajo.indicativo, max(fechas)),
+                )
+
+    def marca(self, indicativo: str) -> date:
+        """Última fecha con datos de la estación, o None si no hay ninguna."""
+        with self._cerrojo:
+            fila = self._conexion.execute(
+                "SELECT ultima_fecha FROM marcas WHERE indicativo = ?", (indicativo,)
+            ).fetchone()
+        return date.fromisoformat(fila[0]) if fila else None
+
+    def cerrar(self) -> None:
+        self._conexion.close()
+
+
+def ventanas_incrementales(desde: date, hasta: date, dias_max: int = DIAS_MAX_VENTANA) -> list:
+    """
+    Divide [desde, hasta] en ventanas que la API acepta.
+
+    Returns:
+        list: Pares (fechaini, fechafin) en el formato de la API; vacía si desde > hasta.
+    """
+    ventanas = []
+    inicio = desde
+    while inicio <= hasta:
+        fin = min(hasta, inicio + timedelta(days=dias_max - 1))
+        ventanas.append((inicio.strftime(FORMATO_API), fin.strftime(FORMATO_API)))
+        inicio = fin + timedelta(days=1)
+    return ventanas
@@ -0,0 +1,94 @@
+from sqlalchemy import bindparam, text
+
+from src import conectar
+
+
+# Columnas de datos_meteorologicos que se resumen (sumas y conteos)
+COLUMNAS_RESUMEN = ["altitud", "tmed", "tmin", "tmax", "prec", "racha", "hrMedia"]
+
+_COLUMNAS = ", ".join(f"suma_{c}, n_{c}" for c in COLUMNAS_RESUMEN)
+_ACTUALIZAR = ",\n    ".join(
+    f"suma_{c} = VALUES(suma_{c}), n_{c} = VALUES(n_{c})" for c in COLUMNAS_RESUMEN
+)
+
+# Recalcula los días tocados por las descargas indicadas
+_DIARIO = text(f"""
+INSERT INTO resumen_diario_provincia (fecha, codigo_prov, {_COLUMNAS})
+SELECT d.fecha, d.codigo_prov,
+    {", ".join(f"SUM(d.{c}), COUNT(d.{c})" for c in COLUMNAS_RESUMEN)}
+FROM datos_meteorologicos AS d
+JOIN (
+    SELECT DISTINCT fecha FROM datos_meteorologicos WHERE id_descarga IN :ids
+) AS tocadas ON d.fecha = tocadas.fecha
+WHERE d.codigo_prov IS NOT NULL
+GROUP BY d.fecha, d.codigo_prov
+ON DUPLICATE KEY UPDATE
+    {_ACTUALIZAR}
+""").bindparams(bindparam("ids", expanding=True))
+
+# Recalcula, a partir del resumen diario, los meses tocados por las descargas indicadas
+_MENSUAL = text(f"""
+INSERT INTO resumen_mensual_provincia (mes, codigo_prov, {_COLUMNAS})
+SELECT tocados.mes, r.codigo_prov,
+    {", ".join(f"SUM(r.suma_{c}), SUM(r.n_{c})" for c in COLUMNAS_RESUMEN)}
+FROM resumen_diario_provincia AS r
+JOIN (
+    SELECT DISTINCT DATE_SUB(fecha, INTERVAL DAY(fecha) - 1 DAY) AS mes
+    FROM datos_meteorologicos WHERE id_descarga IN :ids
+) AS tocados ON r.fecha >= tocados.mes AND r.fecha < tocados.mes + INTERVAL 1 MONTH
+GROUP BY tocados.mes, r.codigo_prov
+ON DUPLICATE KEY UPDATE
+    {_ACTUALIZAR}
+""").bindparams(bindparam("ids", expanding=True))
+
+
+def actualizar_resumenes(conexion, ids_descarga) -> None:
+    """
+    Actualiza los resúmenes diario y mensual solo para las fechas cargadas en
+    las descargas indicadas.
+
+    Los días tocados se recalculan por completo desde datos_meteorologicos, así que
+    el resultado es correcto aunque una descarga repita fechas ya cargadas.
+
+    Args:
+        conexion: Conexión SQLAlchemy abierta. Se confirma la transacción al terminar.
+        ids_descarga: Identificadores id_descarga de la carga recién insertada.
+    """
+    ids = [str(i) for i in ids_descarga]
+    if not ids:
+        return
+    diario = conexion.execute(_DIARIO, {"ids": ids})
+    mensual = conexion.execute(_MENSUAL, {"ids": ids})
+    conexion.commit()
+    print(
+        f"Resúmenes actualizados: {diario.rowcount} filas diarias y {mensual.rowcount} mensuales afectadas."
+    )
+
+
+def reconstruir_resumenes(conexion) -> None:
+    """Vacía y vuelve a calcular los dos resúmenes con todo el histórico."""
+    conexion.execute(text("DELETE FROM resumen_mensual_provincia"))
+    conexion.execute(text("DELETE FROM resumen_diario_provincia"))
+    conexion.execute(text(f"""
+        INSERT INTO resumen_diario_provincia (fecha, codigo_prov, {_COLUMNAS})
+        SELECT fecha, codigo_prov,
+            {", ".join(f"SUM({c}), COUNT({c})" for c in COLUMNAS_RESUMEN)}
+        FROM datos_meteorologicos
+        WHERE codigo_prov IS NOT NULL
+        GROUP BY fecha, codigo_prov
+    """))
+    conexion.execute(text(f"""
+        INSERT INTO resumen_mensual_provincia (mes, codigo_prov, {_COLUMNAS})
+        SELECT DATE_SUB(fecha, INTERVAL DAY(fecha) - 1 DAY) AS mes, codigo_prov,
+            {", ".join(f"SUM(suma_{c}), SUM(n_{c})" for c in COLUMNAS_RESUMEN)}
+        FROM resumen_diario_provincia
+        GROUP BY mes, codigo_prov
+    """))
+    conexion.commit()
+    print("Resúmenes reconstruidos con todo el histórico.")
+
+
+if __name__ == "__main__":
+    # python -m src.resumenes  -> carga inicial de los resúmenes
+    with conectar.abrir_conexion() as conexion:
+        reconstruir_resumenes(conexion)